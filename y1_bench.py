@@ -0,0 +1,547 @@
+"""Reproducible capture/input benchmarks for Y1 Helper against a simulated Y1.
+
+Runs a fake adb server on localhost that serves synthetic /dev/graphics/fb0
+frames in every supported pixel format and accepts shell input commands, with
+configurable USB latency and bandwidth. The real capture pipeline
+(read_framebuffer, decode_framebuffer, crop detection and display scaling from
+y1_helper.py) is measured against it for every capture backend, as is music
+library sync into the device's in-memory file system, and results are saved
+as JSON so they can be compared across versions.
+
+Usage:
+    python y1_bench.py [--frames 30] [--latency-ms 2] [--bandwidth-mbps 20] [--sync-mb 16]
+"""
+import argparse
+import json
+import os
+import platform
+import socketserver
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import y1_helper
+
+WIDTH, HEIGHT = 480, 360
+PIXEL_FORMATS = ("RGBA8888", "BGRA8888", "RGB888", "BGR888", "RGB565")
+SCENES = ("static", "scroll", "animation")
+INPUT_METHODS = ("keyevent", "socket", "monkey")
+
+
+def render_scene(scene, index):
+    """Render frame `index` of a synthetic scene as an RGB array"""
+    frame = np.full((HEIGHT, WIDTH, 3), 24, dtype=np.uint8)
+    frame[:25] = 0  # Black status bar, exercises crop detection
+    if scene == "animation":
+        y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+        frame[..., 0] = (x + index * 7) % 256
+        frame[..., 1] = (y + index * 5) % 256
+        frame[..., 2] = (x + y + index * 11) % 256
+        return frame
+    offset = index * 6 if scene == "scroll" else 0
+    row_height = 40
+    for row in range(-1, HEIGHT // row_height + 2):
+        top = 25 + row * row_height - offset % row_height
+        item = row + offset // row_height
+        y0, y1 = max(25, top + 4), min(HEIGHT, top + row_height - 4)
+        if y0 >= y1:
+            continue
+        frame[y0:y1, 16:WIDTH - 16] = (60, 60, 70) if item % 2 else (70, 70, 84)
+        frame[y0 + 8:max(y0 + 8, y1 - 8), 32:32 + 12 * (3 + item % 9)] = (230, 230, 230)
+    return frame
+
+
+def encode_frame(rgb, pixel_format):
+    """Encode an RGB array into raw framebuffer bytes for a pixel format"""
+    if pixel_format == "RGB565":
+        r = rgb[..., 0].astype(np.uint16) >> 3
+        g = rgb[..., 1].astype(np.uint16) >> 2
+        b = rgb[..., 2].astype(np.uint16) >> 3
+        return ((r << 11) | (g << 5) | b).astype("<u2").tobytes()
+    channels = rgb[..., ::-1] if pixel_format.startswith("BGR") else rgb
+    if pixel_format.endswith("A8888"):
+        alpha = np.full(rgb.shape[:2] + (1,), 255, dtype=np.uint8)
+        channels = np.concatenate([channels, alpha], axis=2)
+    return np.ascontiguousarray(channels).tobytes()
+
+
+class FakeY1Device:
+    """Synthetic Y1 state served by FakeAdbServer"""
+
+    def __init__(self, scene="static", pixel_format="BGRA8888", latency=0.002, bandwidth=20e6,
+                 serial="Y1SIM0001", period=30):
+        self.serial = serial
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.period = period
+        self.input_log = []
+        self.broadcasts = []
+        self.monkey_port = None  # Set once `monkey --port` has been started
+        self.files = {}  # In-memory storage: device path -> (bytes, mtime)
+        self.props = {
+            "ro.product.model": "Y1",
+            "ro.build.version.release": "4.2.2",
+            "ro.build.fingerprint": "Innioasis/Y1/sim:4.2.2/JDQ39/sim:user/test-keys",
+            "ro.serialno": serial,
+        }
+        self._frame_index = 0
+        self._lock = threading.Lock()
+        self._usb_lock = threading.Lock()
+        self.set_scene(scene, pixel_format)
+
+    def set_scene(self, scene, pixel_format):
+        """Pre-render one cycle of frames so generation cost doesn't skew the results"""
+        self.scene = scene
+        self.pixel_format = pixel_format
+        count = 1 if scene == "static" else self.period
+        self._frames = [encode_frame(render_scene(scene, i), pixel_format) for i in range(count)]
+        self._frame_index = 0
+
+    def next_frame(self):
+        with self._lock:
+            frame = self._frames[self._frame_index % len(self._frames)]
+            self._frame_index += 1
+        return frame
+
+    def transfer(self, size):
+        """Hold the simulated USB link for size bytes; concurrent uploads share its bandwidth"""
+        if self.bandwidth:
+            with self._usb_lock:
+                time.sleep(size / self.bandwidth)
+
+    def run_shell(self, command):
+        """Return the output bytes of a device shell command"""
+        words = command.split()
+        if not words:
+            return b""
+        if words[0] == "input":
+            self.input_log.append((time.perf_counter(), command))
+            return b""
+        if words[0] == "monkey" and "--port" in words:
+            self.monkey_port = int(words[words.index("--port") + 1])
+            return b""
+        if words[0] == "am" and words[1:2] == ["broadcast"]:
+            self.broadcasts.append(command)
+            return b"Broadcast completed: result=0\n"
+        if words[0] == "cat" and len(words) > 1 and words[1] == y1_helper.FRAMEBUFFER_DEVICE:
+            return self.next_frame()
+        if words[0] == "getprop":
+            if len(words) > 1:
+                return (self.props.get(words[1], "") + "\n").encode()
+            return "".join(f"[{k}]: [{v}]\n" for k, v in self.props.items()).encode()
+        if words[0] == "wm" and words[1:2] == ["size"]:
+            return f"Physical size: {WIDTH}x{HEIGHT}\n".encode()
+        if words[0] == "echo":
+            return (" ".join(words[1:]) + "\n").encode()
+        return f"/system/bin/sh: {words[0]}: not found\n".encode()
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    """Server side of the adb smart-socket protocol for one client connection"""
+
+    def _recv_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed connection")
+            data += chunk
+        return data
+
+    def _okay(self, payload=None):
+        reply = b"OKAY"
+        if payload is not None:
+            data = payload.encode()
+            reply += b"%04x" % len(data) + data
+        self.request.sendall(reply)
+
+    def _fail(self, message):
+        data = message.encode()
+        self.request.sendall(b"FAIL" + b"%04x" % len(data) + data)
+
+    def _send_stream(self, data):
+        """Send device data, throttled to the simulated USB bandwidth"""
+        device = self.server.device
+        for start in range(0, len(data), 65536):
+            chunk = data[start:start + 65536]
+            if device.bandwidth:
+                time.sleep(len(chunk) / device.bandwidth)
+            self.request.sendall(chunk)
+
+    def handle(self):
+        device = self.server.device
+        try:
+            while True:
+                length = int(self._recv_exact(4), 16)
+                request = self._recv_exact(length).decode()
+                if request == "host:version":
+                    self._okay("%04x" % self.server.adb_version)
+                    return
+                if request in ("host:devices", "host:devices-l"):
+                    self._okay(f"{device.serial}\tdevice\n")
+                    return
+                if request.endswith(":features"):
+                    self._okay("")  # No shell_v2/stat_v2: clients use the legacy protocols
+                    return
+                if request.endswith(":get-state"):
+                    self._okay("device")
+                    return
+                if request.endswith(":get-serialno"):
+                    self._okay(device.serial)
+                    return
+                if request == "host:kill":
+                    self._okay()
+                    return
+                if request.startswith("host:tport:"):
+                    self.request.sendall(b"OKAY" + struct.pack("<Q", 1))
+                    continue
+                if request.startswith(("host:transport", "host-serial:")):
+                    self._okay()
+                    continue
+                time.sleep(device.latency)
+                if request.startswith(("shell:", "exec:")):
+                    self._okay()
+                    self._send_stream(device.run_shell(request.split(":", 1)[1]))
+                    return
+                if request == "sync:":
+                    self._okay()
+                    self._handle_sync()
+                    return
+                if request.startswith("tcp:"):
+                    if device.monkey_port != int(request[4:]):
+                        self._fail("closed")
+                        return
+                    self._okay()
+                    self._handle_monkey()
+                    return
+                self._fail(f"unknown service: {request}")
+                return
+        except (ConnectionError, OSError):
+            return
+
+    def _handle_sync(self):
+        device = self.server.device
+        while True:
+            command, length = struct.unpack("<4sI", self._recv_exact(8))
+            if command == b"QUIT":
+                return
+            path = self._recv_exact(length).decode()
+            time.sleep(device.latency)
+            if command == b"STAT":
+                if path == y1_helper.FRAMEBUFFER_DEVICE:
+                    self.request.sendall(struct.pack("<4sIII", b"STAT", 0o20666, 0, int(time.time())))
+                elif path in device.files:
+                    data, mtime = device.files[path]
+                    self.request.sendall(struct.pack("<4sIII", b"STAT", 0o100644, len(data), mtime))
+                else:
+                    self.request.sendall(struct.pack("<4sIII", b"STAT", 0, 0, 0))
+            elif command == b"LIST":
+                self._list(path.rstrip("/"))
+            elif command == b"SEND":
+                self._receive_file(*path.rsplit(",", 1))
+            elif command == b"RECV":
+                if path == y1_helper.FRAMEBUFFER_DEVICE:
+                    data = device.next_frame()
+                elif path in device.files:
+                    data = device.files[path][0]
+                else:
+                    message = b"No such file or directory"
+                    self.request.sendall(struct.pack("<4sI", b"FAIL", len(message)) + message)
+                    continue
+                for start in range(0, len(data), 65536):
+                    chunk = data[start:start + 65536]
+                    if device.bandwidth:
+                        time.sleep(len(chunk) / device.bandwidth)
+                    self.request.sendall(struct.pack("<4sI", b"DATA", len(chunk)) + chunk)
+                self.request.sendall(struct.pack("<4sI", b"DONE", 0))
+            else:
+                message = b"unsupported sync command"
+                self.request.sendall(struct.pack("<4sI", b"FAIL", len(message)) + message)
+                return
+
+
+    def _handle_monkey(self):
+        """Answer monkey network-protocol commands, logging injected events"""
+        device = self.server.device
+        reader = self.request.makefile("rb")
+        for line in reader:
+            command = line.decode().strip()
+            if command == "quit":
+                return
+            time.sleep(device.latency)
+            if command.startswith(("touch ", "key ", "tap ", "press ")):
+                device.input_log.append((time.perf_counter(), command))
+            self.request.sendall(b"OK\n")
+
+    def _list(self, path):
+        """Send DENT entries for the immediate children of path in the in-memory file system"""
+        device = self.server.device
+        prefix = path + "/"
+        entries = {}
+        for file_path, (data, mtime) in list(device.files.items()):
+            if not file_path.startswith(prefix):
+                continue
+            name, _, rest = file_path[len(prefix):].partition("/")
+            entries[name] = (0o40755, 0, mtime) if rest else (0o100644, len(data), mtime)
+        reply = []
+        for name, (mode, size, mtime) in sorted(entries.items()):
+            encoded = name.encode()
+            reply.append(struct.pack("<4sIIII", b"DENT", mode, size, mtime, len(encoded)) + encoded)
+        reply.append(struct.pack("<4sIIII", b"DONE", 0, 0, 0, 0))
+        self.request.sendall(b"".join(reply))
+
+    def _receive_file(self, path, mode):
+        """Store a SEND upload, throttled to the simulated USB bandwidth"""
+        device = self.server.device
+        chunks = []
+        while True:
+            command, length = struct.unpack("<4sI", self._recv_exact(8))
+            if command == b"DONE":
+                device.files[path] = (b"".join(chunks), length)
+                self.request.sendall(struct.pack("<4sI", b"OKAY", 0))
+                return
+            chunks.append(self._recv_exact(length))
+            device.transfer(length)
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """Local stand-in for the adb server with a single simulated Y1 attached"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, device, port=0, adb_version=41):
+        super().__init__(("127.0.0.1", port), FakeAdbHandler)
+        self.device = device
+        self.adb_version = adb_version
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def summarize(samples):
+    """Summarise a list of durations (seconds) as millisecond percentiles"""
+    if not samples:
+        return {}
+    ms = np.array(samples) * 1000.0
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def cpu_seconds():
+    """CPU time of this process plus finished children (adb processes)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def bench_capture(method, device, pixel_format, scene, frames, client, temp_path):
+    """Run the capture pipeline for one backend/format/scene and return its measurements"""
+    device.set_scene(scene, pixel_format)
+    stages = {"pull": [], "decode": [], "crop": [], "resize": []}
+
+    def run_frames(count):
+        for _ in range(count):
+            t0 = time.perf_counter()
+            data = y1_helper.read_framebuffer(method, temp_path, client)
+            t1 = time.perf_counter()
+            img = y1_helper.decode_framebuffer(data, WIDTH, HEIGHT, pixel_format)
+            t2 = time.perf_counter()
+            crop_top = y1_helper.detect_status_bar_crop(img)
+            if crop_top:
+                img = img.crop((0, crop_top, img.width, img.height))
+            t3 = time.perf_counter()
+            y1_helper.scale_for_display(img, 360, 270, 0.75)
+            t4 = time.perf_counter()
+            for stage, duration in (("pull", t1 - t0), ("decode", t2 - t1), ("crop", t3 - t2), ("resize", t4 - t3)):
+                stages[stage].append(duration)
+
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    run_frames(frames)
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    timings = {stage: summarize(samples) for stage, samples in stages.items()}
+    # Memory is measured on a separate short pass: tracemalloc slows Python-level loops
+    tracemalloc.start()
+    run_frames(min(frames, 2))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "backend": method,
+        "format": pixel_format,
+        "scene": scene,
+        "frames": frames,
+        "fps": frames / wall if wall else 0.0,
+        "stages": timings,
+        "cpu_percent": 100.0 * cpu / wall if wall else 0.0,
+        "peak_python_memory_mb": peak / (1024 * 1024),
+    }
+
+
+def bench_input(method, device, events, client):
+    """Measure host-side round-trip latency of input injection"""
+    samples = []
+    device.input_log.clear()
+    channel = y1_helper.MonkeyChannel(client) if method == "monkey" else None
+    if channel is not None:
+        channel.connect()
+    for _ in range(events):
+        start = time.perf_counter()
+        if channel is not None:
+            channel.send(["press 0"])
+        elif method == "socket":
+            client.shell("input keyevent 0")
+        else:
+            import subprocess
+            subprocess.run([y1_helper.get_adb_path(), "shell", "input", "keyevent", "0"],
+                           capture_output=True, timeout=10)
+        samples.append(time.perf_counter() - start)
+    if channel is not None:
+        channel.close()
+    return {"backend": method, "events": events, "delivered": len(device.input_log),
+            "latency": summarize(samples)}
+
+
+def bench_music_sync(device, client, total_mb, workers):
+    """Sync a synthetic library twice: a full push, then an unchanged re-sync"""
+    import shutil
+    import tempfile
+    library = tempfile.mkdtemp(prefix="y1_bench_music_")
+    try:
+        rng = np.random.default_rng(0)
+        # A realistic mix: a few large FLACs, many MP3s, cover art and playlists
+        sizes = [8_000_000] * 2 + [4_000_000] * 4 + [150_000] * 20 + [2_000] * 20
+        scale = total_mb * 1e6 / sum(sizes)
+        for index, size in enumerate(sizes):
+            album = os.path.join(library, f"Album {index % 6}")
+            os.makedirs(album, exist_ok=True)
+            extension = ".flac" if size >= 8_000_000 else ".mp3" if size >= 150_000 else ".jpg" if index % 2 else ".m3u"
+            with open(os.path.join(album, f"track{index:02d}{extension}"), "wb") as f:
+                f.write(rng.integers(0, 256, max(1, int(size * scale)), dtype=np.uint8).tobytes())
+        device.files.clear()
+        device.broadcasts.clear()
+        first = y1_helper.sync_music_library(library, client, workers=workers)
+        second = y1_helper.sync_music_library(library, client, workers=workers)
+        return {"workers": workers, "library_mb": total_mb, "initial": first, "resync": second,
+                "media_scans": len(device.broadcasts)}
+    finally:
+        shutil.rmtree(library, ignore_errors=True)
+
+
+def compare_with_previous(results, output_dir, current_path):
+    """Print fps changes against the most recent earlier results file"""
+    previous = sorted(
+        (os.path.join(output_dir, name) for name in os.listdir(output_dir)
+         if name.endswith(".json") and os.path.join(output_dir, name) != current_path),
+        key=os.path.getmtime)
+    if not previous:
+        return
+    with open(previous[-1]) as f:
+        old = json.load(f)
+    old_fps = {(r["backend"], r["format"], r["scene"]): r["fps"] for r in old.get("capture", [])}
+    print(f"\nCompared with {os.path.basename(previous[-1])} (version {old.get('version')}):")
+    for r in results["capture"]:
+        key = (r["backend"], r["format"], r["scene"])
+        if key in old_fps and old_fps[key]:
+            change = (r["fps"] - old_fps[key]) / old_fps[key] * 100
+            print(f"  {r['backend']:<9} {r['format']:<9} {r['scene']:<10} "
+                  f"{old_fps[key]:7.2f} -> {r['fps']:7.2f} fps ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Y1 Helper against a simulated Y1 device")
+    parser.add_argument("--frames", type=int, default=30, help="frames per backend/format/scene")
+    parser.add_argument("--input-events", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="simulated USB round-trip latency")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0, help="simulated USB bandwidth (MB/s, 0=unlimited)")
+    parser.add_argument("--backends", nargs="+", default=list(y1_helper.CAPTURE_METHODS))
+    parser.add_argument("--formats", nargs="+", default=list(PIXEL_FORMATS))
+    parser.add_argument("--scenes", nargs="+", default=list(SCENES))
+    parser.add_argument("--adb-version", type=int, default=41, help="protocol version reported to adb clients")
+    parser.add_argument("--sync-mb", type=float, default=16.0, help="size of the synthetic music library (0=skip)")
+    parser.add_argument("--sync-workers", type=int, nargs="+", default=[1, 3], help="parallel sync sessions to compare")
+    parser.add_argument("--output-dir", default="bench_results")
+    args = parser.parse_args(argv)
+
+    device = FakeY1Device(latency=args.latency_ms / 1000.0, bandwidth=args.bandwidth_mbps * 1e6)
+    server = FakeAdbServer(device, adb_version=args.adb_version).start()
+    # The adb executable and AdbClient both honour this, so every backend talks to the fake
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(server.port)
+    client = y1_helper.AdbClient(port=server.port)
+    import tempfile
+    temp_path = os.path.join(tempfile.gettempdir(), "y1_bench_fb0.tmp")
+    have_adb = os.path.exists(y1_helper.get_adb_path())
+
+    results = {
+        "version": y1_helper.APP_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": vars(args),
+        "capture": [],
+        "input": [],
+        "music_sync": [],
+        "skipped": [],
+    }
+    for method in args.backends:
+        if method != "socket" and not have_adb:
+            results["skipped"].append({"backend": method, "reason": "adb executable not found"})
+            print(f"Skipping {method}: adb executable not found at {y1_helper.get_adb_path()}")
+            continue
+        for pixel_format in args.formats:
+            for scene in args.scenes:
+                try:
+                    r = bench_capture(method, device, pixel_format, scene, args.frames, client, temp_path)
+                except Exception as e:
+                    results["skipped"].append({"backend": method, "format": pixel_format,
+                                               "scene": scene, "reason": str(e)})
+                    print(f"{method:<9} {pixel_format:<9} {scene:<10} failed: {e}")
+                    continue
+                results["capture"].append(r)
+                stages = "  ".join(f"{s} {v['p50_ms']:6.1f}" for s, v in r["stages"].items())
+                print(f"{method:<9} {pixel_format:<9} {scene:<10} {r['fps']:7.2f} fps  "
+                      f"cpu {r['cpu_percent']:5.1f}%  mem {r['peak_python_memory_mb']:6.1f}MB  p50 ms: {stages}")
+    for method in INPUT_METHODS:
+        if method == "keyevent" and not have_adb:
+            results["skipped"].append({"input": method, "reason": "adb executable not found"})
+            continue
+        r = bench_input(method, device, args.input_events, client)
+        results["input"].append(r)
+        print(f"input {method:<9} p50 {r['latency']['p50_ms']:.1f} ms  p99 {r['latency']['p99_ms']:.1f} ms")
+    if args.sync_mb > 0:
+        for workers in args.sync_workers:
+            r = bench_music_sync(device, client, args.sync_mb, workers)
+            results["music_sync"].append(r)
+            print(f"music sync x{workers}  {r['initial']['pushed']} files {r['initial']['mb_per_s']:.1f} MB/s  "
+                  f"re-sync {r['resync']['seconds'] * 1000:.0f} ms ({r['resync']['pushed']} pushed)  "
+                  f"media scans {r['media_scans']}")
+    server.shutdown()
+    try:
+        import resource
+        results["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        pass
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    out_path = os.path.join(args.output_dir,
+                            f"bench_{y1_helper.APP_VERSION}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {out_path}")
+    compare_with_previous(results, args.output_dir, out_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,26 +5,3778 @@ import threading
 import time
 import os
 import struct
-from PIL import Image, ImageTk
 import json
-import numpy as np
+import zlib
+import mmap
+import queue
+import hashlib
+import collections
+import itertools
+import re
+
+# numpy and PIL are imported lazily inside the functions that need them, so
+# the window can appear before the heavy modules have loaded
+_PROCESS_START = time.perf_counter()
+
+APP_VERSION = "1.0"
+
+FRAMEBUFFER_DEVICE = "/dev/graphics/fb0"
+# Capture backends: adb pull to a temp file (original), adb exec-out to stdout,
+# or a direct socket to the adb server using the sync protocol (no process spawn)
+CAPTURE_METHODS = ("pull", "exec-out", "socket")
+# Largest DATA payload the sync protocol accepts
+SYNC_CHUNK_SIZE = 64 * 1024
+
+
+def get_adb_path():
+    """Return the platform-appropriate adb executable from platform-tools"""
+    import platform
+    if platform.system() == "Windows":
+        return os.path.join("platform-tools", "adb.exe")
+    return os.path.join("platform-tools", "adb")
+
+
+class AdbError(Exception):
+    """Raised when the adb server or device rejects a request"""
+
+
+class AdbClient:
+    """Minimal client for the adb server's smart-socket protocol.
+
+    Talks to the same server the adb executable uses (ANDROID_ADB_SERVER_PORT,
+    default 5037), so device services can be used without spawning a process
+    per command.
+    """
+
+    def __init__(self, serial=None, host="127.0.0.1", port=None, timeout=10):
+        self.serial = serial
+        self.host = host
+        self.port = port or int(os.environ.get("ANDROID_ADB_SERVER_PORT", 5037))
+        self.timeout = timeout
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(min(size, 65536))
+            if not chunk:
+                raise AdbError("Connection closed by adb server")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    @classmethod
+    def _read_status(cls, sock):
+        status = cls._recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            length = int(cls._recv_exact(sock, 4), 16)
+            raise AdbError(cls._recv_exact(sock, length).decode(errors="replace"))
+        raise AdbError(f"Unexpected adb server response: {status!r}")
+
+    @classmethod
+    def _request(cls, sock, request):
+        data = request.encode()
+        sock.sendall(b"%04x" % len(data) + data)
+        cls._read_status(sock)
+
+    def _connect(self):
+        import socket
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def host_command(self, request):
+        """Run a host: request (e.g. host:devices) and return its length-prefixed reply"""
+        with self._connect() as sock:
+            self._request(sock, request)
+            length = int(self._recv_exact(sock, 4), 16)
+            return self._recv_exact(sock, length).decode(errors="replace")
+
+    def devices(self):
+        """Return [(serial, state), ...] for attached devices; state is "device" when online"""
+        return [tuple(line.split()[:2]) for line in self.host_command("host:devices").splitlines()
+                if len(line.split()) >= 2]
+
+    def open_service(self, service):
+        """Open a device service (shell:, exec:, sync:, ...) and return the connected socket"""
+        sock = self._connect()
+        try:
+            self._request(sock, f"host:transport:{self.serial}" if self.serial else "host:transport-any")
+            self._request(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _read_all(self, sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def shell(self, command):
+        """Run a shell command on the device and return its text output"""
+        with self.open_service(f"shell:{command}") as sock:
+            return self._read_all(sock).replace(b"\r\n", b"\n").decode(errors="replace")
+
+    def exec_out(self, command):
+        """Run a command with a raw (binary-safe) stdout stream; needs adbd from Android 5.0+"""
+        with self.open_service(f"exec:{command}") as sock:
+            return self._read_all(sock)
+
+    def sync(self):
+        """Open a file sync session"""
+        return AdbSync(self.open_service("sync:"))
+
+    def pull_bytes(self, path):
+        """Read a whole device file into memory over the sync protocol"""
+        with self.sync() as sync:
+            return sync.recv(path)
+
+
+class AdbSync:
+    """File sync session (the protocol behind adb push/pull) on one socket"""
+    _HEADER = struct.Struct("<4sI")
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _send(self, command, payload=b""):
+        self.sock.sendall(self._HEADER.pack(command, len(payload)) + payload)
+
+    def _read_header(self):
+        return self._HEADER.unpack(AdbClient._recv_exact(self.sock, self._HEADER.size))
+
+    def _fail(self, length):
+        raise AdbError(AdbClient._recv_exact(self.sock, length).decode(errors="replace"))
+
+    def stat(self, path):
+        """Return (mode, size, mtime) for a device path; mode is 0 if it does not exist"""
+        self._send(b"STAT", path.encode())
+        command, mode = self._read_header()
+        if command != b"STAT":
+            raise AdbError(f"Unexpected sync response: {command!r}")
+        size, mtime = struct.unpack("<II", AdbClient._recv_exact(self.sock, 8))
+        return mode, size, mtime
+
+    def recv(self, path, sink=None):
+        """Stream a device file into sink.write(), or return its bytes when sink is None"""
+        chunks = [] if sink is None else None
+        for data in self.recv_chunks(path):
+            if sink is None:
+                chunks.append(data)
+            else:
+                sink.write(data)
+        return b"".join(chunks) if sink is None else None
+
+    def recv_chunks(self, path):
+        """Yield a device file's DATA chunks as they arrive; iterate to the end to keep the session usable"""
+        self._send(b"RECV", path.encode())
+        while True:
+            command, length = self._read_header()
+            if command == b"DATA":
+                yield AdbClient._recv_exact(self.sock, length)
+            elif command == b"DONE":
+                return
+            elif command == b"FAIL":
+                self._fail(length)
+            else:
+                raise AdbError(f"Unexpected sync response: {command!r}")
+
+    def list(self, path):
+        """Return [(name, mode, size, mtime), ...] for the entries of a device directory"""
+        return list(self.list_iter(path))
+
+    def list_iter(self, path):
+        """Yield (name, mode, size, mtime) entries as adbd reads the directory; iterate to the end"""
+        self._send(b"LIST", path.encode())
+        while True:
+            command, mode, size, mtime, name_length = struct.unpack(
+                "<4sIIII", AdbClient._recv_exact(self.sock, 20))
+            if command == b"DONE":
+                return
+            if command != b"DENT":
+                raise AdbError(f"Unexpected sync response: {command!r}")
+            name = AdbClient._recv_exact(self.sock, name_length).decode(errors="replace")
+            if name not in (".", ".."):
+                yield name, mode, size, mtime
+
+    def send(self, path, source, mtime=None, mode=0o100644, chunk_size=SYNC_CHUNK_SIZE):
+        """Stream source.read() chunks to a device file; adbd creates missing parent directories.
+
+        mtime (defaults to now) is stored on the device file so later diffs can compare it.
+        """
+        cancel_event = current_cancel_event()
+        self._send(b"SEND", f"{path},{mode}".encode())
+        while True:
+            data = source.read(chunk_size)
+            if not data:
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                raise CommandCancelled()
+            self._send(b"DATA", data)
+        self.sock.sendall(self._HEADER.pack(b"DONE", int(mtime if mtime is not None else time.time())))
+        command, length = self._read_header()
+        if command == b"FAIL":
+            self._fail(length)
+        if command != b"OKAY":
+            raise AdbError(f"Unexpected sync response: {command!r}")
+
+    def close(self):
+        try:
+            self._send(b"QUIT")
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def read_framebuffer(method="pull", temp_path=None, client=None, timeout=10):
+    """Fetch raw framebuffer bytes from the device with the given capture method"""
+    if method == "socket":
+        return (client or AdbClient(timeout=timeout)).pull_bytes(FRAMEBUFFER_DEVICE)
+    adb_path = get_adb_path()
+    if method == "exec-out":
+        result = subprocess.run([adb_path, "exec-out", "cat", FRAMEBUFFER_DEVICE],
+                                capture_output=True, timeout=timeout)
+        if result.returncode != 0:
+            raise AdbError(result.stderr.decode(errors="replace").strip() or "exec-out failed")
+        return result.stdout
+    if temp_path is None:
+        import tempfile
+        temp_path = os.path.join(tempfile.gettempdir(), "y1_fb0.tmp")
+    result = subprocess.run([adb_path, "pull", FRAMEBUFFER_DEVICE, temp_path],
+                            capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0 or not os.path.exists(temp_path):
+        raise AdbError(result.stderr.strip() or "pull failed")
+    with open(temp_path, 'rb') as f:
+        return f.read()
+
+
+def detect_status_bar_crop(img, bar_height=25):
+    """Return how many rows to crop when the top status-bar area is black"""
+    import numpy as np
+    if img.height <= 50:
+        return 0
+    top = np.asarray(img.crop((0, 0, img.width, bar_height)))
+    return bar_height if top[:, :, :3].mean() < 16 else 0
+
+
+def scale_for_display(img, display_width, display_height, scale):
+    """Resize a (cropped) frame for the preview and pad it to the canvas, centred vertically"""
+    from PIL import Image
+    scaled_height = int(img.height * scale)
+    if scale == 1:
+        resized_img = img
+    elif float(scale).is_integer():
+        # Integer zoom: nearest neighbour is cheap and keeps device pixels sharp
+        resized_img = img.resize((display_width, scaled_height), Image.Resampling.NEAREST)
+    else:
+        resized_img = img.resize((display_width, scaled_height), Image.Resampling.LANCZOS)
+    if scaled_height == display_height:
+        return resized_img
+    padded = Image.new('RGB', (display_width, display_height), (0, 0, 0))
+    padded.paste(resized_img, (0, (display_height - scaled_height) // 2))
+    return padded
+
+
+# Preview zoom levels: fit to the window, or a whole multiple of the device resolution
+ZOOM_LEVELS = collections.OrderedDict([("Fit", None), ("1:1", 1), ("2x", 2), ("3x", 3)])
+
+
+class ScaledFrameCache:
+    """Preview renders of recent frames, keyed by frame hash and display geometry.
+
+    The capture loop pulls a static screen many times a second; while its
+    hash is unchanged, the status-bar crop and the resize are served from
+    here instead of being redone per frame. Values are (crop_top, image).
+    """
+
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, frame_hash, geometry):
+        with self._lock:
+            entry = self._entries.get((frame_hash, geometry))
+            if entry is not None:
+                self._entries.move_to_end((frame_hash, geometry))
+            return entry
+
+    def put(self, frame_hash, geometry, crop_top, image):
+        with self._lock:
+            self._entries[(frame_hash, geometry)] = (crop_top, image)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+ANIMATION_MAX_FRAMES = 600  # About a minute of capture; more belongs in a PNG sequence
+
+
+class FrameRecorder:
+    """Disk-backed ring of timestamped frames kept in a memory-mapped file.
+
+    Frames are RGB888, stored either as zlib-compressed keyframes or as
+    zlib-compressed XOR deltas against the previous frame. When the ring is
+    full the oldest records are evicted, so the file (and memory use) never
+    grows past ``capacity`` bytes no matter how long the session runs.
+    """
+    MAGIC = b"Y1REC001"
+    HEADER = struct.Struct("<8sQQQQQ")  # magic, capacity, head, tail, count, next_seq
+    RECORD = struct.Struct("<IIQdHHBxxxI")  # marker, length, seq, timestamp, width, height, flags, payload_len
+    RECORD_MARKER = 0x59315246  # 'Y1RF'
+    WRAP_MARKER = 0x59315257  # 'Y1RW', rest of the ring is unused
+    FLAG_KEYFRAME = 1
+    FLAG_DELTA = 2
+    KEYFRAME_INTERVAL = 50
+
+    def __init__(self, path, capacity=256 * 1024 * 1024):
+        self.path = path
+        self.capacity = capacity
+        self.dropped_frames = 0
+        self._queue = queue.Queue(maxsize=8)
+        self._thread = None
+        self._prev = None
+        self._since_keyframe = 0
+        size = self.HEADER.size + capacity
+        with open(path, "wb") as f:
+            f.truncate(size)
+        self._file = open(path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        self.head = self.tail = self.count = 0
+        self.next_seq = 0
+        self._write_header()
+
+    def start(self):
+        """Start the background writer thread"""
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+
+    def append(self, img_rgb, timestamp=None, raw=None):
+        """Queue a frame for recording; never blocks the capture loop"""
+        item = (timestamp if timestamp is not None else time.time(), img_rgb.size,
+                raw if raw is not None else img_rgb.tobytes())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def stop(self):
+        """Flush queued frames, stop the writer and close the ring file"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._write_header()
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write_frame(*item)
+            except Exception as e:
+                print(f"Recording error: {e}")
+
+    def _write_frame(self, timestamp, size, raw):
+        import numpy as np
+        width, height = size
+        cur = np.frombuffer(raw, dtype=np.uint8)
+        if (self._prev is None or self._prev.shape != cur.shape
+                or self._since_keyframe >= self.KEYFRAME_INTERVAL):
+            flags = self.FLAG_KEYFRAME
+            payload = zlib.compress(raw, 1)
+            self._since_keyframe = 0
+        else:
+            flags = self.FLAG_DELTA
+            payload = zlib.compress(np.bitwise_xor(cur, self._prev).tobytes(), 1)
+            self._since_keyframe += 1
+        self._prev = cur
+        length = (self.RECORD.size + len(payload) + 7) & ~7
+        if length > self.capacity // 2:
+            self.dropped_frames += 1
+            self._prev = None
+            return
+        if self.head + length > self.capacity:
+            self._evict(self.head, self.capacity)
+            if self.capacity - self.head >= 4:
+                struct.pack_into("<I", self._mm, self.HEADER.size + self.head, self.WRAP_MARKER)
+            self.head = 0
+        self._evict(self.head, self.head + length)
+        offset = self.HEADER.size + self.head
+        self.RECORD.pack_into(self._mm, offset, self.RECORD_MARKER, length, self.next_seq,
+                              timestamp, width, height, flags, len(payload))
+        self._mm[offset + self.RECORD.size:offset + self.RECORD.size + len(payload)] = payload
+        self.head += length
+        if self.count == 0:
+            self.tail = self.head - length
+        self.count += 1
+        self.next_seq += 1
+        self._write_header()
+
+    def _evict(self, start, end):
+        """Drop the oldest records until [start, end) of the ring is free"""
+        while self.count > 0 and start <= self.tail < end:
+            length = self.RECORD.unpack_from(self._mm, self.HEADER.size + self.tail)[1]
+            self.tail = self._next_offset(self.tail + length)
+            self.count -= 1
+            if self.count == 0:
+                self.tail = self.head
+
+    def _next_offset(self, offset):
+        if self.capacity - offset < self.RECORD.size:
+            return 0
+        marker = struct.unpack_from("<I", self._mm, self.HEADER.size + offset)[0]
+        return 0 if marker == self.WRAP_MARKER else offset
+
+    def _write_header(self):
+        self.HEADER.pack_into(self._mm, 0, self.MAGIC, self.capacity, self.head,
+                              self.tail, self.count, self.next_seq)
+
+    @classmethod
+    def _iter_records(cls, mm):
+        """Yield (base, timestamp, width, height, flags, payload_len) for each record, oldest first"""
+        magic, capacity, head, tail, count, next_seq = cls.HEADER.unpack_from(mm, 0)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a Y1 Helper recording")
+        offset = tail
+        for _ in range(count):
+            if capacity - offset < cls.RECORD.size:
+                offset = 0
+            elif struct.unpack_from("<I", mm, cls.HEADER.size + offset)[0] == cls.WRAP_MARKER:
+                offset = 0
+            base = cls.HEADER.size + offset
+            marker, length, seq, timestamp, width, height, flags, payload_len = cls.RECORD.unpack_from(mm, base)
+            if marker != cls.RECORD_MARKER:
+                break
+            offset += length
+            yield base, timestamp, width, height, flags, payload_len
+
+    @classmethod
+    def frame_timestamps(cls, path):
+        """Return the timestamps of the frames iter_frames() yields, reading only record headers"""
+        timestamps = []
+        prev_size = None
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for base, timestamp, width, height, flags, payload_len in cls._iter_records(mm):
+                if flags & cls.FLAG_DELTA and prev_size != width * height * 3:
+                    continue  # Keyframe for this delta was evicted
+                prev_size = width * height * 3
+                timestamps.append(timestamp)
+        return timestamps
+
+    @classmethod
+    def iter_frames(cls, path, skip=0):
+        """Yield (timestamp, PIL.Image) for every decodable frame in a ring file, oldest first.
+
+        The first ``skip`` frames are decoded (later deltas depend on them) but not yielded.
+        """
+        import numpy as np
+        from PIL import Image
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            prev = None
+            for base, timestamp, width, height, flags, payload_len in cls._iter_records(mm):
+                data = np.frombuffer(zlib.decompress(mm[base + cls.RECORD.size:base + cls.RECORD.size + payload_len]),
+                                     dtype=np.uint8)
+                if flags & cls.FLAG_DELTA:
+                    if prev is None or prev.shape != data.shape:
+                        continue  # Keyframe for this delta was evicted
+                    data = np.bitwise_xor(data, prev)
+                prev = data
+                if skip:
+                    skip -= 1
+                    continue
+                yield timestamp, Image.frombytes("RGB", (width, height), data.tobytes())
+
+    @classmethod
+    def export(cls, path, out_path, progress=None, max_frames=ANIMATION_MAX_FRAMES):
+        """Export a ring file as an animated GIF/APNG or a numbered PNG sequence.
+
+        Pillow keeps every frame of an animation in memory while saving, so
+        animations hold at most the newest ``max_frames`` frames; PNG sequences
+        are written one frame at a time and have no limit.
+        """
+        from PIL import Image
+        ext = os.path.splitext(out_path)[1].lower()
+        if ext in (".gif", ".png", ".apng"):
+            timestamps = cls.frame_timestamps(path)
+            skip = max(0, len(timestamps) - max_frames)
+            timestamps = timestamps[skip:]
+            if not timestamps:
+                return 0
+            durations = [max(20, int((later - earlier) * 1000)) for earlier, later in zip(timestamps, timestamps[1:])]
+            durations.append(durations[-1] if durations else 100)
+            exported = [0]
+
+            class _Frames:
+                # Decodes frames as Pillow asks for them; re-iterable because the APNG
+                # writer walks append_images twice (once to pick the mode and size)
+                def __iter__(self):
+                    exported[0] = 1
+                    for timestamp, img in cls.iter_frames(path, skip + 1):
+                        exported[0] += 1
+                        if progress:
+                            progress(exported[0])
+                        yield img.convert("P", palette=Image.Palette.ADAPTIVE) if ext == ".gif" else img
+
+            from contextlib import closing
+            with closing(cls.iter_frames(path, skip)) as frames:
+                first = next(frames)[1]  # Closing the generator releases its mmap and file now
+            if ext == ".gif":
+                first = first.convert("P", palette=Image.Palette.ADAPTIVE)
+            save_format = "GIF" if ext == ".gif" else "PNG"
+            first.save(out_path, format=save_format, save_all=True, append_images=_Frames(),
+                       duration=durations, loop=0)
+            return exported[0]
+        os.makedirs(out_path, exist_ok=True)
+        written = 0
+        with open(os.path.join(out_path, "index.csv"), "w") as index:
+            index.write("frame,timestamp\n")
+            for timestamp, img in cls.iter_frames(path):
+                name = f"frame_{written:06d}.png"
+                img.save(os.path.join(out_path, name))
+                index.write(f"{name},{timestamp:.3f}\n")
+                written += 1
+                if progress:
+                    progress(written)
+        return written
+
+
+
+class ReplayBuffer:
+    """Always-on RAM ring holding the last few seconds of frames (instant replay).
+
+    Identical frames are stored once and reference-counted. Unique frames are
+    kept as zlib-compressed palette indices when they use at most 256 colours,
+    which is typical of the flat Y1 UI, and as zlib-compressed RGB otherwise.
+    Memory is bounded by both the time window and ``max_bytes``.
+    """
+    ENTRY_OVERHEAD = 128  # Approximate bookkeeping bytes per stored frame
+
+    def __init__(self, seconds=10, max_bytes=64 * 1024 * 1024):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self.dropped_frames = 0
+        self._frames = collections.deque()  # (timestamp, frame_hash), oldest first
+        self._store = {}  # frame_hash -> [mode, size, palette, blob, refcount]
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=8)
+        threading.Thread(target=self._encoder_loop, daemon=True).start()
+
+    def append(self, img_rgb, frame_hash, timestamp, raw):
+        """Queue a decoded frame; encoding happens off the capture thread"""
+        try:
+            self._queue.put_nowait((timestamp, frame_hash, img_rgb, raw))
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._store.clear()
+            self.bytes_used = 0
+
+    def stats(self):
+        """Return (frames, unique frames, bytes used)"""
+        with self._lock:
+            return len(self._frames), len(self._store), self.bytes_used
+
+    def _encoder_loop(self):
+        while True:
+            timestamp, frame_hash, img_rgb, raw = self._queue.get()
+            try:
+                self._add(timestamp, frame_hash, img_rgb, raw)
+            except Exception as e:
+                print(f"Instant replay error: {e}")
+
+    def _add(self, timestamp, frame_hash, img_rgb, raw):
+        with self._lock:
+            entry = self._store.get(frame_hash)
+            if entry is not None:
+                entry[4] += 1
+                self._frames.append((timestamp, frame_hash))
+                self._evict(timestamp)
+                return
+        from PIL import Image
+        colors = img_rgb.getcolors(256)
+        if colors:
+            palette = bytes(c for _, rgb in colors for c in rgb)
+            palette_img = Image.new('P', (1, 1))
+            palette_img.putpalette(palette)
+            indexed = img_rgb.quantize(palette=palette_img, dither=Image.Dither.NONE)
+            entry = ['P', img_rgb.size, palette, zlib.compress(indexed.tobytes(), 1), 1]
+        else:
+            entry = ['RGB', img_rgb.size, b'', zlib.compress(raw, 1), 1]
+        with self._lock:
+            existing = self._store.get(frame_hash)
+            if existing is not None:
+                existing[4] += 1
+            else:
+                self._store[frame_hash] = entry
+                self.bytes_used += len(entry[2]) + len(entry[3]) + self.ENTRY_OVERHEAD
+            self._frames.append((timestamp, frame_hash))
+            self._evict(timestamp)
+
+    def _evict(self, now):
+        """Drop frames older than the window or beyond the memory budget (lock held)"""
+        while self._frames and (now - self._frames[0][0] > self.seconds or self.bytes_used > self.max_bytes):
+            _, frame_hash = self._frames.popleft()
+            entry = self._store[frame_hash]
+            entry[4] -= 1
+            if entry[4] == 0:
+                del self._store[frame_hash]
+                self.bytes_used -= len(entry[2]) + len(entry[3]) + self.ENTRY_OVERHEAD
+
+    def dump(self, out_dir):
+        """Write the buffered frames to out_dir as unique PNGs plus an index.json sequence"""
+        from PIL import Image
+        with self._lock:
+            frames = list(self._frames)
+            store = {h: self._store[h] for _, h in frames}
+        os.makedirs(out_dir, exist_ok=True)
+        names = {}
+        for frame_hash, (mode, size, palette, blob, _) in store.items():
+            img = Image.frombytes(mode, size, zlib.decompress(blob))
+            if mode == 'P':
+                img.putpalette(palette)
+                img = img.convert('RGB')
+            names[frame_hash] = f"{frame_hash.hex()}.png"
+            img.save(os.path.join(out_dir, names[frame_hash]))
+        start = frames[0][0] if frames else 0
+        index = {
+            "frames": [{"file": names[h], "timestamp": ts, "offset_ms": int((ts - start) * 1000)}
+                       for ts, h in frames],
+            "unique_frames": len(store),
+        }
+        with open(os.path.join(out_dir, "index.json"), "w") as f:
+            json.dump(index, f, indent=2)
+        return len(frames)
+
+
+# Shared-memory frame export
+SHARED_FRAMES_NAME = "y1_helper_frames"
+
+
+class SharedFrameExport:
+    """Publishes decoded frames into a named shared-memory region for local readers.
+
+    Layout: a 64-byte header followed by the pixel data (RGB888, row-major)::
+
+        8s  magic "Y1SHM001"
+        Q   seq        even = frame stable, odd = frame being written
+        I   width      I height      I stride (bytes per row)
+        I   format     1 = RGB888
+        d   timestamp  (time.time() of the capture)
+        Q   frame      number of frames published so far
+        I   capacity   bytes available for pixel data
+        I   closed     1 once the writer has gone away (readers should reopen)
+
+    Writers bump seq to odd, copy the pixels and bump it to even again (a
+    seqlock), so any number of readers can map the region without locks:
+    read seq, use the pixels, and retry if seq was odd or has changed.
+    """
+    MAGIC = b"Y1SHM001"
+    HEADER = struct.Struct("<8sQIIIIdQII")
+    HEADER_SIZE = 64
+    FORMAT_RGB888 = 1
+    LIVE_CHECK_SECONDS = 1.0  # How long an existing region is watched for a live writer before reclaiming it
+
+    def __init__(self, name=SHARED_FRAMES_NAME, width=480, height=360):
+        self.name = name
+        self.shm = None
+        self.frames = 0
+        self.lock = threading.Lock()  # Publishing (capture thread) vs. close (Tk thread)
+        self._allocate(width * height * 3)
+
+    def _allocate(self, capacity):
+        from multiprocessing import shared_memory
+        self._close()
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.HEADER_SIZE + capacity)
+        except FileExistsError:
+            self._reclaim_stale()
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.HEADER_SIZE + capacity)
+        self.capacity = capacity
+        self.seq = 0
+        self._write_header(0, 0, 0, 0.0)
+
+    def _reclaim_stale(self):
+        """Unlink a region left behind by a run that did not exit cleanly; raise if its writer is alive"""
+        from multiprocessing import shared_memory
+
+        def snapshot():
+            try:
+                magic, seq, _, _, _, _, _, frame, _, closed = self.HEADER.unpack_from(existing.buf, 0)
+            except struct.error:
+                return None
+            return None if magic != self.MAGIC or closed else (seq, frame)
+
+        existing = shared_memory.SharedMemory(name=self.name)
+        try:
+            before = snapshot()
+            if before is not None:
+                time.sleep(self.LIVE_CHECK_SECONDS)
+                if snapshot() != before:
+                    if os.name == "posix":
+                        # Attaching registered it with our resource tracker, which would unlink it when we exit
+                        from multiprocessing import resource_tracker
+                        resource_tracker.unregister(existing._name, "shared_memory")
+                    raise FileExistsError(f"Shared memory '{self.name}' is in use by another running Y1 Helper")
+        except BaseException:
+            existing.close()
+            raise
+        existing.close()
+        existing.unlink()
+
+    def _write_header(self, width, height, stride, timestamp, closed=0):
+        self.HEADER.pack_into(self.shm.buf, 0, self.MAGIC, self.seq, width, height, stride,
+                              self.FORMAT_RGB888, timestamp, self.frames, self.capacity, closed)
+
+    def publish(self, raw, width, height, timestamp):
+        """Copy one RGB888 frame into the region (single writer)"""
+        with self.lock:
+            if self.shm is not None:
+                self._publish(raw, width, height, timestamp)
+
+    def _publish(self, raw, width, height, timestamp):
+        if len(raw) > self.capacity:
+            self._allocate(len(raw))
+        buf = self.shm.buf
+        self.seq += 1  # Odd: readers must not trust the pixels
+        struct.pack_into("<Q", buf, 8, self.seq)
+        buf[self.HEADER_SIZE:self.HEADER_SIZE + len(raw)] = raw
+        self.frames += 1
+        self.seq += 1
+        self._write_header(width, height, width * 3, timestamp)
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        if self.shm is None:
+            return
+        try:
+            struct.pack_into("<I", self.shm.buf, self.HEADER.size - 4, 1)
+        except (TypeError, ValueError):
+            pass
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = None
+
+
+class SharedFrameReader:
+    """Reader side of SharedFrameExport (for external tools and tests)"""
+
+    def __init__(self, name=SHARED_FRAMES_NAME):
+        from multiprocessing import shared_memory
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=name)
+            if os.name == "posix":
+                # Otherwise the resource tracker unlinks the writer's region when this reader exits
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+
+    def header(self):
+        magic, seq, width, height, stride, fmt, timestamp, frame, capacity, closed = \
+            SharedFrameExport.HEADER.unpack_from(self.shm.buf, 0)
+        if magic != SharedFrameExport.MAGIC:
+            raise ValueError("Not a Y1 Helper frame region")
+        return {"seq": seq, "width": width, "height": height, "stride": stride, "format": fmt,
+                "timestamp": timestamp, "frame": frame, "closed": bool(closed)}
+
+    def read(self, retries=100):
+        """Return (header, pixel bytes) for a consistent frame, or (header, None) if none published yet"""
+        start = SharedFrameExport.HEADER_SIZE
+        for _ in range(retries):
+            before = self.header()
+            if before["seq"] % 2:
+                time.sleep(0.0005)
+                continue
+            if not before["frame"]:
+                return before, None
+            pixels = bytes(self.shm.buf[start:start + before["stride"] * before["height"]])
+            if struct.unpack_from("<Q", self.shm.buf, 8)[0] == before["seq"]:
+                return before, pixels
+        raise TimeoutError("Frame kept changing while reading")
+
+    def image(self):
+        """The current frame as a PIL image, or None"""
+        from PIL import Image
+        header, pixels = self.read()
+        if pixels is None:
+            return None
+        return Image.frombytes("RGB", (header["width"], header["height"]), pixels)
+
+    def close(self):
+        self.shm.close()
+
+
+def parse_package_list(output):
+    """Parse `pm list packages -f` output into (package, apk_path) tuples"""
+    packages = []
+    for line in output.strip().split('\n'):
+        line = line.strip()
+        if not line.startswith('package:'):
+            continue
+        entry = line[len('package:'):]
+        if '=' in entry:
+            apk_path, package_name = entry.rsplit('=', 1)
+        else:
+            apk_path, package_name = "", entry
+        packages.append((package_name, apk_path))
+    return packages
+
+
+# Binary XML (AndroidManifest.xml) and resource table (resources.arsc) chunk types
+RES_STRING_POOL_TYPE = 0x0001
+RES_TABLE_TYPE = 0x0002
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_TABLE_PACKAGE_TYPE = 0x0200
+RES_TABLE_TYPE_TYPE = 0x0201
+RES_VALUE_REFERENCE = 0x01
+RES_VALUE_STRING = 0x03
+# android: attribute ids, for manifests whose attribute names were stripped
+ANDROID_ATTRIBUTE_NAMES = {0x01010001: "label", 0x01010002: "icon", 0x0101021c: "versionName"}
+
+
+def parse_string_pool(data, offset):
+    """Decode a ResStringPool chunk at offset into a list of strings (UTF-8 or UTF-16)"""
+    header_size = struct.unpack_from("<H", data, offset + 2)[0]
+    count, _, flags, strings_start = struct.unpack_from("<IIII", data, offset + 8)
+    utf8 = flags & 0x100
+    base = offset + strings_start
+    strings = []
+    for relative in struct.unpack_from(f"<{count}I", data, offset + header_size):
+        pos = base + relative
+        if utf8:
+            pos += 2 if data[pos] & 0x80 else 1  # Length in UTF-16 units, unused
+            length = data[pos]
+            if length & 0x80:
+                length = ((length & 0x7f) << 8) | data[pos + 1]
+                pos += 1
+            strings.append(data[pos + 1:pos + 1 + length].decode("utf-8", errors="replace"))
+        else:
+            length = struct.unpack_from("<H", data, pos)[0]
+            if length & 0x8000:
+                length = ((length & 0x7fff) << 16) | struct.unpack_from("<H", data, pos + 2)[0]
+                pos += 2
+            strings.append(data[pos + 2:pos + 2 + length * 2].decode("utf-16-le", errors="replace"))
+    return strings
+
+
+def parse_apk_manifest(data):
+    """Read package, versionName, label and icon from a binary AndroidManifest.xml.
+
+    Attribute values are strings, or resource ids (ints) to resolve with a
+    ResourceTable; missing attributes are None.
+    """
+    result = {"package": None, "versionName": None, "label": None, "icon": None}
+    strings, resource_map = [], []
+    pos = struct.unpack_from("<H", data, 2)[0]
+    while pos + 8 <= len(data):
+        chunk_type, header_size, size = struct.unpack_from("<HHI", data, pos)
+        if size < 8:
+            break
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = parse_string_pool(data, pos)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            resource_map = struct.unpack_from(f"<{(size - header_size) // 4}I", data, pos + header_size)
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            _, name, attribute_start, attribute_size, attribute_count = struct.unpack_from("<IIHHH", data, pos + 16)
+            tag = strings[name]
+            if tag in ("manifest", "application"):
+                for index in range(attribute_count):
+                    _, attr_name, raw, _, _, value_type, value = struct.unpack_from(
+                        "<IIIHBBI", data, pos + 16 + attribute_start + index * attribute_size)
+                    key = ANDROID_ATTRIBUTE_NAMES.get(resource_map[attr_name] if attr_name < len(resource_map)
+                                                      else None, strings[attr_name])
+                    if key not in result:
+                        continue
+                    if raw != 0xFFFFFFFF:
+                        result[key] = strings[raw]
+                    elif value_type == RES_VALUE_REFERENCE:
+                        result[key] = value
+                if tag == "application":
+                    break
+        pos += size
+    return result
+
+
+class ResourceTable:
+    """Minimal resources.arsc reader: resolves resource ids to strings or file paths"""
+
+    def __init__(self, data):
+        self.data = data
+        self.values = []
+        self._types = collections.defaultdict(list)  # (package id, type id) -> [(offset, language, density)]
+        pos = struct.unpack_from("<H", data, 2)[0]
+        while pos + 8 <= len(data):
+            chunk_type, header_size, size = struct.unpack_from("<HHI", data, pos)
+            if size < 8:
+                break
+            if chunk_type == RES_STRING_POOL_TYPE:
+                self.values = parse_string_pool(data, pos)
+            elif chunk_type == RES_TABLE_PACKAGE_TYPE:
+                self._index_package(pos, header_size, size)
+            pos += size
+
+    def _index_package(self, start, header_size, size):
+        package_id = struct.unpack_from("<I", self.data, start + 8)[0]
+        pos = start + header_size
+        while pos + 8 <= start + size:
+            chunk_type, _, chunk_size = struct.unpack_from("<HHI", self.data, pos)
+            if chunk_size < 8:
+                break
+            if chunk_type == RES_TABLE_TYPE_TYPE:
+                # ResTable_config starts at +20: size, imsi, locale (language at +8), density at +14
+                language = self.data[pos + 28:pos + 30].rstrip(b"\0").decode("ascii", errors="replace")
+                density = struct.unpack_from("<H", self.data, pos + 34)[0]
+                self._types[(package_id, self.data[pos + 8])].append((pos, language, density))
+            pos += chunk_size
+
+    def _entries(self, resource_id):
+        """Yield (language, density, value_type, value) for every configuration of a resource"""
+        entry = resource_id & 0xffff
+        for pos, language, density in self._types.get((resource_id >> 24, (resource_id >> 16) & 0xff), ()):
+            header_size = struct.unpack_from("<H", self.data, pos + 2)[0]
+            entry_count, entries_start = struct.unpack_from("<II", self.data, pos + 12)
+            if entry >= entry_count:
+                continue
+            offset = struct.unpack_from("<I", self.data, pos + header_size + entry * 4)[0]
+            if offset == 0xFFFFFFFF:
+                continue
+            entry_pos = pos + entries_start + offset
+            entry_size, flags = struct.unpack_from("<HH", self.data, entry_pos)
+            if flags & 0x1:
+                continue  # Bag (style, array...), not a simple value
+            _, _, value_type, value = struct.unpack_from("<HBBI", self.data, entry_pos + entry_size)
+            yield language, density, value_type, value
+
+    def resolve(self, resource_id, prefer_density=False, depth=0):
+        """The string value of a resource: default-locale text, or the highest-density file path"""
+        candidates = list(self._entries(resource_id))
+        if not candidates or depth > 4:
+            return None
+        if prefer_density:
+            # 0xfffe (anydpi) and 0xffff (nodpi) are not bitmaps scaled for a screen density
+            candidates.sort(key=lambda c: -1 if c[1] >= 0xfffe else c[1] or 160, reverse=True)
+        else:
+            candidates.sort(key=lambda c: (c[0] != "", c[0] != "en"))
+        language, density, value_type, value = candidates[0]
+        if value_type == RES_VALUE_STRING and value < len(self.values):
+            return self.values[value]
+        if value_type == RES_VALUE_REFERENCE:
+            return self.resolve(value, prefer_density, depth + 1)
+        return None
+
+
+def read_apk_metadata(apk_file):
+    """Label, versionName and icon PNG bytes of an APK (path or file object), parsed on the host"""
+    import zipfile
+    with zipfile.ZipFile(apk_file) as apk:
+        manifest = parse_apk_manifest(apk.read("AndroidManifest.xml"))
+        names = set(apk.namelist())
+        table = ResourceTable(apk.read("resources.arsc")) if "resources.arsc" in names else None
+        label, icon, version = manifest["label"], manifest["icon"], manifest["versionName"]
+        if isinstance(label, int):
+            label = table.resolve(label) if table else None
+        if isinstance(version, int):
+            version = table.resolve(version) if table else None
+        icon_png = None
+        if isinstance(icon, int) and table:
+            icon_path = table.resolve(icon, prefer_density=True)
+            if icon_path and icon_path.endswith(".png") and icon_path in names:
+                icon_png = apk.read(icon_path)
+    return {"package": manifest["package"], "label": label, "version_name": version, "icon_png": icon_png}
+
+
+# Host-side cache of installed apps' labels and icons
+APP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".y1_helper", "apps")
+
+
+class AppMetadataCache:
+    """Labels, versions and icons of installed apps, parsed on the host from each APK once.
+
+    Entries are keyed by package, APK path and the APK's modification time
+    (its last update), so an app is only pulled again after it is updated.
+    ``get`` answers from the newest entry for a package without touching
+    the device, which lets menus show names and icons immediately.
+    """
+
+    def __init__(self, directory=APP_CACHE_DIR, icon_size=16):
+        self.directory = directory
+        self.icon_size = icon_size
+        self._lock = threading.Lock()
+        try:
+            with open(os.path.join(directory, "index.json")) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    @staticmethod
+    def key(package, apk_path, mtime):
+        return f"{package}|{apk_path}|{mtime}"
+
+    def get(self, package):
+        """Newest cached entry for a package: {"label", "version_name", "icon" (PNG path or None)}"""
+        with self._lock:
+            matches = [e for e in self._entries.values() if e["package"] == package]
+        return max(matches, key=lambda e: e["mtime"]) if matches else None
+
+    def refresh(self, client, packages, workers=3):
+        """Pull and parse the APKs not cached yet (worker thread); returns the packages that changed"""
+        from concurrent.futures import ThreadPoolExecutor
+        packages = [(name, path) for name, path in packages if path]
+        with client.sync() as sync:
+            stats = [(name, path, sync.stat(path)[2]) for name, path in packages]
+        with self._lock:
+            missing = [item for item in stats if self.key(*item) not in self._entries]
+        if not missing:
+            return []
+        work = queue.Queue()
+        for item in missing:
+            work.put(item)
+        changed = []
+
+        def pull_worker():
+            import tempfile
+            # One sync session per worker for all of its APKs
+            with client.sync() as sync:
+                while True:
+                    try:
+                        package, apk_path, mtime = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    with tempfile.TemporaryFile() as apk:
+                        try:
+                            sync.recv(apk_path, apk)
+                        except AdbError as e:
+                            print(f"Could not pull {apk_path}: {e}")
+                            continue  # Retried on the next refresh
+                        apk.seek(0)
+                        try:
+                            metadata = read_apk_metadata(apk)
+                        except Exception as e:
+                            # Cached anyway, so a malformed APK is not pulled again until it is updated
+                            print(f"Could not read app metadata for {package}: {e}")
+                            metadata = {"label": None, "version_name": None, "icon_png": None}
+                    self._store(package, apk_path, mtime, metadata)
+                    changed.append(package)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as pool:
+            for future in [pool.submit(pull_worker) for _ in range(min(workers, len(missing)))]:
+                future.result()
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = os.path.join(self.directory, "index.json.tmp")
+            with open(temp_path, "w") as f:
+                json.dump(self._entries, f, indent=1)
+            os.replace(temp_path, os.path.join(self.directory, "index.json"))
+        return changed
+
+    def _store(self, package, apk_path, mtime, metadata):
+        icon_path = None
+        if metadata["icon_png"]:
+            import io
+            from PIL import Image
+            try:
+                icon = Image.open(io.BytesIO(metadata["icon_png"])).convert("RGBA")
+                icon = icon.resize((self.icon_size, self.icon_size), Image.Resampling.LANCZOS)
+                os.makedirs(self.directory, exist_ok=True)
+                icon_path = os.path.join(self.directory, f"{package}-{mtime}.png")
+                icon.save(icon_path)
+            except Exception as e:
+                print(f"Could not convert icon of {package}: {e}")
+        with self._lock:
+            # Drop entries for older versions of the same package
+            for key in [k for k, e in self._entries.items() if e["package"] == package]:
+                old_icon = self._entries.pop(key).get("icon")
+                if old_icon and old_icon != icon_path and os.path.exists(old_icon):
+                    os.remove(old_icon)
+            self._entries[self.key(package, apk_path, mtime)] = {
+                "package": package, "apk_path": apk_path, "mtime": mtime,
+                "label": metadata["label"], "version_name": metadata["version_name"], "icon": icon_path,
+            }
+
+
+# Music library sync
+MUSIC_DIRECTORY = "/sdcard/Music"
+MUSIC_EXTENSIONS = (".mp3", ".flac", ".m4a", ".aac", ".ogg", ".opus", ".wav", ".wma", ".ape",
+                    ".m3u", ".m3u8", ".lrc", ".jpg", ".jpeg", ".png")
+
+
+def list_device_tree(sync, root):
+    """Recursively list regular files under a device directory as {relpath: (size, mtime)}"""
+    import stat
+    files = {}
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        for name, mode, size, mtime in sync.list(f"{root}/{rel_dir}" if rel_dir else root):
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if stat.S_ISDIR(mode):
+                pending.append(rel)
+            elif stat.S_ISREG(mode):
+                files[rel] = (size, mtime)
+    return files
+
+
+def plan_music_sync(local_root, device_files, extensions=MUSIC_EXTENSIONS, mtime_slack=2):
+    """Return (to_push, unchanged) for a host folder against a device listing.
+
+    to_push holds (local_path, relpath, size, mtime) for files that are missing on
+    the device, differ in size, or are newer on the host. FAT storage keeps
+    mtimes at two-second resolution, hence mtime_slack.
+    """
+    to_push = []
+    unchanged = 0
+    for dirpath, dirnames, filenames in os.walk(local_root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if extensions and not name.lower().endswith(extensions):
+                continue
+            local_path = os.path.join(dirpath, name)
+            rel = os.path.relpath(local_path, local_root).replace(os.sep, "/")
+            st = os.stat(local_path)
+            remote = device_files.get(rel)
+            if remote is not None and remote[0] == st.st_size and int(st.st_mtime) <= remote[1] + mtime_slack:
+                unchanged += 1
+                continue
+            to_push.append((local_path, rel, st.st_size, int(st.st_mtime)))
+    return to_push, unchanged
+
+
+def sync_music_library(local_root, client=None, remote_root=MUSIC_DIRECTORY, workers=3, progress=None):
+    """Push new and changed music files to the device, then trigger one media scan.
+
+    Files are spread over ``workers`` parallel sync sessions (largest first) so
+    per-file round trips overlap. progress(done_bytes, total_bytes, relpath) is
+    called from the worker threads. Returns a stats dict including MB/s.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    client = client or AdbClient()
+    started = time.perf_counter()
+    try:
+        with client.sync() as sync:
+            device_files = list_device_tree(sync, remote_root)
+    except AdbError:
+        device_files = {}  # Directory does not exist yet; SEND creates it
+    to_push, unchanged = plan_music_sync(local_root, device_files)
+    to_push.sort(key=lambda item: -item[2])
+    total_bytes = sum(item[2] for item in to_push)
+    work = queue.Queue()
+    for item in to_push:
+        work.put(item)
+    lock = threading.Lock()
+    done = {"bytes": 0, "files": 0}
+    cancel_event = current_cancel_event()
+
+    def push_worker():
+        # Each worker keeps one sync session open for all of its files
+        _command_context.cancel_event = cancel_event
+        with client.sync() as sync:
+            while True:
+                try:
+                    local_path, rel, size, mtime = work.get_nowait()
+                except queue.Empty:
+                    return
+                with open(local_path, "rb") as source:
+                    sync.send(f"{remote_root}/{rel}", source, mtime=mtime)
+                with lock:
+                    done["bytes"] += size
+                    done["files"] += 1
+                    if progress:
+                        progress(done["bytes"], total_bytes, rel)
+
+    transfer_started = time.perf_counter()
+    if to_push:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(to_push)))) as pool:
+            for future in [pool.submit(push_worker) for _ in range(min(workers, len(to_push)))]:
+                future.result()
+    transfer_seconds = time.perf_counter() - transfer_started
+    if to_push:
+        # One rescan of the whole card instead of a MEDIA_SCANNER_SCAN_FILE per file
+        client.shell("am broadcast -a android.intent.action.MEDIA_MOUNTED -d file:///sdcard")
+    return {
+        "pushed": done["files"],
+        "unchanged": unchanged,
+        "bytes": done["bytes"],
+        "seconds": time.perf_counter() - started,
+        "transfer_seconds": transfer_seconds,
+        "mb_per_s": done["bytes"] / 1e6 / transfer_seconds if transfer_seconds > 0 and done["bytes"] else 0.0,
+    }
+
+
+class _ProgressReader:
+    """File-like wrapper that adds each read to ``done["bytes"]`` and reports progress.
+
+    progress(done_bytes, total_bytes, path) is called at most every
+    ``interval`` seconds; readers sharing one ``done`` dict share the throttle.
+    """
+
+    def __init__(self, source, path, done, total_bytes, progress, interval=0.25):
+        self._source = source
+        self._path = path
+        self._done = done
+        self._total_bytes = total_bytes
+        self._progress = progress
+        self._interval = interval
+
+    def read(self, n=-1):
+        data = self._source.read(n)
+        done = self._done
+        done["bytes"] += len(data)
+        now = time.perf_counter()
+        if self._progress and now - done.get("reported", 0.0) >= self._interval:
+            done["reported"] = now
+            self._progress(done["bytes"], self._total_bytes, self._path)
+        return data
+
+
+# Device storage backup and restore
+BACKUP_ROOTS = ("/sdcard",)
+BACKUP_MANIFEST = "y1_backup_manifest.json"
+BACKUP_INCOMPLETE = "y1_backup_incomplete.json"  # Last member: paths whose archived data is not the real file
+BACKUP_QUEUE_CHUNKS = 32  # Bounds memory to about 32 sync chunks whatever the archive size
+
+
+class _BackupChunkReader:
+    """File-like view of one file's chunks on the backup queue, exactly ``size`` bytes long.
+
+    A file that shrank after it was listed is padded with zeros and one that grew
+    is cut at the listed size, so the tar header written up front stays valid.
+    ``incomplete`` is set once padding or truncation was needed or the read
+    failed, since the archived data is then not the device's file.
+    """
+
+    def __init__(self, take, first, size, on_bytes):
+        self._take = take
+        self._buffer = first[1] if first[0] == "data" else b""
+        self.finished = first[0] != "data"
+        self.failed = first[0] == "skip"
+        self.padded = 0
+        self.truncated = False
+        self.remaining = size
+        self._on_bytes = on_bytes
+
+    @property
+    def incomplete(self):
+        return self.failed or self.padded > 0 or self.truncated
+
+    def _next(self):
+        kind, value = self._take()
+        if kind == "data":
+            self._buffer = value
+        else:
+            self.finished = True
+            self.failed = kind == "skip"
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.remaining
+        out = bytearray()
+        while len(out) < n and self.remaining > 0:
+            if not self._buffer:
+                if self.finished:
+                    pad = min(n - len(out), self.remaining)
+                    out += bytes(pad)
+                    self.padded += pad
+                    self.remaining -= pad
+                    break
+                self._next()
+                continue
+            take = min(n - len(out), len(self._buffer), self.remaining)
+            out += self._buffer[:take]
+            self._buffer = self._buffer[take:]
+            self.remaining -= take
+        if self.remaining == 0 and self._buffer:
+            self.truncated = True  # The file grew after it was listed
+        self._on_bytes(len(out))
+        return bytes(out)
+
+    def drain(self):
+        """Discard whatever is left of this file on the queue"""
+        if self._buffer:
+            self.truncated = True
+        while not self.finished:
+            self._next()
+            if self._buffer:
+                self.truncated = True
+
+
+def backup_device_storage(archive_path, roots=BACKUP_ROOTS, client=None, progress=None, compresslevel=6):
+    """Stream device files under ``roots`` into a gzip-compressed tar on the host.
+
+    The first member is a JSON manifest of every file (path, size, mtime) for
+    restore to diff against, and the last lists the files that were unreadable
+    or changed size while being read, so restore does not push them. One thread reads files over a sync session while
+    the caller's thread tars and compresses them, joined by a bounded queue, so
+    reading and compression overlap and memory use does not grow with the
+    archive. Unreadable and incomplete files are listed in the result.
+    progress(done_bytes, total_bytes, path) is called as data is archived.
+    """
+    import gzip
+    import io
+    import tarfile
+    client = client or AdbClient()
+    started = time.perf_counter()
+    cancel_event = current_cancel_event()
+    roots = [root.rstrip("/") or "/" for root in roots]
+    files = []
+    with client.sync() as sync:
+        for root in roots:
+            prefix = "" if root == "/" else root
+            for rel, (size, mtime) in sorted(list_device_tree(sync, root).items()):
+                files.append((f"{prefix}/{rel}", size, mtime))
+    total_bytes = sum(size for _, size, _ in files)
+    manifest = {
+        "created": time.time(),
+        "serial": getattr(client, "serial", None),
+        "roots": roots,
+        "total_bytes": total_bytes,
+        "files": [list(entry) for entry in files],
+    }
+
+    chunks = queue.Queue(maxsize=BACKUP_QUEUE_CHUNKS)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            with client.sync() as sync:
+                for path, size, mtime in files:
+                    if not put(("file", (path, size, mtime))):
+                        return
+                    try:
+                        for data in sync.recv_chunks(path):
+                            if not put(("data", data)):
+                                return
+                    except AdbError as e:
+                        put(("skip", str(e)))
+                    else:
+                        put(("eof", None))
+        except Exception as e:
+            put(("error", e))
+        else:
+            put(("end", None))
+
+    def take():
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise CommandCancelled()
+            try:
+                item = chunks.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item[0] == "error":
+                raise item[1]
+            return item
+
+    done = {"bytes": 0, "path": ""}
+    last_report = [0.0]
+
+    def on_bytes(count):
+        done["bytes"] += count
+        now = time.perf_counter()
+        if progress and now - last_report[0] >= 0.25:
+            last_report[0] = now
+            progress(done["bytes"], total_bytes, done["path"])
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    skipped = []
+    archived = 0
+    try:
+        with open(archive_path, "wb") as raw, \
+                gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=compresslevel) as compressed, \
+                tarfile.open(fileobj=compressed, mode="w|") as tar:
+            manifest_bytes = json.dumps(manifest).encode()
+            info = tarfile.TarInfo(BACKUP_MANIFEST)
+            info.size = len(manifest_bytes)
+            info.mtime = int(manifest["created"])
+            tar.addfile(info, io.BytesIO(manifest_bytes))
+            item = take()
+            while item[0] != "end":
+                path, size, mtime = item[1]
+                done["path"] = path
+                first = take()
+                if first[0] == "skip":
+                    skipped.append(path)
+                    item = take()
+                    continue
+                source = _BackupChunkReader(take, first, size, on_bytes)
+                info = tarfile.TarInfo(path.lstrip("/"))
+                info.size = size
+                info.mtime = mtime
+                info.mode = 0o644
+                tar.addfile(info, source)
+                source.drain()
+                if source.incomplete:
+                    skipped.append(path)
+                else:
+                    archived += 1
+                item = take()
+            incomplete_bytes = json.dumps(skipped).encode()
+            info = tarfile.TarInfo(BACKUP_INCOMPLETE)
+            info.size = len(incomplete_bytes)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(incomplete_bytes))
+    except BaseException:
+        stop.set()
+        thread.join(timeout=5)
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+        raise
+    thread.join()
+    archive_bytes = os.path.getsize(archive_path)
+    seconds = time.perf_counter() - started
+    if progress:
+        progress(done["bytes"], total_bytes, "")
+    return {
+        "files": archived,
+        "skipped": skipped,
+        "bytes": done["bytes"],
+        "archive_bytes": archive_bytes,
+        "seconds": seconds,
+        "mb_per_s": done["bytes"] / 1e6 / seconds if seconds > 0 else 0.0,
+    }
+
+
+def read_backup_manifest(archive_path):
+    """Return the manifest dict stored at the start of a backup archive"""
+    import tarfile
+    with tarfile.open(archive_path, "r|gz") as tar:
+        member = tar.next()
+        if member is None or member.name != BACKUP_MANIFEST:
+            raise ValueError(f"{os.path.basename(archive_path)} is not a Y1 Helper backup")
+        return json.load(tar.extractfile(member))
+
+
+def read_backup_incomplete(archive_path):
+    """Return the set of paths a backup archive holds no good copy of.
+
+    The list is the archive's last member, so this reads the whole archive;
+    decompressing is still far faster than pushing to the device.
+    Archives written before the list existed yield an empty set.
+    """
+    import tarfile
+    with tarfile.open(archive_path, "r|gz") as tar:
+        for member in tar:
+            if member.name == BACKUP_INCOMPLETE:
+                return set(json.load(tar.extractfile(member)))
+    return set()
+
+
+def restore_device_backup(archive_path, client=None, progress=None, mtime_slack=2):
+    """Push the files of a backup archive that differ from what is on the device now.
+
+    The device is listed under the manifest's roots and only files missing or
+    differing in size or mtime are sent; files the backup could not read in
+    full are left alone. The archive is read as a stream, so nothing is
+    extracted to disk and memory use stays flat.
+    progress(done_bytes, total_bytes, path) is called as data is pushed.
+    """
+    import tarfile
+    client = client or AdbClient()
+    started = time.perf_counter()
+    manifest = read_backup_manifest(archive_path)
+    device_files = {}
+    with client.sync() as sync:
+        for root in manifest["roots"]:
+            prefix = "" if root == "/" else root
+            try:
+                for rel, entry in list_device_tree(sync, root).items():
+                    device_files[f"{prefix}/{rel}"] = entry
+            except AdbError:
+                pass  # Root is gone; everything under it gets pushed
+        to_push = {}
+        for path, size, mtime in manifest["files"]:
+            current = device_files.get(path)
+            if current is None or current[0] != size or abs(current[1] - mtime) > mtime_slack:
+                to_push[path] = size
+        incomplete = read_backup_incomplete(archive_path) & to_push.keys() if to_push else set()
+        for path in incomplete:
+            del to_push[path]
+        total_bytes = sum(to_push.values())
+        done = {"bytes": 0, "files": 0}
+        transfer_started = time.perf_counter()
+        if to_push:
+            with tarfile.open(archive_path, "r|gz") as tar:
+                for member in tar:
+                    path = "/" + member.name
+                    if not member.isfile() or path not in to_push:
+                        continue
+                    sync.send(path, _ProgressReader(tar.extractfile(member), path, done, total_bytes, progress),
+                              mtime=member.mtime)
+                    done["files"] += 1
+        transfer_seconds = time.perf_counter() - transfer_started
+    if progress:
+        progress(done["bytes"], total_bytes, "")
+    return {
+        "pushed": done["files"],
+        "unchanged": len(manifest["files"]) - len(to_push) - len(incomplete),
+        "incomplete": sorted(incomplete),
+        "bytes": done["bytes"],
+        "seconds": time.perf_counter() - started,
+        "mb_per_s": done["bytes"] / 1e6 / transfer_seconds if transfer_seconds > 0 and done["bytes"] else 0.0,
+    }
+
+
+# Device file browser
+BROWSER_PAGE_SIZE = 500
+
+
+def sort_directory_entries(entries):
+    """Directories and links first, then files, each by case-insensitive name"""
+    import stat
+    return sorted(entries, key=lambda entry: (not (stat.S_ISDIR(entry[1]) or stat.S_ISLNK(entry[1])),
+                                              entry[0].casefold()))
+
+
+class DeviceDirectoryCache:
+    """LRU cache of device directory listings; a listing expires after ``ttl`` seconds or on invalidate()"""
+
+    def __init__(self, capacity=64, ttl=30.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._listings = collections.OrderedDict()  # path -> (fetched_at, sorted entries)
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            item = self._listings.get(path)
+            if item is None:
+                return None
+            if time.monotonic() - item[0] > self.ttl:
+                del self._listings[path]
+                return None
+            self._listings.move_to_end(path)
+            return item[1]
+
+    def put(self, path, entries):
+        with self._lock:
+            self._listings[path] = (time.monotonic(), entries)
+            self._listings.move_to_end(path)
+            while len(self._listings) > self.capacity:
+                self._listings.popitem(last=False)
+
+    def invalidate(self, path):
+        with self._lock:
+            self._listings.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+
+
+class DeviceDirectoryLister:
+    """Lists device directories page by page over one long-lived sync session.
+
+    request() returns a token; on_page(token, path, page, complete) and
+    on_error(token, path, message) are called from the lister thread. Pages are
+    reported as adbd reads the directory, so huge folders show their first
+    entries at once; the last call carries the complete sorted listing. A listing superseded by a newer request is abandoned by
+    dropping the session (the protocol cannot stop a LIST midway).
+    """
+
+    def __init__(self, client, cache, on_page, on_error, page_size=BROWSER_PAGE_SIZE):
+        self.client = client
+        self.cache = cache
+        self.on_page = on_page
+        self.on_error = on_error
+        self.page_size = page_size
+        self.latest_token = 0
+        self._requests = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._requests.put(None)
+
+    def request(self, path, force=False):
+        """Queue a listing of path (from the cache unless force) and return its token"""
+        self.latest_token += 1
+        self._requests.put((self.latest_token, path, force))
+        return self.latest_token
+
+    def _run(self):
+        sync = None
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            token, path, force = item
+            if token != self.latest_token:
+                continue
+            cached = None if force else self.cache.get(path)
+            if cached is not None:
+                self.on_page(token, path, [], cached)
+                continue
+            entries, page = [], []
+            try:
+                if sync is None:
+                    sync = self.client.sync()
+                for entry in sync.list_iter(path):
+                    entries.append(entry)
+                    page.append(entry)
+                    if len(page) >= self.page_size:
+                        if token != self.latest_token:
+                            break
+                        self.on_page(token, path, page, None)
+                        page = []
+                else:
+                    entries = sort_directory_entries(entries)
+                    self.cache.put(path, entries)
+                    self.on_page(token, path, page, entries)
+                    continue
+                sync.close()  # Abandoned midway; the session is out of step now
+                sync = None
+            except (AdbError, OSError) as e:
+                if sync is not None:
+                    sync.close()
+                    sync = None
+                self.on_error(token, path, str(e))
+        if sync is not None:
+            sync.close()
+
+
+def pull_device_paths(paths, local_dir, client=None, progress=None):
+    """Stream device files, and directories recursively, into local_dir.
+
+    Each file is written to disk as its sync chunks arrive.
+    progress(done_bytes, total_bytes, path) is called as data is received.
+    Returns a stats dict including MB/s.
+    """
+    import stat
+    client = client or AdbClient()
+    started = time.perf_counter()
+    done = {"bytes": 0, "files": 0}
+    with client.sync() as sync:
+        plan = []  # (device path, local path, size)
+        for path in paths:
+            path = path.rstrip("/") or "/"
+            name = os.path.basename(path) or "root"
+            mode, size, _ = sync.stat(path)
+            if stat.S_ISREG(mode):
+                plan.append((path, os.path.join(local_dir, name), size))
+                continue
+            prefix = "" if path == "/" else path
+            for rel, (size, _) in sorted(list_device_tree(sync, path).items()):
+                plan.append((f"{prefix}/{rel}", os.path.join(local_dir, name, *rel.split("/")), size))
+        total_bytes = sum(size for _, _, size in plan)
+        cancel_event = current_cancel_event()
+        last_report = [0.0]
+        for device_path, local_path, _ in plan:
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, "wb") as f:
+                for data in sync.recv_chunks(device_path):
+                    f.write(data)
+                    done["bytes"] += len(data)
+                    now = time.perf_counter()
+                    if progress and now - last_report[0] >= 0.25:
+                        last_report[0] = now
+                        progress(done["bytes"], total_bytes, device_path)
+                    if cancel_event is not None and cancel_event.is_set():
+                        # Drop the session rather than read the rest of the file
+                        raise CommandCancelled()
+            done["files"] += 1
+    seconds = time.perf_counter() - started
+    return {
+        "files": done["files"],
+        "bytes": done["bytes"],
+        "seconds": seconds,
+        "mb_per_s": done["bytes"] / 1e6 / seconds if seconds > 0 else 0.0,
+    }
+
+
+def push_host_files(local_paths, remote_dir, client=None, progress=None):
+    """Stream host files into a device directory, keeping their mtimes.
+
+    progress(done_bytes, total_bytes, path) is called as data is sent.
+    Returns a stats dict including MB/s.
+    """
+    client = client or AdbClient()
+    started = time.perf_counter()
+    remote_dir = remote_dir.rstrip("/")
+    total_bytes = sum(os.path.getsize(path) for path in local_paths)
+    done = {"bytes": 0, "files": 0}
+    with client.sync() as sync:
+        for local_path in local_paths:
+            remote_path = f"{remote_dir}/{os.path.basename(local_path)}"
+            with open(local_path, "rb") as source:
+                sync.send(remote_path, _ProgressReader(source, remote_path, done, total_bytes, progress),
+                          mtime=int(os.path.getmtime(local_path)))
+            done["files"] += 1
+    seconds = time.perf_counter() - started
+    return {
+        "files": done["files"],
+        "bytes": done["bytes"],
+        "seconds": seconds,
+        "mb_per_s": done["bytes"] / 1e6 / seconds if seconds > 0 else 0.0,
+    }
+
+
+# Fleet provisioning: the Prepare Device sequence on every attached Y1 at once
+FLEET_APKS = (("stock launcher", "com.innioasis.y1_2.1.9.apk"),
+              ("Nova Launcher", "novalauncher.apk"),
+              ("KeyCodeDisp", "keycodedisp.apk"))
+FLEET_STAGING_DIR = "/data/local/tmp"
+FLEET_STEP_TIMEOUT = 120  # pm install prints nothing while dexopt runs, which can take over a minute
+FLEET_FINAL_STEPS = (
+    ("disable factory test", "pm disable-user --user 0 com.ayst.factorytest"),
+    ("launch stock launcher", "monkey -p com.innioasis.y1 -c android.intent.category.LAUNCHER 1"),
+    ("set home activity", "cmd package set-home-activity com.innioasis.y1/.ui.LauncherActivity"),
+)
+
+
+def fan_out_push(local_path, remote_path, clients, chunk_size=SYNC_CHUNK_SIZE, depth=16):
+    """Read a host file once and stream it to remote_path on every client's device at the same time.
+
+    Each device has its own sync session and a bounded chunk queue, so a slow
+    device only holds back the shared read by ``depth`` chunks and a failed one
+    drops out without affecting the rest. Returns {serial: error message} for
+    the devices that failed.
+    """
+    mtime = int(os.path.getmtime(local_path))
+    cancel_event = current_cancel_event()
+    stop = threading.Event()
+    queues = {client.serial: queue.Queue(maxsize=depth) for client in clients}
+    errors = {}
+
+    class _QueueSource:
+        def __init__(self, chunks):
+            self._chunks = chunks
+
+        def read(self, n=-1):
+            while True:
+                if stop.is_set():
+                    raise CommandCancelled()
+                try:
+                    return self._chunks.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+
+    def push(client):
+        try:
+            with client.sync() as sync:
+                sync.send(remote_path, _QueueSource(queues[client.serial]), mtime=mtime)
+        except Exception as e:
+            errors[client.serial] = str(e) or type(e).__name__
+
+    threads = [threading.Thread(target=push, args=(client,), daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+    try:
+        with open(local_path, "rb") as f:
+            while True:
+                data = f.read(chunk_size)
+                for serial, chunks in queues.items():
+                    while serial not in errors:
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise CommandCancelled()
+                        try:
+                            chunks.put(data, timeout=0.2)
+                            break
+                        except queue.Full:
+                            continue
+                if not data:
+                    break
+    except BaseException:
+        stop.set()  # Abort the device sessions rather than leave them waiting for data
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+    return errors
+
+
+def provision_fleet(clients, apks=FLEET_APKS, on_status=None):
+    """Run the Prepare Device sequence on every client's device concurrently.
+
+    Each APK is read once and fanned out to all devices (fan_out_push), then
+    installed with pm by a per-device worker while the next APK is already
+    streaming. After the installs every device disables the factory test
+    package, launches the stock launcher and sets it as home. A device drops
+    out at its first failure, after removing any APKs still staged on it; the
+    others carry on. Setup steps allow FLEET_STEP_TIMEOUT seconds of silence.
+    on_status(serial, step, state, detail) is called from worker threads.
+    Returns a report dict with per-device steps, timings and errors.
+    """
+    started = time.perf_counter()
+    cancel_event = current_cancel_event()
+    devices = {client.serial: {"steps": [], "ok": True, "error": None, "seconds": 0.0} for client in clients}
+    steps = {client.serial: queue.Queue() for client in clients}
+    staged = {client.serial: set() for client in clients}  # Remote APK paths not yet removed
+
+    def report(serial, step, state, detail=""):
+        if on_status is not None:
+            on_status(serial, step, state, detail)
+
+    def fail(serial, step, error):
+        device = devices[serial]
+        if device["ok"]:
+            device["ok"] = False
+            device["error"] = f"{step}: {error}"
+        report(serial, step, "failed", error)
+
+    def device_worker(client):
+        # Runs this device's install and setup steps in order as they are queued
+        _command_context.cancel_event = cancel_event
+        serial = client.serial
+        client = AdbClient(serial, client.host, client.port, timeout=FLEET_STEP_TIMEOUT)
+        while True:
+            item = steps[serial].get()
+            if item is None:
+                break
+            step, command, cleanup, check = item
+            if cancel_event is not None and cancel_event.is_set():
+                fail(serial, step, "cancelled")
+            if not devices[serial]["ok"]:
+                continue
+            report(serial, step, "running")
+            step_started = time.perf_counter()
+            try:
+                output = client.shell(command).strip()
+                if cleanup:
+                    client.shell(cleanup)
+                    staged[serial].difference_update(cleanup.split()[1:])
+            except (OSError, AdbError) as e:
+                fail(serial, step, str(e))
+                continue
+            seconds = time.perf_counter() - step_started
+            devices[serial]["steps"].append({"step": step, "seconds": round(seconds, 3), "output": output[-200:]})
+            if check and check not in output:
+                fail(serial, step, output.splitlines()[-1] if output else "no output")
+            else:
+                report(serial, step, "done", f"{seconds:.1f} s")
+        if staged[serial]:
+            # Dropped out (or cancelled) before installing: don't leave APKs in the staging directory
+            try:
+                client.shell("rm -f " + " ".join(sorted(staged[serial])))
+            except (OSError, AdbError) as e:
+                print(f"Could not remove staged APKs on {serial}: {e}")
+        devices[serial]["seconds"] = round(time.perf_counter() - started, 3)
+
+    workers = [threading.Thread(target=device_worker, args=(client,), daemon=True) for client in clients]
+    for worker in workers:
+        worker.start()
+    pushes = []
+    try:
+        for label, apk_path in apks:
+            remote_path = f"{FLEET_STAGING_DIR}/{os.path.basename(apk_path)}"
+            targets = [client for client in clients if devices[client.serial]["ok"]]
+            if not targets:
+                break
+            for client in targets:
+                staged[client.serial].add(remote_path)
+                report(client.serial, f"push {label}", "running")
+            push_started = time.perf_counter()
+            errors = fan_out_push(os.path.abspath(apk_path), remote_path, targets)
+            push_seconds = time.perf_counter() - push_started
+            pushes.append({"apk": apk_path, "bytes": os.path.getsize(apk_path), "devices": len(targets),
+                           "seconds": round(push_seconds, 3)})
+            for client in targets:
+                if client.serial in errors:
+                    fail(client.serial, f"push {label}", errors[client.serial])
+                    continue
+                report(client.serial, f"push {label}", "done", f"{push_seconds:.1f} s")
+                steps[client.serial].put((f"install {label}", f"pm install -r {remote_path}",
+                                          f"rm {remote_path}", "Success"))
+        for step, command in FLEET_FINAL_STEPS:
+            for client in clients:
+                steps[client.serial].put((step, command, None, None))
+    finally:
+        for client in clients:
+            steps[client.serial].put(None)
+        for worker in workers:
+            worker.join()
+    if cancel_event is not None and cancel_event.is_set():
+        raise CommandCancelled()
+    return {
+        "created": time.time(),
+        "seconds": round(time.perf_counter() - started, 3),
+        "succeeded": sum(1 for device in devices.values() if device["ok"]),
+        "failed": sum(1 for device in devices.values() if not device["ok"]),
+        "pushes": pushes,
+        "devices": devices,
+    }
+
+
+# One shell round-trip collects everything the helper needs to know about the
+# device; sections are separated by marker lines and parsed by parse_device_facts
+FB_SYSFS_FILES = ("bits_per_pixel", "stride", "virtual_size", "modes", "name")
+DEVICE_FACTS_SCRIPT = "; ".join(
+    ["getprop", "echo @@Y1@@wm", "wm size", "echo @@Y1@@fb"]
+    + [f"echo {name}=$(cat /sys/class/graphics/fb0/{name})" for name in FB_SYSFS_FILES]
+    + ["echo @@Y1@@launcher", "pm list packages com.innioasis.y1"]
+)
+
+
+def framebuffer_geometry(framebuffer):
+    """Return (width, height) of fb0 frames from its sysfs values, or None if they are incomplete.
+
+    The width is the line length in pixels (stride / bytes per pixel), so padded
+    lines still decode; the height is the visible mode height, falling back to
+    the virtual height (which may include a second buffer).
+    """
+    import re
+    try:
+        bits_per_pixel = int(framebuffer.get("bits_per_pixel", ""))
+    except ValueError:
+        return None
+    mode = re.search(r'(\d+)x(\d+)', framebuffer.get("modes", ""))
+    virtual = re.match(r'\s*(\d+)\s*,\s*(\d+)', framebuffer.get("virtual_size", ""))
+    stride = framebuffer.get("stride", "")
+    if stride.isdigit() and int(stride) and bits_per_pixel:
+        width = int(stride) * 8 // bits_per_pixel
+    elif virtual:
+        width = int(virtual.group(1))
+    elif mode:
+        width = int(mode.group(1))
+    else:
+        return None
+    if mode:
+        height = int(mode.group(2))
+    elif virtual:
+        height = int(virtual.group(2))
+    else:
+        return None
+    return (width, height) if width and height else None
+
+
+def parse_device_facts(output):
+    """Parse DEVICE_FACTS_SCRIPT output into a facts dict"""
+    import re
+    sections = collections.defaultdict(list)
+    section = "props"
+    for line in output.replace('\r', '').split('\n'):
+        if line.startswith("@@Y1@@"):
+            section = line[len("@@Y1@@"):].strip()
+            continue
+        sections[section].append(line)
+    props = {}
+    for line in sections["props"]:
+        match = re.match(r'\[(.*?)\]: \[(.*)\]', line.strip())
+        if match:
+            props[match.group(1)] = match.group(2)
+    screen_size = None
+    for line in sections["wm"]:
+        # "Override size" is a scaled logical size, not the panel; wm is missing on Android 4.2 anyway
+        match = re.search(r'Physical size:\s*(\d+)x(\d+)', line)
+        if match:
+            screen_size = (int(match.group(1)), int(match.group(2)))
+    framebuffer = {}
+    for line in sections["fb"]:
+        if '=' in line:
+            name, value = line.split('=', 1)
+            framebuffer[name.strip()] = value.strip()
+    return {
+        "props": props,
+        "serial": props.get("ro.serialno", ""),
+        "fingerprint": props.get("ro.build.fingerprint", ""),
+        "model": props.get("ro.product.model", ""),
+        "android_version": props.get("ro.build.version.release", ""),
+        "screen_size": screen_size,
+        "framebuffer": framebuffer,
+        "framebuffer_geometry": framebuffer_geometry(framebuffer),
+        "y1_launcher_installed": any("com.innioasis.y1" in line for line in sections["launcher"]),
+        "collected_at": time.time(),
+    }
+
+
+def decode_framebuffer(data, width, height, profile="Auto"):
+    """Decode raw framebuffer bytes into an RGB PIL image, or None if no format fits"""
+    import numpy as np
+    from PIL import Image
+    img_rgb = None
+    expected_rgba = width * height * 4
+    expected_rgb = width * height * 3
+    expected_rgb565 = width * height * 2
+    formats_to_try = []
+    if profile == "Auto":
+        if len(data) >= expected_rgba:
+            formats_to_try = [
+                ("RGBA8888", "RGBA", expected_rgba, False),
+                ("BGRA8888", "RGBA", expected_rgba, True)
+            ]
+        elif len(data) >= expected_rgb:
+            formats_to_try = [
+                ("RGB888", "RGB", expected_rgb, False),
+                ("BGR888", "RGB", expected_rgb, True)
+            ]
+        elif len(data) >= expected_rgb565:
+            formats_to_try = [("RGB565", "RGB565", expected_rgb565, False)]
+    else:
+        if profile == "RGBA8888":
+            formats_to_try = [("RGBA8888", "RGBA", expected_rgba, False)]
+        elif profile == "BGRA8888":
+            formats_to_try = [("BGRA8888", "RGBA", expected_rgba, True)]
+        elif profile == "RGB888":
+            formats_to_try = [("RGB888", "RGB", expected_rgb, False)]
+        elif profile == "BGR888":
+            formats_to_try = [("BGR888", "RGB", expected_rgb, True)]
+        elif profile == "RGB565":
+            formats_to_try = [("RGB565", "RGB565", expected_rgb565, False)]
+    for format_name, pil_format, expected_size, swap_rb in formats_to_try:
+        try:
+            if pil_format == "RGB565":
+                rgb_data = bytearray(expected_rgb)
+                for i in range(0, expected_rgb565, 2):
+                    if i + 1 < len(data):
+                        pixel = (data[i + 1] << 8) | data[i]
+                        r = ((pixel >> 11) & 0x1F) << 3
+                        g = ((pixel >> 5) & 0x3F) << 2
+                        b = (pixel & 0x1F) << 3
+                        rgb_idx = (i // 2) * 3
+                        if rgb_idx + 2 < len(rgb_data):
+                            rgb_data[rgb_idx] = r
+                            rgb_data[rgb_idx + 1] = g
+                            rgb_data[rgb_idx + 2] = b
+                img = Image.frombytes('RGB', (width, height), bytes(rgb_data))
+                img_rgb = img
+            elif swap_rb:
+                arr = np.frombuffer(data[:expected_size], dtype=np.uint8)
+                arr = arr.reshape((height, width, int(expected_size // (width * height))))
+                arr = arr[..., [2, 1, 0, 3]] if arr.shape[2] == 4 else arr[..., [2, 1, 0]]
+                img = Image.fromarray(arr)
+                img_rgb = img.convert('RGB')
+            else:
+                img = Image.frombytes(pil_format, (width, height), data[:expected_size])
+                img_rgb = img.convert('RGB') if pil_format == 'RGBA' else img
+            break
+        except Exception as e:
+            print(f"Failed to decode with {format_name}: {e}")
+            continue
+    return img_rgb
+
+
+# Probed capabilities and backend benchmarks, per device serial and build fingerprint
+DEVICE_DB_PATH = os.path.join(os.path.expanduser("~"), ".y1_helper", "devices.json")
+
+
+class DeviceCapabilityStore:
+    """Per-device capability records persisted as JSON.
+
+    Records are keyed by serial and build fingerprint, so reconnecting a
+    device reuses what was measured before, while a firmware update (new
+    fingerprint) gets probed afresh.
+    """
+
+    def __init__(self, path=DEVICE_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._devices = None
+
+    @staticmethod
+    def key(serial, fingerprint):
+        return f"{serial or 'unknown'}|{fingerprint or 'unknown'}"
+
+    def _load(self):
+        if self._devices is None:
+            try:
+                with open(self.path) as f:
+                    self._devices = json.load(f).get("devices", {})
+            except FileNotFoundError:
+                self._devices = {}
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable device database {self.path}: {e}")
+                self._devices = {}
+        return self._devices
+
+    def get(self, serial, fingerprint):
+        with self._lock:
+            return self._load().get(self.key(serial, fingerprint))
+
+    def put(self, serial, fingerprint, record):
+        with self._lock:
+            self._load()[self.key(serial, fingerprint)] = record
+            self._save()
+
+    def forget(self, serial, fingerprint):
+        with self._lock:
+            if self._load().pop(self.key(serial, fingerprint), None) is not None:
+                self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": 1, "devices": self._devices}, f, indent=2)
+        os.replace(temp_path, self.path)
+
+
+def pixel_profile_for_frame(size, width, height, default="BGRA8888"):
+    """Pick the decode profile that matches a raw frame's size (32-bit frames keep ``default``)"""
+    pixels = width * height
+    if size == pixels * 2:
+        return "RGB565"
+    if size == pixels * 3:
+        return "RGB888"
+    return default
+
+
+def benchmark_capture_methods(client, width, height, temp_path=None, reads=3, default_profile="BGRA8888"):
+    """Time every capture method plus decoding of its frames.
+
+    Returns {method: {"ok", "seconds" (median per read), "bytes", "profile",
+    "decode_seconds", "error"}}; methods the device does not support (e.g.
+    exec-out before Android 5.0) are recorded with ok False.
+    """
+    results = {}
+    for method in CAPTURE_METHODS:
+        timings, decode_timings = [], []
+        result = {"ok": False, "seconds": None, "bytes": None, "profile": None, "decode_seconds": None,
+                  "error": None}
+        try:
+            for _ in range(reads):
+                start = time.perf_counter()
+                data = read_framebuffer(method, temp_path, client, timeout=5)
+                timings.append(time.perf_counter() - start)
+                profile = pixel_profile_for_frame(len(data), width, height, default_profile)
+                start = time.perf_counter()
+                if decode_framebuffer(data, width, height, profile) is None:
+                    raise AdbError(f"{len(data)} byte frame does not decode as {profile}")
+                decode_timings.append(time.perf_counter() - start)
+            result.update(ok=True, seconds=sorted(timings)[len(timings) // 2], bytes=len(data),
+                          profile=profile, decode_seconds=sorted(decode_timings)[len(decode_timings) // 2])
+        except Exception as e:
+            result["error"] = str(e) or type(e).__name__
+        results[method] = result
+    return results
+
+
+def choose_backends(capture_results, input_results):
+    """The fastest working capture method, its pixel profile, and the fastest working input method"""
+    working = {m: r for m, r in capture_results.items() if r["ok"]}
+    capture_method = min(working, key=lambda m: working[m]["seconds"] + working[m]["decode_seconds"],
+                         default="pull")
+    inputs = {m: seconds for m, seconds in input_results.items() if seconds is not None}
+    return {
+        "capture_method": capture_method,
+        "pixel_profile": working[capture_method]["profile"] if capture_method in working else None,
+        "input_method": min(inputs, key=inputs.get, default="keyevent"),
+    }
+
+
+class RollingHistogram:
+    """Latency samples over a rolling window, summarised as percentiles and buckets"""
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, window=512):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds * 1000.0)
+        self.count += 1
+
+    def percentile(self, p):
+        """Return the p-th percentile in milliseconds over the window (0 if empty)"""
+        samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))]
+
+    def snapshot(self):
+        samples = list(self.samples)
+        buckets = collections.OrderedDict((f"<={limit}ms", 0) for limit in self.BUCKETS_MS)
+        buckets[f">{self.BUCKETS_MS[-1]}ms"] = 0
+        for sample in samples:
+            for limit in self.BUCKETS_MS:
+                if sample <= limit:
+                    buckets[f"<={limit}ms"] += 1
+                    break
+            else:
+                buckets[f">{self.BUCKETS_MS[-1]}ms"] += 1
+        return {
+            "count": self.count,
+            "window": len(samples),
+            "mean_ms": sum(samples) / len(samples) if samples else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": max(samples) if samples else 0.0,
+            "buckets": buckets,
+        }
+
+
+class PerfMonitor:
+    """Thread-safe per-stage timing registry backing the HUD and JSON export"""
+
+    def __init__(self, window=512):
+        self.window = window
+        self._stages = collections.OrderedDict()
+        self._frame_times = collections.deque(maxlen=120)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = RollingHistogram(self.window)
+            histogram.add(seconds)
+
+    def stage(self, stage):
+        """Return the histogram for a stage, or None if it was never recorded"""
+        with self._lock:
+            return self._stages.get(stage)
+
+    def frame_displayed(self):
+        self._frame_times.append(time.perf_counter())
+
+    def fps(self):
+        times = list(self._frame_times)
+        if len(times) < 2 or time.perf_counter() - times[-1] > 2.0:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def snapshot(self):
+        with self._lock:
+            stages = {name: histogram.snapshot() for name, histogram in self._stages.items()}
+        return {"timestamp": time.time(), "fps": self.fps(), "stages": stages}
+
+
+# Command priorities for the CommandExecutor: lower runs first
+PRIORITY_INPUT = 0
+PRIORITY_CAPTURE = 1
+PRIORITY_HOUSEKEEPING = 2
+
+# Per-thread context of the executor task currently running (its cancel event)
+_command_context = threading.local()
+
+
+class CommandCancelled(Exception):
+    """Raised inside a task when the user cancels it"""
+
+
+def current_cancel_event():
+    """Return the cancel event of the executor task running on this thread, if any"""
+    return getattr(_command_context, "cancel_event", None)
+
+
+def run_process(args, timeout=10, shell=False):
+    """subprocess.run() equivalent that aborts when the current executor task is cancelled"""
+    cancel_event = current_cancel_event()
+    if cancel_event is not None and cancel_event.is_set():
+        raise CommandCancelled()
+    process = subprocess.Popen(args, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=0.1 if cancel_event is not None else timeout)
+            return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                process.kill()
+                process.communicate()
+                raise CommandCancelled()
+            if time.time() >= deadline:
+                process.kill()
+                process.communicate()
+                raise subprocess.TimeoutExpired(args, timeout)
+
+
+class CommandExecutor:
+    """Bounded worker pool that runs device commands by priority.
+
+    Tasks are queued with a priority (input > capture > housekeeping) and run
+    on a fixed number of worker threads. Each returns a concurrent.futures
+    Future carrying a ``label`` and a ``cancel_event``; cancelling a queued task
+    drops it, cancelling a running one kills its adb process.
+    """
+
+    def __init__(self, workers=4):
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._active = set()
+        self._lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, fn, *args, priority=PRIORITY_HOUSEKEEPING, label=None, **kwargs):
+        from concurrent.futures import Future
+        future = Future()
+        future.label = label or getattr(fn, "__name__", "command")
+        future.priority = priority
+        future.cancel_event = threading.Event()
+        with self._lock:
+            self._active.add(future)
+        future.add_done_callback(self._forget)
+        self._queue.put((priority, next(self._order), future, fn, args, kwargs))
+        return future
+
+    def _forget(self, future):
+        with self._lock:
+            self._active.discard(future)
+
+    def pending(self, max_priority=None):
+        """Return queued and running futures, optionally only up to a priority"""
+        with self._lock:
+            return [f for f in self._active if max_priority is None or f.priority <= max_priority]
+
+    def cancel(self, future):
+        """Cancel a queued task, or signal a running one to abort"""
+        future.cancel_event.set()
+        future.cancel()
+
+    def cancel_all(self, min_priority=PRIORITY_INPUT):
+        for future in self.pending():
+            if future.priority >= min_priority:
+                self.cancel(future)
+
+    def _worker(self):
+        while True:
+            priority, _, future, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            _command_context.cancel_event = future.cancel_event
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                _command_context.cancel_event = None
+
+
+class TransportWatchdog:
+    """Watches the adb transport and the capture stream, and recovers them when they stall.
+
+    The capture loop calls frame_ok() after each good frame and report_failure()
+    after a failed capture or input. When frames stop for ``stall_deadline``
+    seconds or a failure is reported, the transport is probed (host:devices plus
+    a shell echo, each with a short timeout). A wedged transport is recovered by
+    escalating from reset_connections() to restart_server(), with exponential
+    backoff between attempts, for up to ``recover_timeout`` seconds before
+    giving up as offline; a device that has simply gone away is reported as
+    offline instead. While offline the transport is re-probed every
+    ``offline_probe_interval`` seconds, so a returning device is noticed even
+    before frames flow, and one that comes back wedged is recovered.
+    on_state(state, detail) is called on every change and
+    on_recovered(seconds) with the length of each outage, from the watchdog's
+    threads.
+    """
+    HEALTHY, STALLED, RECOVERING, OFFLINE = "healthy", "stalled", "recovering", "offline"
+
+    def __init__(self, client, restart_server, reset_connections, on_state=None, on_recovered=None,
+                 stall_deadline=2.0, probe_timeout=2.0, backoff_base=0.5, backoff_max=30.0,
+                 recover_timeout=120.0, offline_probe_interval=1.0):
+        self.client = client
+        self.restart_server = restart_server
+        self.reset_connections = reset_connections
+        self.on_state = on_state
+        self.on_recovered = on_recovered
+        self.stall_deadline = stall_deadline
+        self.probe_timeout = probe_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.recover_timeout = recover_timeout
+        self.offline_probe_interval = offline_probe_interval
+        self.state = self.HEALTHY
+        self.watching = False  # Only judge frame staleness while the capture loop expects frames
+        self.last_ok = time.monotonic()
+        self.recoveries = collections.deque(maxlen=100)  # Outage lengths in seconds
+        self._stalled_at = None
+        self._gave_up = False  # Recovery timed out: only a working probe or frame ends OFFLINE
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._healthy = threading.Event()
+        self._healthy.set()
+        self._stop = threading.Event()
+
+    @property
+    def recovering(self):
+        return self.state in (self.STALLED, self.RECOVERING)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _set_state(self, state, detail=""):
+        self.state = state
+        if state == self.HEALTHY or state == self.OFFLINE:
+            self._healthy.set()
+        else:
+            self._healthy.clear()
+        if self.on_state is not None:
+            self.on_state(state, detail)
+
+    def wait_healthy(self, timeout=None):
+        """Block until no recovery is under way; returns False on timeout"""
+        return self._healthy.wait(timeout)
+
+    def frame_ok(self):
+        """A frame arrived: the transport works"""
+        self.last_ok = time.monotonic()
+        self.watching = True
+        if self.state == self.OFFLINE:
+            with self._lock:
+                self._gave_up = False
+                self._set_state(self.HEALTHY)
+
+    def idle(self):
+        """The capture loop is not expecting frames (no device, capture stopped)"""
+        self.watching = False
+
+    def probe(self):
+        """Return "ok", "no-device" or "transport" (adb server or device connection wedged)"""
+        client = AdbClient(self.client.serial, self.client.host, self.client.port, timeout=self.probe_timeout)
+        try:
+            devices = client.devices()
+        except (OSError, AdbError):
+            return "transport"
+        if not any(state == "device" and self.client.serial in (None, serial) for serial, state in devices):
+            return "no-device"
+        try:
+            output = client.shell("echo y1")
+        except (OSError, AdbError):
+            return "transport"
+        return "ok" if "y1" in output else "transport"
+
+    def report_failure(self):
+        """A capture or input failed: probe now and start recovery if needed; returns the state"""
+        if self.state != self.HEALTHY:
+            return self.state
+        return self._check()
+
+    def _check(self):
+        result = self.probe()
+        with self._lock:
+            if self.state != self.HEALTHY:
+                return self.state
+            if result == "ok":
+                self.last_ok = time.monotonic()
+            elif result == "no-device":
+                self._set_state(self.OFFLINE, "device not attached")
+            else:
+                self._stalled_at = time.monotonic()
+                self._set_state(self.STALLED, "transport not responding")
+                self._wake.set()
+            return self.state
+
+    def _run(self):
+        last_offline_probe = 0.0
+        while not self._stop.is_set():
+            self._wake.wait(0.5)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if (self.state == self.HEALTHY and self.watching
+                    and time.monotonic() - self.last_ok > self.stall_deadline):
+                self._check()
+            if self.state == self.OFFLINE and time.monotonic() - last_offline_probe >= self.offline_probe_interval:
+                last_offline_probe = time.monotonic()
+                self._check_offline()
+            if self.state == self.STALLED:
+                self._recover()
+
+    def _check_offline(self):
+        """Re-probe while offline: back to healthy if the device answers, recover if it returned wedged"""
+        result = self.probe()
+        with self._lock:
+            if self.state != self.OFFLINE:
+                return
+            if result == "ok":
+                self._gave_up = False
+                self.last_ok = time.monotonic()
+                self._set_state(self.HEALTHY, "device attached")
+            elif result == "transport" and not self._gave_up:
+                self._stalled_at = time.monotonic()
+                self._set_state(self.STALLED, "transport not responding")
+
+    def _recover(self):
+        attempt = 0
+        while not self._stop.is_set():
+            result = self.probe()
+            if result == "ok":
+                break
+            if result == "no-device":
+                with self._lock:
+                    self._set_state(self.OFFLINE, "device not attached")
+                return
+            if time.monotonic() - self._stalled_at > self.recover_timeout:
+                with self._lock:
+                    self._gave_up = True
+                    self._set_state(self.OFFLINE, "recovery gave up; reconnect the device")
+                return
+            if attempt:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                self._set_state(self.RECOVERING, f"attempt {attempt} failed, retrying in {delay:.1f} s")
+                if self._stop.wait(delay):
+                    return
+            attempt += 1
+            try:
+                if attempt == 1:
+                    self._set_state(self.RECOVERING, "reconnecting")
+                    self.reset_connections()
+                else:
+                    self._set_state(self.RECOVERING, f"restarting adb server (attempt {attempt})")
+                    self.restart_server()
+            except Exception as e:
+                print(f"Transport recovery step failed: {e}")
+        else:
+            return
+        seconds = time.monotonic() - self._stalled_at
+        self.recoveries.append(seconds)
+        self.last_ok = time.monotonic()
+        with self._lock:
+            self._set_state(self.HEALTHY, f"recovered in {seconds:.1f} s")
+        if self.on_recovered is not None:
+            self.on_recovered(seconds)
+
+
+# Logcat streaming
+LOGCAT_LEVELS = "VDIWEF"
+
+
+def parse_logcat_line(line):
+    """Parse one `logcat -v threadtime` line into (time, pid, tid, level, tag, message), or None"""
+    # 07-14 12:01:02.345  1234  1250 I ActivityManager: Start proc ...
+    parts = line.split(None, 5)
+    if len(parts) < 6 or len(parts[4]) != 1 or parts[4] not in LOGCAT_LEVELS:
+        return None
+    try:
+        pid, tid = int(parts[2]), int(parts[3])
+    except ValueError:
+        return None
+    tag, sep, message = parts[5].partition(": ")
+    if not sep:
+        tag, message = parts[5].rstrip(":"), ""
+    return f"{parts[0]} {parts[1]}", pid, tid, parts[4], tag.strip(), message
+
+
+def parse_ps_pids(output, package):
+    """Return the pids of processes belonging to package (including :remote style subprocesses) from `ps`"""
+    pids = set()
+    for line in output.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) >= 2 and (fields[-1] == package or fields[-1].startswith(package + ":")):
+            try:
+                pids.add(int(fields[1]))
+            except ValueError:
+                pass
+    return pids
+
+
+class LogcatBuffer:
+    """Fixed-size ring of parsed logcat records with per-tag and per-pid indexes.
+
+    Records get increasing sequence numbers; the oldest are dropped once
+    ``capacity`` is reached. Index entries for dropped records are pruned when
+    queried and swept once per ``capacity`` appends, so memory stays bounded.
+    """
+
+    def __init__(self, capacity=50000):
+        self.capacity = capacity
+        self._ring = [None] * capacity  # Record seq lives at _ring[seq % capacity]
+        self._start_seq = 0  # Oldest seq still held (advances on clear and on overflow)
+        self.next_seq = 0
+        self.by_tag = collections.defaultdict(collections.deque)
+        self.by_pid = collections.defaultdict(collections.deque)
+        self._next_sweep = capacity
+        self.lock = threading.Lock()
+
+    def extend(self, parsed):
+        with self.lock:
+            for record in parsed:
+                seq = self.next_seq
+                self.next_seq += 1
+                self._ring[seq % self.capacity] = (seq,) + record
+                self.by_pid[record[1]].append(seq)
+                self.by_tag[record[4]].append(seq)
+            if self.next_seq >= self._next_sweep:
+                self._sweep()
+
+    def _sweep(self):
+        first_seq = self._first_seq()
+        for index in (self.by_tag, self.by_pid):
+            for key in list(index):
+                entries = index[key]
+                while entries and entries[0] < first_seq:
+                    entries.popleft()
+                if not entries:
+                    del index[key]
+        self._next_sweep = self.next_seq + self.capacity
+
+    def clear(self):
+        with self.lock:
+            self._start_seq = self.next_seq
+            self._ring = [None] * self.capacity
+            self.by_tag.clear()
+            self.by_pid.clear()
+
+    def tags(self):
+        with self.lock:
+            return sorted(self.by_tag)
+
+    def __len__(self):
+        return self.next_seq - self._first_seq()
+
+    def _first_seq(self):
+        return max(self._start_seq, self.next_seq - self.capacity)
+
+    def _indexed(self, index, keys, first_seq):
+        seqs = []
+        for key in keys:
+            entries = index.get(key)
+            if not entries:
+                continue
+            while entries and entries[0] < first_seq:
+                entries.popleft()
+            seqs.extend(entries)
+        return sorted(seqs)
+
+    def query(self, min_level="V", tags=None, pids=None, text=None, since_seq=0, limit=None):
+        """Return matching records with seq >= since_seq, oldest first (at most the newest `limit`)"""
+        level_floor = LOGCAT_LEVELS.index(min_level)
+        text = text.lower() if text else None
+        with self.lock:
+            first_seq = self._first_seq()
+            start = max(since_seq, first_seq)
+            if tags or pids:
+                # Narrow by whichever index gives the smaller candidate list
+                candidates = None
+                for index, keys in ((self.by_tag, tags), (self.by_pid, pids)):
+                    if keys:
+                        seqs = self._indexed(index, keys, first_seq)
+                        candidates = seqs if candidates is None or len(seqs) < len(candidates) else candidates
+                rows = (self._ring[seq % self.capacity] for seq in candidates if seq >= start)
+            else:
+                rows = (self._ring[seq % self.capacity] for seq in range(start, self.next_seq))
+            result = []
+            for row in rows:
+                if LOGCAT_LEVELS.index(row[4]) < level_floor:
+                    continue
+                if tags and row[5] not in tags:
+                    continue
+                if pids and row[2] not in pids:
+                    continue
+                if text and text not in row[6].lower() and text not in row[5].lower():
+                    continue
+                result.append(row)
+        return result[-limit:] if limit else result
+
+
+class LogcatStream:
+    """Reads `logcat -v threadtime` over one adb shell connection into a LogcatBuffer"""
+
+    def __init__(self, client, buffer):
+        self.client = client
+        self.buffer = buffer
+        self.running = False
+        self.error = None
+        self._sock = None
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        import socket
+        self.running = False
+        sock = self._sock
+        if sock is not None:
+            # shutdown() wakes the reader blocked in recv(); close() alone leaves it waiting for data
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _run(self):
+        try:
+            self._sock = self.client.open_service("shell:logcat -v threadtime")
+            if not self.running:
+                self.stop()  # Stopped while connecting
+                return
+            self._sock.settimeout(None)
+            pending = b""
+            while self.running:
+                chunk = self._sock.recv(65536)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                parsed = []
+                for line in lines:
+                    record = parse_logcat_line(line.rstrip(b"\r").decode("utf-8", errors="replace"))
+                    if record is not None:
+                        parsed.append(record)
+                # One lock acquisition per chunk keeps bursts cheap
+                self.buffer.extend(parsed)
+        except (AdbError, OSError) as e:
+            if self.running:
+                self.error = str(e)
+                print(f"Logcat stream error: {e}")
+        finally:
+            self.running = False
+
+
+# Profile rows of `dumpsys gfxinfo`: a Draw/.../Execute header, then one line of times per frame
+GFXINFO_ROWS = re.compile(r"^[ \t]*Draw\b[^\n]*\bExecute[ \t]*\n((?:[ \t]*\d[\d. \t]*\n?)+)", re.M)
+GFXINFO_COUNTERS = re.compile(r"^\s*(Total frames rendered|Janky frames):\s*(\d+)", re.M)
+FRAME_BUDGET_MS = 1000.0 / 60
+
+
+def gfxinfo_frame_times(output):
+    """Per-frame render times in ms from a gfxinfo dump, as a numpy array.
+
+    Each block of rows is converted in one numpy call instead of line by
+    line, so dumps with thousands of frames parse in well under a millisecond.
+    """
+    import numpy as np
+    chunks = []
+    for match in GFXINFO_ROWS.finditer(output):
+        rows = match.group(1)
+        columns = len(rows[:rows.find("\n")].split())
+        values = np.fromstring(rows, dtype=np.float64, sep=" ")
+        if columns and values.size % columns == 0:
+            chunks.append(values.reshape(-1, columns).sum(axis=1))
+    return np.concatenate(chunks) if chunks else np.zeros(0)
+
+
+def parse_gfxinfo(output):
+    """Parse `dumpsys gfxinfo <package>` into frame counters and per-frame times in ms.
+
+    Android 4.x prints (and then clears) up to 128 rows of Draw/Process/Execute
+    times; newer releases add Prepare and the cumulative "Total frames
+    rendered"/"Janky frames" counters, which are None when absent.
+    """
+    counters = dict(GFXINFO_COUNTERS.findall(output))
+    return {
+        "total_frames": int(counters["Total frames rendered"]) if "Total frames rendered" in counters else None,
+        "janky_frames": int(counters["Janky frames"]) if "Janky frames" in counters else None,
+        "frame_ms": gfxinfo_frame_times(output).tolist(),
+    }
+
+
+def jank_stats(frame_ms, budget_ms=FRAME_BUDGET_MS):
+    """Summarise frame times: count, mean, percentiles and frames over one and two frame budgets"""
+    import numpy as np
+    frame_ms = np.asarray(frame_ms, dtype=np.float64)
+    if not frame_ms.size:
+        return {"frames": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p90_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0,
+                "max_ms": 0.0, "over_budget": 0, "over_2x_budget": 0, "jank_percent": 0.0}
+    p50, p90, p95, p99 = np.percentile(frame_ms, [50, 90, 95, 99])
+    over = int(np.count_nonzero(frame_ms > budget_ms))
+    return {
+        "frames": int(frame_ms.size),
+        "mean_ms": float(frame_ms.mean()),
+        "p50_ms": float(p50), "p90_ms": float(p90), "p95_ms": float(p95), "p99_ms": float(p99),
+        "max_ms": float(frame_ms.max()),
+        "over_budget": over,
+        "over_2x_budget": int(np.count_nonzero(frame_ms > 2 * budget_ms)),
+        "jank_percent": 100.0 * over / frame_ms.size,
+    }
+
+
+class GfxFrameLog:
+    """Frame times accumulated from successive gfxinfo dumps.
+
+    Each dump is parsed once when fed and kept as an array chunk; the chunks
+    are joined only when ``frames`` is read, so a long run never re-parses
+    or copies what it already has.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._frames = None
+
+    def feed(self, output):
+        """Add the frames of one dump (taken with `reset`, so dumps never overlap); returns the count"""
+        chunk = gfxinfo_frame_times(output)
+        if chunk.size:
+            self._chunks.append(chunk)
+            self._frames = None
+        return int(chunk.size)
+
+    @property
+    def frames(self):
+        import numpy as np
+        if self._frames is None:
+            self._frames = np.concatenate(self._chunks) if self._chunks else np.zeros(0)
+        return self._frames
+
+    def stats(self, budget_ms=FRAME_BUDGET_MS):
+        return jank_stats(self.frames, budget_ms)
+
+
+def run_jank_scroll(client, package, send_keys, keycodes, interval=0.12, dump_interval=1.0):
+    """Press ``keycodes`` at a steady pace while collecting the app's frame times.
+
+    gfxinfo is reset before the run and dumped (with reset) every
+    ``dump_interval`` seconds, well before the 128-frame profile buffer of
+    Android 4.x can wrap. Returns a GfxFrameLog; raises CommandCancelled.
+    """
+    log = GfxFrameLog()
+    dump = f"dumpsys gfxinfo {package} reset"
+    client.shell(dump)  # Discard frames drawn before the run
+    cancel = current_cancel_event()
+    next_dump = time.perf_counter() + dump_interval
+    for keycode in keycodes:
+        if cancel is not None and cancel.is_set():
+            raise CommandCancelled()
+        send_keys([keycode])
+        if time.perf_counter() >= next_dump:
+            log.feed(client.shell(dump))
+            next_dump = time.perf_counter() + dump_interval
+        time.sleep(interval)
+    time.sleep(0.5)  # Let the last scroll animation settle
+    log.feed(client.shell(dump))
+    return log
+
+
+def parse_profiler_sample(lines, pid):
+    """Parse one profiler block (/proc/uptime, /proc/stat, /proc/<pid>/stat and status, gfxinfo).
+
+    Returns raw counters: uptime (s), cpu_total and cpu_idle (jiffies over
+    all CPUs), proc_jiffies (None once the process is gone), rss_kb,
+    vmsize_kb, threads and gfx (from parse_gfxinfo, or None).
+    """
+    sample = {"uptime": None, "cpu_total": None, "cpu_idle": None, "proc_jiffies": None,
+              "rss_kb": None, "vmsize_kb": None, "threads": None, "gfx": None}
+    prefix = f"{pid} ("
+    gfx_lines = None
+    for line in lines:
+        if gfx_lines is not None:
+            gfx_lines.append(line)
+        elif line == "@@gfx":
+            gfx_lines = []
+        elif sample["uptime"] is None and line[:1].isdigit() and not line.startswith(prefix):
+            sample["uptime"] = float(line.split()[0])
+        elif line.startswith("cpu "):
+            values = [int(v) for v in line.split()[1:]]
+            sample["cpu_total"] = sum(values[:7])
+            sample["cpu_idle"] = values[3] + (values[4] if len(values) > 4 else 0)
+        elif line.startswith(prefix):
+            # Fields after the parenthesised command name; utime and stime are 14th and 15th overall
+            fields = line.rsplit(")", 1)[1].split()
+            sample["proc_jiffies"] = int(fields[11]) + int(fields[12])
+        elif line.startswith("VmRSS:"):
+            sample["rss_kb"] = int(line.split()[1])
+        elif line.startswith("VmSize:"):
+            sample["vmsize_kb"] = int(line.split()[1])
+        elif line.startswith("Threads:"):
+            sample["threads"] = int(line.split()[1])
+    if gfx_lines is not None:
+        sample["gfx"] = parse_gfxinfo("\n".join(gfx_lines))
+    return sample
+
+
+class DeviceProfiler:
+    """Samples one app's CPU, memory and frame stats over a single streaming adb shell.
+
+    A shell loop on the device prints /proc counters and `dumpsys gfxinfo`
+    every ``interval`` seconds between marker lines, so sampling costs no
+    host process or adb connection per sample. Each parsed sample (a dict
+    of the CSV_FIELDS) is appended to ``samples`` and passed to
+    ``on_sample`` from the reader thread.
+    """
+    CSV_FIELDS = ("time", "cpu_total", "cpu_app", "rss_kb", "vmsize_kb", "threads",
+                  "frames", "frame_ms", "frame_ms_max")
+
+    def __init__(self, client, package, pid, interval=1, frames=True, on_sample=None, history=3600):
+        self.client = client
+        self.package = package
+        self.pid = int(pid)
+        self.interval = max(1, int(interval))  # Toolbox sleep only takes whole seconds
+        self.frames = frames
+        self.on_sample = on_sample
+        self.samples = collections.deque(maxlen=history)
+        self.running = False
+        self.error = None
+        self._sock = None
+        self._previous = None
+
+    def script(self):
+        gfx = f"echo @@gfx; dumpsys gfxinfo {self.package}; " if self.frames else ""
+        return (f"while true; do echo @@begin; cat /proc/uptime /proc/stat /proc/{self.pid}/stat "
+                f"/proc/{self.pid}/status 2>/dev/null; {gfx}echo @@end; sleep {self.interval}; done")
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        import socket
+        self.running = False
+        sock = self._sock
+        if sock is not None:
+            # As in LogcatStream.stop(): shutdown() is what wakes the blocked reader
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _run(self):
+        try:
+            self._sock = self.client.open_service("shell:" + self.script())
+            if not self.running:
+                self.stop()  # Stopped while connecting
+                return
+            self._sock.settimeout(None)
+            pending = b""
+            block = None
+            while self.running:
+                chunk = self._sock.recv(65536)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    line = line.rstrip(b"\r").decode("utf-8", errors="replace")
+                    if line == "@@begin":
+                        block = []
+                    elif line == "@@end" and block is not None:
+                        self._add(parse_profiler_sample(block, self.pid))
+                        block = None
+                    elif block is not None:
+                        block.append(line)
+        except (AdbError, OSError) as e:
+            if self.running:
+                self.error = str(e)
+                print(f"Profiler stream error: {e}")
+        finally:
+            self.running = False
+
+    def _add(self, raw):
+        """Turn raw counters into a sample using the deltas since the previous block"""
+        previous, self._previous = self._previous, raw
+        if raw["proc_jiffies"] is None:
+            self.error = f"Process {self.pid} has exited"
+            self.running = False
+            return
+        if previous is None or raw["cpu_total"] is None or raw["cpu_total"] <= previous["cpu_total"]:
+            return
+        total = raw["cpu_total"] - previous["cpu_total"]
+        sample = {
+            "time": raw["uptime"],
+            "cpu_total": 100.0 * (1.0 - (raw["cpu_idle"] - previous["cpu_idle"]) / total),
+            "cpu_app": 100.0 * (raw["proc_jiffies"] - previous["proc_jiffies"]) / total,
+            "rss_kb": raw["rss_kb"],
+            "vmsize_kb": raw["vmsize_kb"],
+            "threads": raw["threads"],
+            "frames": None, "frame_ms": None, "frame_ms_max": None,
+        }
+        gfx = raw["gfx"]
+        if gfx is not None:
+            frame_ms = gfx["frame_ms"]
+            if gfx["total_frames"] is not None and previous["gfx"] and previous["gfx"]["total_frames"] is not None:
+                sample["frames"] = max(0, gfx["total_frames"] - previous["gfx"]["total_frames"])
+            else:
+                sample["frames"] = len(frame_ms)  # Android 4.x clears the rows on every dump
+            if frame_ms:
+                sample["frame_ms"] = sum(frame_ms) / len(frame_ms)
+                sample["frame_ms_max"] = max(frame_ms)
+        self.samples.append(sample)
+        if self.on_sample is not None:
+            self.on_sample(sample)
+
+    def write_csv(self, path):
+        import csv
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.CSV_FIELDS)
+            writer.writeheader()
+            for sample in list(self.samples):
+                writer.writerow({k: ("" if v is None else round(v, 3) if isinstance(v, float) else v)
+                                 for k, v in sample.items()})
+
+
+# UI hierarchy (uiautomator dump) parsing and hit testing
+UI_DUMP_PATH = "/sdcard/y1_helper_ui.xml"
+UI_STALE_DIFF_RATIO = 0.08  # Share of the screen that must change before a dump counts as stale
+UI_DUMP_MIN_INTERVAL = 2.0  # Seconds between uiautomator dumps; each one loads the Y1 for a while
+
+
+def frame_signature(img_rgb, factor=8):
+    """Small grayscale thumbnail of a frame (numpy array) for cheap "has the layout changed" checks"""
+    import numpy as np
+    return np.asarray(img_rgb.convert("L").reduce(factor), dtype=np.int16)
+
+
+def signature_diff_ratio(a, b, threshold=24):
+    """Fraction of thumbnail pixels that differ noticeably between two frame signatures (1.0 if sizes differ)"""
+    import numpy as np
+    if a.shape != b.shape:
+        return 1.0
+    return float(np.count_nonzero(np.abs(a - b) > threshold)) / a.size
+
+
+def parse_ui_hierarchy(xml_text):
+    """Parse a uiautomator dump into a list of element dicts (document order).
+
+    Each element has bounds (x0, y0, x1, y1), id, text, desc, class, package,
+    clickable, focusable, focused, selected, depth and parent (list index or None).
+    """
+    import re
+    import xml.etree.ElementTree as ET
+    bounds_re = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+    elements = []
+
+    def walk(node, depth, parent):
+        for child in node:
+            if child.tag != "node":
+                continue
+            match = bounds_re.match(child.get("bounds", ""))
+            index = parent
+            if match:
+                x0, y0, x1, y1 = (int(v) for v in match.groups())
+                index = len(elements)
+                elements.append({
+                    "bounds": (x0, y0, x1, y1),
+                    "id": child.get("resource-id", ""),
+                    "text": child.get("text", ""),
+                    "desc": child.get("content-desc", ""),
+                    "class": child.get("class", ""),
+                    "package": child.get("package", ""),
+                    "clickable": child.get("clickable") == "true",
+                    "focusable": child.get("focusable") == "true",
+                    "focused": child.get("focused") == "true",
+                    "selected": child.get("selected") == "true",
+                    "depth": depth,
+                    "parent": parent,
+                })
+            walk(child, depth + 1, index)
+
+    walk(ET.fromstring(xml_text), 0, None)
+    return elements
+
+
+def describe_ui_element(element):
+    """Short human-readable name for an element (for the status bar)"""
+    kind = element["class"].rsplit(".", 1)[-1] or "View"
+    label = element["text"] or element["desc"]
+    name = f"{kind} '{label}'" if label else kind
+    if element["id"]:
+        name += f" ({element['id'].split('/')[-1]})"
+    return name
+
+
+class UiElementIndex:
+    """Spatial index over UI element bounds for O(log n) hit testing.
+
+    The screen is split into vertical slabs at every distinct left/right edge;
+    each slab holds the y edges of the elements spanning it and, per y cell,
+    the deepest element covering that cell. A lookup is two bisections.
+    Elements are also indexed by resource id and text for script targeting.
+    """
+
+    def __init__(self, elements, frame_hash=None, signature=None):
+        import bisect
+        self._bisect = bisect.bisect_right
+        self.elements = elements
+        self.frame_hash = frame_hash
+        self.signature = signature  # frame_signature() of the screen the dump describes
+        self.by_id = collections.defaultdict(list)
+        self.by_text = collections.defaultdict(list)
+        for element in elements:
+            if element["id"]:
+                self.by_id[element["id"]].append(element)
+                self.by_id[element["id"].split("/")[-1]].append(element)
+            for label in (element["text"], element["desc"]):
+                if label:
+                    self.by_text[label].append(element)
+        visible = [e for e in elements if e["bounds"][2] > e["bounds"][0] and e["bounds"][3] > e["bounds"][1]]
+        self.xs = sorted({e["bounds"][0] for e in visible} | {e["bounds"][2] for e in visible})
+        self.slabs = []
+        for left, right in zip(self.xs, self.xs[1:]):
+            spanning = [e for e in visible if e["bounds"][0] <= left and e["bounds"][2] >= right]
+            ys = sorted({e["bounds"][1] for e in spanning} | {e["bounds"][3] for e in spanning})
+            cells = []
+            for top, bottom in zip(ys, ys[1:]):
+                covering = [e for e in spanning if e["bounds"][1] <= top and e["bounds"][3] >= bottom]
+                cells.append(max(covering, key=self._stacking) if covering else None)
+            self.slabs.append((ys, cells))
+
+    @staticmethod
+    def _stacking(element):
+        # Deeper elements draw on top; among siblings prefer the smaller one
+        x0, y0, x1, y1 = element["bounds"]
+        return element["depth"], -(x1 - x0) * (y1 - y0)
+
+    def element_at(self, x, y):
+        """Return the topmost element containing device pixel (x, y), or None"""
+        i = self._bisect(self.xs, x) - 1
+        if i < 0 or i >= len(self.slabs):
+            return None
+        ys, cells = self.slabs[i]
+        j = self._bisect(ys, y) - 1
+        if j < 0 or j >= len(cells):
+            return None
+        return cells[j]
+
+    def clickable_at(self, x, y):
+        """Return the element a tap at (x, y) would activate: the hit element or its nearest clickable ancestor"""
+        element = self.element_at(x, y)
+        hit = element
+        while element is not None and not (element["clickable"] or element["focusable"]):
+            element = self.elements[element["parent"]] if element["parent"] is not None else None
+        return element or hit
+
+    def find(self, resource_id=None, text=None):
+        """Return the first element matching a resource id (full or short form) and/or text/description"""
+        candidates = self.by_id.get(resource_id, []) if resource_id else self.by_text.get(text, [])
+        for element in candidates:
+            if text is None or text in (element["text"], element["desc"]):
+                return element
+        return None
+
+    @staticmethod
+    def center(element):
+        x0, y0, x1, y1 = element["bounds"]
+        return (x0 + x1) // 2, (y0 + y1) // 2
+
+
+# Persistent input injection (monkey --port) and gesture streaming
+MONKEY_PORT = 1080
+INPUT_MAX_PENDING = 16  # Queued input events beyond which repeats of the same key are dropped
+INPUT_RECOVERY_WAIT = 10.0  # Seconds a failed input batch waits for transport recovery before it is dropped
+INPUT_MAX_AGE = 3.0  # Seconds after which input held back by an outage is dropped instead of replayed
+LONG_PRESS_KEYCODES = (4, 23, 66)  # BACK, DPAD_CENTER, ENTER: held on the device until released
+
+
+class MonkeyChannel:
+    """Persistent event injection through `monkey --port` on the device.
+
+    Monkey's network mode (available on Android 4.2) accepts line commands such
+    as ``touch down x y``, ``touch move x y``, ``key down 23`` and replies OK to
+    each, so dense event streams cost one socket write rather than one adb
+    process per event. The device port is reached through adbd's tcp: service,
+    so no port forward is needed.
+    """
+
+    def __init__(self, client, port=MONKEY_PORT, start_timeout=8.0):
+        self.client = client
+        self.port = port
+        self.start_timeout = start_timeout
+        self._monkey = None
+        self._sock = None
+        self._reader = None
+        self.lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        """Start monkey on the device if needed and open the command socket"""
+        if self._sock is not None:
+            return
+        try:
+            self._open()
+        except (AdbError, OSError):
+            # Monkey is not listening yet: start it and retry while it boots
+            self._monkey = self.client.open_service(f"shell:monkey --port {self.port}")
+            deadline = time.time() + self.start_timeout
+            while True:
+                time.sleep(0.25)
+                try:
+                    self._open()
+                    return
+                except (AdbError, OSError):
+                    if time.time() >= deadline:
+                        self.close()
+                        raise AdbError("monkey did not start on the device")
+
+    def _open(self):
+        sock = self.client.open_service(f"tcp:{self.port}")
+        reader = sock.makefile("rb")
+        try:
+            sock.sendall(b"wake\n")
+            if not reader.readline().startswith(b"OK"):
+                raise AdbError("monkey did not answer")
+        except (AdbError, OSError):
+            reader.close()
+            sock.close()
+            raise
+        self._sock, self._reader = sock, reader
+
+    def send(self, commands):
+        """Send command lines in one write and wait for all replies; returns False if any failed"""
+        if not commands:
+            return True
+        with self.lock:
+            self.connect()
+            try:
+                self._sock.sendall("".join(f"{command}\n" for command in commands).encode())
+                replies = [self._reader.readline() for _ in commands]
+            except OSError:
+                self.close()
+                raise
+        if not all(replies):
+            self.close()
+            raise AdbError("monkey connection closed")
+        return all(reply.startswith(b"OK") for reply in replies)
+
+    def close(self):
+        for resource in (self._reader, self._sock, self._monkey):
+            if resource is not None:
+                try:
+                    resource.close()
+                except OSError:
+                    pass
+        self._reader = self._sock = self._monkey = None
+
+
+def interpolate_points(start, end, max_step=8):
+    """Points after start up to and including end, at most max_step device pixels apart"""
+    (x0, y0), (x1, y1) = start, end
+    steps = max(1, int(max(abs(x1 - x0), abs(y1 - y0)) / max_step + 0.999))
+    return [(round(x0 + (x1 - x0) * i / steps), round(y0 + (y1 - y0) * i / steps)) for i in range(1, steps + 1)]
+
+
+class GestureInjector:
+    """Streams pointer gestures and held keys to the device in order.
+
+    Events are queued from the Tk thread with their host timestamps, either
+    to the injector's own thread or, when ``enqueue(event, trace)`` is given,
+    to an ordered input queue that calls ``handle`` for each one in turn. A
+    latency trace id can ride along with each event; on the injector's own
+    thread it is passed to ``on_injected(trace, started, finished, success)``
+    once the event is sent. Touch
+    moves are interpolated to at most ``max_step`` pixels apart and spread
+    over the time the pointer actually took, then written to a MonkeyChannel.
+    When monkey is unavailable, a gesture falls back to one ``input swipe`` on
+    release, and a held key whose press could not be sent becomes a plain
+    keyevent on release (its press reports ``DEFERRED``). ``handle`` reports
+    failure whenever an event did not reach the device.
+    """
+    DEFERRED = "deferred until release"
+
+    def __init__(self, channel, fallback, max_step=8, max_segment=0.05, enqueue=None, on_injected=None):
+        self.channel = channel
+        self.fallback = fallback  # fallback(shell_command) runs an adb shell command, returns (success, stdout, stderr)
+        self.max_step = max_step
+        self.max_segment = max_segment
+        self.monkey_retry_at = 0.0  # When to try monkey again after it failed
+        self.use_monkey = True  # False when input commands measured faster on this device
+        self._last_point = self._last_time = self._gesture_start = self._gesture_start_time = None
+        self._deferred_keys = set()  # Held keycodes whose press did not go over monkey
+        self.enqueue = enqueue
+        self.on_injected = on_injected
+        if enqueue is None:
+            self.events = queue.Queue()
+            self.enqueue = lambda event, trace: self.events.put((event, trace))
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def touch(self, action, x, y, timestamp=None, trace=None):
+        self.enqueue(("touch", action, int(x), int(y), timestamp or time.perf_counter()), trace)
+
+    def key(self, action, keycode, timestamp=None, trace=None):
+        self.enqueue(("key", action, int(keycode), 0, timestamp or time.perf_counter()), trace)
+
+    def inject(self, commands):
+        """Send monkey commands directly (any thread); returns False if monkey is unavailable"""
+        return self._send(commands)
+
+    def _send(self, commands):
+        if self.use_monkey and time.time() >= self.monkey_retry_at:
+            try:
+                return self.channel.send(commands)
+            except (AdbError, OSError) as e:
+                print(f"Monkey injection unavailable, using input commands: {e}")
+                self.monkey_retry_at = time.time() + 30
+        return False
+
+    def _run(self):
+        while True:
+            event, trace = self.events.get()
+            started = time.perf_counter()
+            success, _ = self.handle(event)
+            if trace is not None and self.on_injected is not None:
+                self.on_injected(trace, started, time.perf_counter(), success)
+
+    def handle(self, event):
+        """Inject one queued event on the calling thread; returns (success, error)"""
+        kind, action, a, b, timestamp = event
+        try:
+            if kind == "key":
+                return self._handle_key(action, a)
+            point = (a, b)
+            if action == "down":
+                self._gesture_start, self._gesture_start_time = point, timestamp
+                self._send([f"touch down {a} {b}"])
+            elif self._last_point is not None:
+                # Spread interpolated moves over the pointer's own interval (capped, so we never lag far behind)
+                points = interpolate_points(self._last_point, point, self.max_step)
+                interval = min(max(timestamp - self._last_time, 0.0), self.max_segment) / len(points)
+                due = time.perf_counter()
+                for x, y in points[:-1]:
+                    if not self._send([f"touch move {x} {y}"]):
+                        break
+                    # Pace against a deadline so each move's round trip is not added on top of the spacing
+                    due += interval
+                    time.sleep(max(0.0, due - time.perf_counter()))
+                commands = [f"touch move {a} {b}"] + ([f"touch up {a} {b}"] if action == "up" else [])
+                if not self._send(commands) and action == "up" and self._gesture_start is not None:
+                    duration = max(1, int((timestamp - self._gesture_start_time) * 1000))
+                    x0, y0 = self._gesture_start
+                    self._last_point = self._last_time = None
+                    success, _, stderr = self.fallback(f"input swipe {x0} {y0} {a} {b} {duration}")
+                    return success, stderr
+            self._last_point, self._last_time = (None, None) if action == "up" else (point, timestamp)
+            return True, ""
+        except Exception as e:
+            print(f"Gesture injection error: {e}")
+            return False, str(e)
+
+    def _handle_key(self, action, keycode):
+        if action == "down":
+            if self._send([f"key down {keycode}"]):
+                self._deferred_keys.discard(keycode)
+                return True, ""
+            self._deferred_keys.add(keycode)
+            return False, self.DEFERRED
+        if keycode in self._deferred_keys:
+            # The press never reached the device, so send the whole key press now
+            self._deferred_keys.discard(keycode)
+            success, _, stderr = self.fallback(f"input keyevent {keycode}")
+            return success, stderr
+        if self._send([f"key up {keycode}"]):
+            return True, ""
+        return False, "key release not delivered"
+
+
+# Android keycodes used by scripts (snapshot suites, jank runs) and remote input
+KEYCODES = {
+    "HOME": 3, "BACK": 4,
+    "DPAD_UP": 19, "DPAD_DOWN": 20, "DPAD_LEFT": 21, "DPAD_RIGHT": 22, "DPAD_CENTER": 23,
+    "ENTER": 66, "MENU": 82,
+    "MEDIA_PLAY_PAUSE": 85, "MEDIA_NEXT": 87, "MEDIA_PREVIOUS": 88,
+    "APP_SWITCH": 187,
+}
+
+
+
+def map_key(keysym, launcher_mode=False):
+    """Map a Tk keysym to (Android keycode, label) for remote control, or None"""
+    key = keysym.lower()
+    dpad_map = {
+        'w': 19, 'up': 19,
+        's': 20, 'down': 20,
+        'a': 21, 'left': 21,
+        'd': 22, 'right': 22
+    }
+    direction_map = {
+        19: 'up', 20: 'down', 21: 'left', 22: 'right'
+    }
+    if key in dpad_map:
+        keycode = dpad_map[key]
+        if launcher_mode:
+            # Y1 launcher lists scroll horizontally
+            keycode = {19: 21, 20: 22}.get(keycode, keycode)
+        return keycode, direction_map[keycode]
+    if key in ['return', 'e', 'shift_r']:
+        return (66, "enter") if launcher_mode else (23, "center")
+    if key in ['q', 'slash', 'Escape']:
+        return 4, "back"
+    if key == 'space':
+        return 85, "play/pause"
+    if key == 'prior':
+        return 87, "next"
+    if key == 'next':
+        return 88, "previous"
+    return None
+
+def describe_key_runs(keycodes):
+    """Summarise a key batch as counted runs, e.g. 'DPAD_DOWN x7, ENTER'"""
+    names = {code: name for name, code in KEYCODES.items()}
+    runs = []
+    for keycode, group in itertools.groupby(keycodes):
+        count = len(list(group))
+        name = names.get(keycode, str(keycode))
+        runs.append(f"{name} x{count}" if count > 1 else name)
+    return ", ".join(runs)
+
+
+class InputQueue:
+    """Ordered device input with burst coalescing and one batch in flight.
+
+    While a batch is being injected, new events queue up, and consecutive key
+    presses are then sent together as one batch (up to ``max_batch`` keys).
+    Because only one batch is outstanding, the device is never sent input
+    faster than it can process it. Once ``max_pending`` events are waiting, a
+    key that repeats the last queued one (keyboard auto-repeat) is dropped, so
+    the device stops soon after the key is let go; other events are never
+    dropped. Gesture events (touch moves, held keys) go through the same queue
+    so they stay in order with key presses and commands.
+    ``send_keys(keycodes)``, ``send_command(command)`` and
+    ``send_gesture(event)`` return (success, error);
+    ``on_batch(items, success, error, started, finished)``
+    is called after each batch from the queue's thread, with the
+    perf_counter times the batch was handed to and returned from the sender.
+    If ``retry_failed(error)`` returns True for a failed batch, the batch goes
+    back to the front of the queue and is sent again (it may block, e.g. until
+    the transport has recovered, while new events queue up behind it). Before
+    the replay, events queued more than ``max_age`` seconds earlier are dropped
+    and reported to ``on_batch`` as failed, so an outage is not followed by a
+    burst of stale input.
+    """
+
+    def __init__(self, send_keys, send_command, on_batch=None, max_batch=20, retry_failed=None,
+                 send_gesture=None, max_pending=None, max_age=None):
+        self.send_keys = send_keys
+        self.send_command = send_command
+        self.send_gesture = send_gesture
+        self.on_batch = on_batch
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.retry_failed = retry_failed
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def key(self, keycode, success_message=None, failure_message=None, on_success=None, trace=None):
+        """Queue a key press; returns False if it was dropped as surplus auto-repeat"""
+        keycode = int(keycode)
+        with self._condition:
+            if (self.max_pending is not None and len(self._items) >= self.max_pending
+                    and self._items[-1][0] == "key" and self._items[-1][1] == keycode):
+                return False
+        self._put(("key", keycode, success_message, failure_message, on_success, trace, time.monotonic()))
+        return True
+
+    def command(self, command, success_message=None, failure_message=None, on_success=None, trace=None):
+        self._put(("command", command, success_message, failure_message, on_success, trace, time.monotonic()))
+
+    def gesture(self, event, trace=None):
+        self._put(("gesture", event, None, None, None, trace, time.monotonic()))
+
+    def _put(self, item):
+        with self._condition:
+            self._items.append(item)
+            self._condition.notify()
+
+    def pending(self):
+        with self._condition:
+            return len(self._items)
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._items:
+                self._condition.wait()
+            batch = [self._items.popleft()]
+            if batch[0][0] == "key":
+                while self._items and self._items[0][0] == "key" and len(batch) < self.max_batch:
+                    batch.append(self._items.popleft())
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            try:
+                if batch[0][0] == "key":
+                    success, error = self.send_keys([item[1] for item in batch])
+                elif batch[0][0] == "gesture":
+                    success, error = self.send_gesture(batch[0][1])
+                else:
+                    success, error = self.send_command(batch[0][1])
+            except Exception as e:
+                success, error = False, str(e)
+            if not success and self.retry_failed is not None and self.retry_failed(error):
+                stale = []
+                with self._condition:
+                    self._items.extendleft(reversed(batch))
+                    if self.max_age is not None:
+                        # Queue order is age order, so stale events are a prefix
+                        cutoff = time.monotonic() - self.max_age
+                        while self._items and self._items[0][6] < cutoff:
+                            stale.append(self._items.popleft())
+                if stale and self.on_batch is not None:
+                    now = time.perf_counter()
+                    self.on_batch(stale, False, "input older than the outage dropped", now, now)
+                continue
+            if self.on_batch is not None:
+                self.on_batch(batch, success, error, started, time.perf_counter())
+
+
+class LatencyTracer:
+    """Input-to-photon latency: follows each input event to the first frame that changed.
+
+    ``begin`` stamps an event when it is handled, ``injected`` when the input
+    queue has sent it, ``frame`` as each capture is decoded and ``displayed``
+    once that frame is on the canvas. An event completes on the first frame
+    whose pull started after its injection began and whose hash differs from
+    the frame before it; events with no visible change expire after
+    ``timeout`` seconds. All times are perf_counter seconds.
+    """
+    STAGES = ("queue", "inject", "device", "pull", "decode", "render")
+
+    def __init__(self, timeout=3.0, history=1000, on_complete=None):
+        self.timeout = timeout
+        self.on_complete = on_complete
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.results = collections.deque(maxlen=history)
+        self.spans = collections.deque(maxlen=history * 8)  # (name, thread, start, end, args)
+        self._pending = collections.OrderedDict()  # trace id -> trace dict, in begin order
+        self._frames = collections.OrderedDict()  # frame token -> (pull_start, pull_end, decode_end, traces)
+        self._ids = itertools.count(1)
+        self._last_hash = None
+        self._lock = threading.Lock()
+
+    def begin(self, label):
+        """Start tracing an input event; returns its trace id, or None while disabled"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            trace_id = next(self._ids)
+            self._pending[trace_id] = {"id": trace_id, "label": label, "begin": time.perf_counter(),
+                                       "baseline": self._last_hash, "inject_start": None, "inject_end": None}
+            return trace_id
+
+    def injected(self, trace_id, started, finished, success=True):
+        with self._lock:
+            trace = self._pending.get(trace_id)
+            if trace is None:
+                return
+            if not success:
+                del self._pending[trace_id]
+                return
+            trace["inject_start"], trace["inject_end"] = started, finished
+
+    def frame(self, pull_start, pull_end, decode_end, frame_hash):
+        """Record a decoded frame and match it to waiting events; returns a token for ``displayed``"""
+        expired = []
+        with self._lock:
+            if not self.enabled and not self._pending:
+                self._last_hash = frame_hash
+                return None
+            self.spans.append(("pull", "capture", pull_start, pull_end, None))
+            self.spans.append(("decode", "capture", pull_end, decode_end, None))
+            matched = []
+            for trace_id, trace in list(self._pending.items()):
+                if trace["inject_start"] is not None and pull_start >= trace["inject_start"]:
+                    if frame_hash != trace["baseline"]:
+                        matched.append(self._pending.pop(trace_id))
+                else:
+                    # Frames from before the injection cannot show it; compare against the latest one
+                    trace["baseline"] = frame_hash
+                if trace_id in self._pending and decode_end - trace["begin"] > self.timeout:
+                    expired.append(self._pending.pop(trace_id))
+            token = next(self._ids)
+            self._frames[token] = (pull_start, pull_end, decode_end, matched)
+            while len(self._frames) > 32:
+                self._frames.popitem(last=False)
+            self._last_hash = frame_hash
+        for trace in expired:
+            self._finish(trace, None, None)
+        return token
+
+    def displayed(self, token, shown):
+        """Mark the frame behind ``token`` as drawn, completing the events it answered"""
+        with self._lock:
+            frame = self._frames.pop(token, None)
+            if frame is None:
+                return
+            pull_start, pull_end, decode_end, matched = frame
+            self.spans.append(("render", "display", decode_end, shown, None))
+        for trace in matched:
+            self._finish(trace, frame, shown)
+
+    def _finish(self, trace, frame, shown):
+        begin = trace["begin"]
+        result = {"id": trace["id"], "label": trace["label"], "begin": begin, "changed": frame is not None,
+                  "total": None, "stages": collections.OrderedDict()}
+        stages = result["stages"]
+        if trace["inject_start"] is not None:
+            stages["queue"] = trace["inject_start"] - begin
+            stages["inject"] = trace["inject_end"] - trace["inject_start"]
+        if frame is not None:
+            pull_start, pull_end, decode_end, _ = frame
+            stages["device"] = max(0.0, pull_start - trace["inject_end"])
+            stages["pull"] = max(0.0, pull_end - max(pull_start, trace["inject_end"]))
+            stages["decode"] = decode_end - pull_end
+            stages["render"] = shown - decode_end
+            result["total"] = shown - begin
+        with self._lock:
+            self.results.append(result)
+        if self.on_complete is not None:
+            self.on_complete(result)
+
+    def chrome_trace(self):
+        """The traced events and capture spans in Chrome trace-event JSON form (chrome://tracing, Perfetto)"""
+        def us(t):
+            return round((t - self.origin) * 1e6, 1)
+        threads = {"input": 1, "capture": 2, "display": 3}
+        events = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                  for name, tid in threads.items()]
+        with self._lock:
+            results = list(self.results)
+            spans = list(self.spans)
+        for name, thread, start, end, args in spans:
+            events.append({"name": name, "cat": thread, "ph": "X", "pid": 1, "tid": threads[thread],
+                           "ts": us(start), "dur": round((end - start) * 1e6, 1), "args": args or {}})
+        for result in results:
+            # Async slices, since events overlap while earlier ones are still in flight
+            t = result["begin"]
+            end = t + (result["total"] if result["total"] is not None else sum(result["stages"].values()))
+            args = {stage: round(seconds * 1000.0, 2) for stage, seconds in result["stages"].items()}
+            if not result["changed"]:
+                args["result"] = "no visible change"
+            common = {"cat": "input", "pid": 1, "tid": threads["input"], "id": result["id"]}
+            events.append(dict(common, name=result["label"], ph="b", ts=us(t), args=args))
+            for stage, seconds in result["stages"].items():
+                events.append(dict(common, name=stage, ph="b", ts=us(t)))
+                t += seconds
+                events.append(dict(common, name=stage, ph="e", ts=us(t)))
+            events.append(dict(common, name=result["label"], ph="e", ts=us(end)))
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self):
+        """Per-stage p50/p99 in milliseconds over the completed events that changed the screen"""
+        with self._lock:
+            results = [r for r in self.results if r["changed"]]
+        summary = collections.OrderedDict()
+        for stage in self.STAGES + ("total",):
+            histogram = RollingHistogram(window=len(results) or 1)
+            for result in results:
+                histogram.add(result["total"] if stage == "total" else result["stages"].get(stage, 0.0))
+            summary[stage] = (histogram.percentile(50), histogram.percentile(99))
+        return summary
+
+
+def compare_snapshot(golden, actual, tolerance=0, max_diff_ratio=0.0, regions=()):
+    """Compare two RGB images with per-region tolerances.
+
+    ``tolerance`` is the largest per-channel difference still treated as equal
+    and ``max_diff_ratio`` the fraction of differing pixels allowed. Each region
+    is a dict with ``box`` [x0, y0, x1, y1] and either ``ignore`` or its own
+    ``tolerance``/``max_diff_ratio``; pixels outside all regions use the
+    defaults. Returns (passed, details, diff_image).
+    """
+    import numpy as np
+    from PIL import Image
+    g = np.asarray(golden.convert('RGB'), dtype=np.int16)
+    a = np.asarray(actual.convert('RGB'), dtype=np.int16)
+    if g.shape != a.shape:
+        return False, {"error": f"size mismatch: golden {g.shape[1]}x{g.shape[0]}, "
+                                f"actual {a.shape[1]}x{a.shape[0]}"}, None
+    delta = np.abs(g - a).max(axis=2)
+    height, width = delta.shape
+    default_mask = np.ones(delta.shape, dtype=bool)
+    checks = []
+    for region in regions:
+        x0, y0, x1, y1 = region["box"]
+        x0, x1 = max(0, x0), min(width, x1)
+        y0, y1 = max(0, y0), min(height, y1)
+        default_mask[y0:y1, x0:x1] = False
+        if region.get("ignore"):
+            continue
+        mask = np.zeros(delta.shape, dtype=bool)
+        mask[y0:y1, x0:x1] = True
+        checks.append((region.get("name", f"{x0},{y0},{x1},{y1}"), mask,
+                       region.get("tolerance", tolerance), region.get("max_diff_ratio", max_diff_ratio)))
+    checks.insert(0, ("screen", default_mask, tolerance, max_diff_ratio))
+    failing = np.zeros(delta.shape, dtype=bool)
+    details = {"regions": []}
+    passed = True
+    for name, mask, tol, ratio in checks:
+        total = int(mask.sum())
+        if total == 0:
+            continue
+        over = (delta > tol) & mask
+        diff_pixels = int(over.sum())
+        region_passed = diff_pixels <= ratio * total
+        passed = passed and region_passed
+        failing |= over
+        details["regions"].append({"name": name, "diff_pixels": diff_pixels, "pixels": total,
+                                   "diff_ratio": diff_pixels / total, "passed": region_passed})
+    # Diff image: dimmed actual frame with differing pixels in red
+    diff = (a // 3).astype(np.uint8)
+    diff[failing] = (255, 0, 0)
+    return passed, details, Image.fromarray(diff, 'RGB')
+
+
+def write_snapshot_report(results, out_dir):
+    """Write report.json and report.html for a snapshot suite run"""
+    import html
+    with open(os.path.join(out_dir, "report.json"), "w") as f:
+        json.dump(results, f, indent=2)
+    rows = []
+    for result in results["snapshots"]:
+        ratio = max((r["diff_ratio"] for r in result.get("regions", [])), default=0.0)
+        images = "".join(f'<td><img src="{html.escape(result[key])}"></td>' if result.get(key) else "<td></td>"
+                         for key in ("golden", "actual", "diff"))
+        rows.append(f'<tr class="{result["status"]}"><td>{html.escape(result["name"])}</td>'
+                    f'<td>{result["status"]}</td><td>{ratio:.2%}</td>{images}</tr>')
+    with open(os.path.join(out_dir, "report.html"), "w") as f:
+        f.write("<html><head><meta charset='utf-8'><title>Y1 snapshot report</title><style>"
+                "body{font-family:sans-serif}td{padding:4px;vertical-align:top}img{width:240px}"
+                ".fail{background:#fdd}.pass{background:#dfd}.new{background:#ffd}</style></head><body>"
+                f"<h1>{html.escape(results['suite'])}</h1>"
+                f"<p>{results['passed']} passed, {results['failed']} failed, {results['new']} new</p>"
+                "<table><tr><th>Snapshot</th><th>Status</th><th>Worst region diff</th>"
+                "<th>Golden</th><th>Actual</th><th>Diff</th></tr>"
+                + "".join(rows) + "</table></body></html>")
+
 
 class Y1HelperApp(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Y1 Helper - Innioasis Y1 Developer Tool")
         self.geometry("420x629")
-        self.resizable(False, False)
+        self.minsize(300, 420)
         
         # Device configuration
         self.device_width = 480
         self.device_height = 360
         self.framebuffer_size = self.device_width * self.device_height * 4  # RGBA8888
         
-        # Display scaling (75% of original size)
+        # Display scaling (75% of original size until the preview is fitted to the window)
         self.display_scale = 0.75
         self.display_width = int(self.device_width * self.display_scale)  # 360
         self.display_height = int(self.device_height * self.display_scale)  # 270
+        self.zoom_var = tk.StringVar(value="Fit")  # One of ZOOM_LEVELS
+        self.zoom_pending = None
+        self.scale_cache = ScaledFrameCache()
+        self.displayed_frame_key = None  # (hash, geometry) of the frame on the canvas, to skip redrawing it
         
         # State variables
         self.is_capturing = True  # Always capturing
@@ -32,37 +3784,154 @@ class Y1HelperApp(tk.Tk):
         self.current_app = None
         self.control_launcher = False
         self.last_screen_image = None
+        self.last_crop_top = 0  # Status-bar rows cropped from the displayed frame
         self.device_connected = False
         self.prepare_device_visible = False  # Track if Prepare Device menu item is visible
         self.device_prepared = None  # Track if device has stock launcher installed
         self.prepare_prompt_refused = False  # Track if user refused the initial prepare prompt
         self.prepare_prompt_shown = False  # Track if prepare prompt has been shown for current connection
+        self.installed_packages = None  # (package, apk_path) list from the last app refresh
+        self.device_facts = None  # Cached getprop/wm/sysfs facts, invalidated on reconnect
+        self.device_facts_lock = threading.Lock()
+        self.apps_refresh_pending = False
+        self.app_metadata = AppMetadataCache()  # Labels and icons parsed from the APKs
+        self.app_metadata_pending = False
+        self.app_icons = {}  # package -> PhotoImage, kept referenced for the menus
         
         # Essential UI variables
         self.status_var = tk.StringVar(value="Ready")
         self.launcher_var = tk.BooleanVar()
         self.rgb_profile_var = tk.StringVar(value="BGRA8888")
         
-        # Add input pacing: minimum delay between input events (in seconds)
-        self.input_pacing_interval = 0.1  # 100ms
-        self.last_input_time = 0
+        # Optional shared-memory copy of each decoded frame for external tools
+        self.frame_export = None
+        self.frame_export_var = tk.BooleanVar(value=False)
+        
+        # Optional network stream of the screen (y1_stream.StreamServer)
+        self.stream_server = None
+        self.stream_server_var = tk.BooleanVar(value=False)
+        self.stream_server_port = 8765
+        
+        # UI hierarchy of the current screen, re-dumped (rate-limited) only when the screen changes a lot,
+        # so clocks, progress bars and animations don't invalidate it
+        self.ui_index = None
+        self.ui_index_stale = False
+        self.ui_checked_hash = None
+        self.ui_dump_pending = False
+        self.ui_dump_started = 0.0
+        self.ui_inspect_var = tk.BooleanVar(value=False)
+        self.hover_element = None
+        
+        # Logcat pane: ring of parsed records fed by one streaming connection
+        self.logcat_buffer = LogcatBuffer(capacity=50000)
+        self.logcat_stream = None
+        self.logcat_window = None
+        self.logcat_text = None
+        self.logcat_view_limit = 2000  # Lines kept in the Text widget
+        
+        # Device file browser: listings stream in pages over one sync session and are cached
+        self.browser_cache = DeviceDirectoryCache()
+        self.browser_lister = None
+        self.browser_window = None
+        self.browser_tree = None
+        self.browser_path = "/sdcard"
+        self.browser_token = 0
+        
+        # Performance profiler panel for the foreground app
+        self.profiler = None
+        self.profiler_window = None
+        
+        # Jank analysis: gfxinfo frame times of scripted scroll runs, kept for comparison
+        self.jank_runs = []
+        self.jank_window = None
+        
+        # Fleet provisioning window and its last report
+        self.fleet_window = None
+        self.fleet_tree = None
+        self.fleet_report = None
+        
+        # Host folder last used for music library sync
+        self.music_library_path = None
+        
+        # Worker pool for device commands so Tk callbacks never block on adb
+        self.executor = CommandExecutor(workers=4)
+        
+        # Device connection layer: capture backend and direct adb server client
+        self.capture_method = "pull"  # One of CAPTURE_METHODS
+        self.adb_client = AdbClient()
+        
+        # Fastest working backends per device, measured once and remembered across sessions
+        self.capability_store = DeviceCapabilityStore()
+        self.device_capabilities = None
+        self.capabilities_checked = False  # Reset on disconnect so another device gets looked up
+        
+        # Touch gestures and held keys, streamed over one persistent monkey connection
+        # (through the input queue below, so they stay in order with key presses)
+        self.gesture_injector = GestureInjector(MonkeyChannel(self.adb_client),
+                                                lambda command: self.run_adb_command(f"shell {command}"),
+                                                enqueue=lambda event, trace: self.input_queue.gesture(event, trace))
+        self.drag_start = None
+        self.drag_last = None
+        self.dragging = False
+        self.drag_threshold = 6  # Canvas pixels before a press becomes a drag
+        self.held_keys = {}  # keysym -> (keycode, pending release after-id)
+        
+        # Transport watchdog: notices a wedged adb server/connection within seconds and recovers it
+        self.watchdog = TransportWatchdog(self.adb_client, self._restart_adb_server, self._reset_device_connections,
+                                          on_state=self._on_transport_state,
+                                          on_recovered=self._on_transport_recovered)
+        self.watchdog.start()
+        
+        # Ordered input queue: bursts are coalesced into batches, and only surplus auto-repeat is dropped
+        # (batches that fail during a transport outage are replayed once it recovers)
+        self.input_queue = InputQueue(self._send_key_batch, self._send_input_command, self._on_input_batch,
+                                      retry_failed=self._retry_input_after_recovery,
+                                      send_gesture=self.gesture_injector.handle, max_pending=INPUT_MAX_PENDING,
+                                      max_age=INPUT_MAX_AGE)
+        self.wheel_accel_var = tk.BooleanVar(value=True)
+        self.wheel_last_time = 0.0
+        self.wheel_last_direction = 0
+        self.wheel_streak = 0
+        
+        # Input-to-photon latency tracing (Tools > Trace Input Latency)
+        self.latency_tracer = LatencyTracer(on_complete=self._on_latency_traced)
+        self.latency_trace_var = tk.BooleanVar(value=False)
+        
+        # Screen recording to a bounded, disk-backed ring file
+        import tempfile
+        self.recorder = None
+        self.recording_path = os.path.join(tempfile.gettempdir(), "y1_recording.ring")
+        self.recording_capacity = 256 * 1024 * 1024  # 256MB ring, oldest frames evicted first
+        
+        # Instant replay: last few seconds of frames kept in RAM, dumped with F8
+        self.last_frame_hash = None
+        self.last_frame = None  # Latest full-size decoded frame
+        self.frame_seq = 0
+        self.frame_condition = threading.Condition()
+        self.replay_buffer = ReplayBuffer(seconds=10)
+        self.replay_enabled_var = tk.BooleanVar(value=True)
+        
+        # Per-stage timing (capture pipeline, adb commands) for the HUD and JSON export
+        self.perf = PerfMonitor()
+        self.hud_var = tk.BooleanVar(value=False)
+        self.hud_timer = None
+        self.hud_stages = [
+            ("pull", "pull"), ("decode", "decode"), ("crop", "crop"), ("resize", "resize"),
+            ("photo", "photo"), ("canvas", "canvas"), ("input", "adb shell input"),
+        ]
         
         # Initialize UI
         self.setup_ui()
         self.setup_menu()
         self.setup_bindings()
         
-        # Check ADB connection
-        self.check_adb_connection()
-        
-        # Show placeholder if no device connected
-        if not hasattr(self, 'device_connected') or not self.device_connected:
-            self.show_disconnected_placeholder()
+        # Show the window right away; the device is probed in the background
+        self.show_disconnected_placeholder()
+        self.first_frame_shown = False
+        self.after(0, self._on_first_window)
+        threading.Thread(target=self._startup_probe, daemon=True).start()
         
-        # Detect current app and set launcher control (and start periodic check)
-        self.detect_current_app()
-        
-        # Start screen capture immediately
+        # Start screen capture immediately (it waits for the probe to find a device)
         self.start_screen_capture()
     
     def setup_ui(self):
@@ -74,10 +3943,14 @@ class Y1HelperApp(tk.Tk):
         screen_frame = ttk.LabelFrame(main_frame, text="Mouse Input Panel (480x360)", padding=5)
         screen_frame.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
         
-        # Create canvas for screen display (scaled down to 75%)
-        self.screen_canvas = tk.Canvas(screen_frame, width=self.display_width, height=self.display_height, 
+        # Create canvas for screen display, centred in an area that takes up the spare window space
+        self.preview_area = ttk.Frame(screen_frame, width=self.display_width, height=self.display_height)
+        self.preview_area.pack(fill=tk.BOTH, expand=True)
+        self.preview_area.pack_propagate(False)
+        self.preview_area.bind("<Configure>", self._on_preview_area_resized)
+        self.screen_canvas = tk.Canvas(self.preview_area, width=self.display_width, height=self.display_height, 
                                      bg='black', cursor='crosshair', highlightthickness=0, bd=0)
-        self.screen_canvas.pack()
+        self.screen_canvas.pack(expand=True)
         self.screen_canvas.config(width=self.display_width, height=self.display_height)
         
         # Remove old playback_frame, nav_frame, mid_frame
@@ -106,15 +3979,19 @@ class Y1HelperApp(tk.Tk):
         status_label = ttk.Label(status_frame, textvariable=self.status_var, 
                                 relief=tk.SUNKEN, borderwidth=1, padding=(5, 2))
         status_label.pack(fill=tk.X, side=tk.LEFT, expand=True)
+        # Cancel button, shown only while long-running device commands are pending
+        self.cancel_button = ttk.Button(status_frame, text="Cancel", width=7, command=self.cancel_commands)
         
         # Force focus to canvas after window is ready
         self.after(100, lambda: self.screen_canvas.focus_set())
         
         # Mouse click bindings
-        self.screen_canvas.bind("<Button-1>", self.on_screen_click)       # Left click
+        self.screen_canvas.bind("<Button-1>", self.on_screen_press)       # Left click / drag start
+        self.screen_canvas.bind("<B1-Motion>", self.on_screen_drag)       # Drag = swipe gesture
         self.screen_canvas.bind("<Button-3>", self.on_screen_right_click) # Right click
         self.screen_canvas.bind("<Button-2>", self.on_mouse_wheel_click)  # Middle click (wheel click)
-        self.screen_canvas.bind("<ButtonRelease-1>", self.on_nav_bar_click)
+        self.screen_canvas.bind("<ButtonRelease-1>", self.on_screen_release)
+        self.screen_canvas.bind("<Motion>", self.on_screen_motion)
         
         # Mouse wheel bindings
         self.screen_canvas.bind("<MouseWheel>", self.on_mouse_wheel)      # Windows/macOS
@@ -148,6 +4025,7 @@ class Y1HelperApp(tk.Tk):
         device_menu = Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Device", menu=device_menu)
         self.prepare_device_menu_item = device_menu.add_command(label="Prepare Device", command=self.prepare_device)
+        device_menu.add_command(label="Prepare All Connected Devices...", command=self.prepare_fleet)
         device_menu.add_command(label="Launch Settings", command=self.launch_settings)
         device_menu.add_command(label="Go Home", command=self.go_home)
         self.device_menu = device_menu
@@ -155,13 +4033,51 @@ class Y1HelperApp(tk.Tk):
         menubar.add_cascade(label="Apps", menu=self.apps_menu)
         self.apps_menu.add_command(label="Install APK...", command=self.install_apk)
         self.apps_menu.add_separator()
-        self.refresh_apps()  # Populate on startup
-        self.update_device_menu()
+        self.apps_menu.add_command(label="Loading apps...", state="disabled")
+        self.screen_menu = Menu(menubar, tearoff=0, postcommand=self.update_replay_menu)
+        menubar.add_cascade(label="Screen", menu=self.screen_menu)
+        self.screen_menu.add_command(label="Start Recording", command=self.toggle_recording)
+        self.screen_menu.add_command(label="Export Recording...", command=self.export_recording)
+        self.screen_menu.add_separator()
+        self.screen_menu.add_checkbutton(label="Instant Replay Buffer", variable=self.replay_enabled_var,
+                                         command=self.toggle_replay_buffer)
+        self.screen_menu.add_command(label="Save Instant Replay", accelerator="F8", command=self.save_instant_replay)
+        self.screen_menu.add_command(label="Replay buffer: empty", state="disabled")
+        self.screen_menu.add_separator()
+        self.screen_menu.add_checkbutton(label="Performance HUD", accelerator="F3", variable=self.hud_var,
+                                         command=self.toggle_perf_hud)
+        self.screen_menu.add_command(label="Export Performance Data...", command=self.export_perf_data)
+        self.screen_menu.add_separator()
+        self.screen_menu.add_checkbutton(label="Inspect UI Elements", variable=self.ui_inspect_var,
+                                         command=self.toggle_ui_inspect)
+        self.screen_menu.add_checkbutton(label="Share Frames via Shared Memory", variable=self.frame_export_var,
+                                         command=self.toggle_frame_export)
+        self.screen_menu.add_separator()
+        zoom_menu = Menu(self.screen_menu, tearoff=0)
+        for label in ZOOM_LEVELS:
+            zoom_menu.add_radiobutton(label=label, variable=self.zoom_var, value=label, command=self.apply_zoom)
+        self.screen_menu.add_cascade(label="Zoom", menu=zoom_menu)
+        self.tools_menu = Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Tools", menu=self.tools_menu)
+        self.tools_menu.add_checkbutton(label="Scroll Wheel Acceleration", variable=self.wheel_accel_var)
+        self.tools_menu.add_command(label="Re-measure Device Backends", command=self.remeasure_device_backends)
+        self.tools_menu.add_checkbutton(label="Network Streaming Server", variable=self.stream_server_var,
+                                        command=self.toggle_stream_server)
+        self.tools_menu.add_separator()
+        self.tools_menu.add_checkbutton(label="Trace Input Latency", variable=self.latency_trace_var,
+                                        command=self.toggle_latency_tracing)
+        self.tools_menu.add_command(label="Export Latency Trace...", command=self.export_latency_trace)
+        self.tools_menu.add_command(label="Jank Analysis...", command=self.open_jank_analyzer)
+        self.tools_menu.add_separator()
+        self.tools_menu.add_command(label="Run Snapshot Suite...", command=self.run_snapshot_suite)
+        self.tools_menu.add_command(label="Update Snapshot Goldens...",
+                                    command=lambda: self.run_snapshot_suite(update_golden=True))
+        self.update_device_menu()  # Apps and dynamic device items fill in once the device is probed
     
-    def update_device_menu(self):
+    def update_device_menu(self, packages=None):
         """Update dynamic items in the Device menu (Nova Launcher, KeyCodeDisp, other launchers)"""
         # Remove all items after the static ones (up to and including Go Home)
-        static_count = 3  # Prepare Device, Launch Settings, Go Home
+        static_count = 4  # Prepare Device, Prepare All Connected Devices, Launch Settings, Go Home
         total_items = self.device_menu.index('end')
         if total_items is not None and total_items > static_count:
             for i in range(total_items, static_count, -1):
@@ -169,8 +4085,6 @@ class Y1HelperApp(tk.Tk):
         # Only add dynamic items if device is connected
         if not getattr(self, 'device_connected', False):
             return
-        # Get installed packages
-        success, stdout, stderr = self.run_adb_command("shell pm list packages -3 -f")
         nova_installed = False
         keycode_installed = False
         extra_launchers = []
@@ -182,20 +4096,14 @@ class Y1HelperApp(tk.Tk):
             ("com.miui.home", "Open MIUI Launcher")
         ]
         keycode_pkg = "jp.ne.neko.freewing.KeyCodeDisp"
-        if success:
-            for line in stdout.strip().split('\n'):
-                if line.startswith('package:'):
-                    if '=' in line:
-                        package_name = line.split('=')[1]
-                    else:
-                        package_name = line[len('package:'):]
-                    if package_name == "com.teslacoilsw.launcher":
-                        nova_installed = True
-                    if package_name == keycode_pkg:
-                        keycode_installed = True
-                    for pkg, label in launcher_pkgs:
-                        if package_name == pkg and pkg != "com.teslacoilsw.launcher":
-                            extra_launchers.append((pkg, label))
+        for package_name, apk_path in packages or []:
+            if package_name == "com.teslacoilsw.launcher":
+                nova_installed = True
+            if package_name == keycode_pkg:
+                keycode_installed = True
+            for pkg, label in launcher_pkgs:
+                if package_name == pkg and pkg != "com.teslacoilsw.launcher":
+                    extra_launchers.append((pkg, label))
         self.device_menu.add_separator()
         if nova_installed:
             self.device_menu.add_command(label="Open Nova Launcher", command=self.open_nova_launcher)
@@ -205,18 +4113,42 @@ class Y1HelperApp(tk.Tk):
             self.device_menu.add_command(label=label, command=lambda p=pkg: self.open_launcher(p))
         self.device_menu.add_separator()
         self.device_menu.add_command(label="ADB Shell", command=self.open_adb_shell)
+        self.device_menu.add_command(label="File Browser", command=self.open_file_browser)
+        self.device_menu.add_command(label="Logcat Viewer", command=self.open_logcat_viewer)
+        self.device_menu.add_command(label="Performance Profiler", command=self.open_profiler)
         self.device_menu.add_command(label="Device Info", command=self.show_device_info)
         self.device_menu.add_command(label="Change Device Language", command=self.change_device_language)
+        self.device_menu.add_command(label="Sync Music Library...", command=self.sync_music)
+        self.device_menu.add_command(label="Back Up Device Storage...", command=self.back_up_storage)
+        self.device_menu.add_command(label="Restore Backup...", command=self.restore_backup)
         self.device_menu.add_separator()
         self.device_menu.add_command(label="Exit", command=self.quit)
     
     def refresh_apps(self):
-        """Refresh list of installed apps (Apps menu only)"""
+        """Refresh installed apps in the background (safe to call from any thread)"""
+        if self.apps_refresh_pending:
+            return
+        self.apps_refresh_pending = True
+        def worker():
+            try:
+                success, stdout, stderr = self.run_adb_command("shell pm list packages -3 -f")
+                packages = parse_package_list(stdout) if success else None
+            finally:
+                self.apps_refresh_pending = False
+            self.after(0, lambda: self._populate_app_menus(packages))
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _populate_app_menus(self, packages, force=False):
+        """Rebuild the Apps menu and dynamic Device menu items from a package list (Tk thread)"""
+        if packages is not None and packages == self.installed_packages and not force:
+            return  # Nothing changed since the last refresh
+        self.installed_packages = packages
+        if packages:
+            self._refresh_app_metadata(packages)
+        self.update_device_menu(packages)
         self.apps_menu.delete(0, tk.END)
         self.apps_menu.add_command(label="Install APK...", command=self.install_apk)
         self.apps_menu.add_separator()
-        success, stdout, stderr = self.run_adb_command(
-            "shell pm list packages -3 -f")
         apps = []
         launcher_pkgs = [
             "com.teslacoilsw.launcher",
@@ -228,25 +4160,62 @@ class Y1HelperApp(tk.Tk):
             "com.ayst.factorytest",
             "jp.ne.neko.freewing.KeyCodeDisp"
         ]
-        if success:
-            for line in stdout.strip().split('\n'):
-                if line.startswith('package:'):
-                    if '=' in line:
-                        package_name = line.split('=')[1]
-                    else:
-                        package_name = line[len('package:'):]
-                    if package_name in launcher_pkgs:
-                        continue
-                    apps.append(package_name)
+        for package_name, apk_path in packages or []:
+            if package_name in launcher_pkgs:
+                continue
+            apps.append(package_name)
         apps = [a for a in apps if a and a.strip()]
         if not apps:
             self.apps_menu.add_command(label="No user apps installed", state="disabled")
         else:
-            for app in sorted(apps):
+            entries = []
+            for app in apps:
+                metadata = self.app_metadata.get(app) or {}
+                entries.append((metadata.get("label") or app, app, metadata))
+            for label, app, metadata in sorted(entries, key=lambda e: e[0].lower()):
                 app_menu = Menu(self.apps_menu, tearoff=0)
+                if metadata.get("label"):
+                    version = f" {metadata['version_name']}" if metadata.get("version_name") else ""
+                    app_menu.add_command(label=f"{app}{version}", state="disabled")
+                    app_menu.add_separator()
                 app_menu.add_command(label="Launch", command=lambda a=app: self.launch_app(a))
                 app_menu.add_command(label="Uninstall", command=lambda a=app: self.uninstall_app(a))
-                self.apps_menu.add_cascade(label=app, menu=app_menu)
+                icon = self._app_icon(app, metadata.get("icon"))
+                if icon is not None:
+                    self.apps_menu.add_cascade(label=label, menu=app_menu, image=icon, compound=tk.LEFT)
+                else:
+                    self.apps_menu.add_cascade(label=label, menu=app_menu)
+    
+    def _app_icon(self, package, icon_path):
+        """The menu icon for a package from the metadata cache, or None"""
+        if not icon_path:
+            return None
+        cached = self.app_icons.get(package)
+        if cached is not None and cached[0] == icon_path:
+            return cached[1]
+        try:
+            icon = tk.PhotoImage(file=icon_path)
+        except (tk.TclError, OSError):
+            return None
+        self.app_icons[package] = (icon_path, icon)
+        return icon
+    
+    def _refresh_app_metadata(self, packages):
+        """Fetch labels and icons of apps not in the metadata cache yet, then rebuild the menu"""
+        if self.app_metadata_pending:
+            return
+        self.app_metadata_pending = True
+        def worker():
+            changed = []
+            try:
+                changed = self.app_metadata.refresh(self.adb_client, packages)
+            except Exception as e:
+                print(f"App metadata refresh failed: {e}")
+            finally:
+                self.app_metadata_pending = False
+            if changed:
+                self.after(0, lambda: self._populate_app_menus(self.installed_packages, force=True))
+        threading.Thread(target=worker, daemon=True).start()
     
     def check_adb_connection(self):
         """Check if ADB is available and device is connected"""
@@ -266,6 +4235,7 @@ class Y1HelperApp(tk.Tk):
                 self.status_var.set("ADB Connected")
                 self.device_connected = True
                 self.refresh_apps()
+                self.load_device_facts()
             else:
                 self.status_var.set("No ADB device found")
                 self.device_connected = False
@@ -293,6 +4263,8 @@ class Y1HelperApp(tk.Tk):
                     self.device_connected = True
                     self.status_var.set("Device connected")
                     self.refresh_apps()
+                    self.device_facts = None  # May be a different device
+                    self.load_device_facts()
                     # Check if device is prepared (has stock launcher)
                     if self.check_device_prepared() is False and not self.prepare_prompt_shown and self.device_prepared is not None:
                         # Only show prompt if we are certain device is connected and not prepared
@@ -305,6 +4277,7 @@ class Y1HelperApp(tk.Tk):
                 if self.device_connected:
                     # Device just disconnected
                     self.device_connected = False
+                    self.device_facts = None
                     self.status_var.set("Device disconnected - Please reconnect")
                     self.hide_prepare_device_menu()
                     self.prepare_prompt_refused = False
@@ -318,16 +4291,25 @@ class Y1HelperApp(tk.Tk):
                 self.prepare_prompt_shown = False
     
     def detect_current_app(self):
-        """Detect currently running app and set launcher control accordingly"""
+        """Detect currently running app in the background and set launcher control accordingly"""
+        if not self.device_connected:
+            # Nothing to query; check again later
+            if self.is_capturing:
+                self.after(5000, self.detect_current_app)
+            return
+        threading.Thread(target=self._detect_current_app_worker, daemon=True).start()
+    
+    def _detect_current_app_worker(self):
+        """Query the focused package over adb (worker thread)"""
+        import re
+        detected_package = None
         try:
             # Get the currently focused activity
             success, stdout, stderr = self.run_adb_command("shell dumpsys activity activities | grep mResumedActivity")
-            detected_package = None
             if success and stdout:
                 for line in stdout.strip().split('\n'):
                     if 'mResumedActivity' in line:
                         # Extract package name (regex for package/activity)
-                        import re
                         match = re.search(r' ([a-zA-Z0-9_.]+)/(\S+)', line)
                         if match:
                             detected_package = match.group(1)
@@ -337,37 +4319,37 @@ class Y1HelperApp(tk.Tk):
                 success, stdout, stderr = self.run_adb_command("shell dumpsys window windows | grep -E 'mCurrentFocus|mFocusedApp'")
                 if success and stdout:
                     for line in stdout.strip().split('\n'):
-                        import re
                         match = re.search(r' ([a-zA-Z0-9_.]+)/(\S+)', line)
                         if match:
                             detected_package = match.group(1)
                         break
-            # Update current_app and launcher control logic
-            if detected_package:
-                self.current_app = detected_package
-                if self._should_show_launcher_toggle(detected_package):
-                    self.control_launcher = True
-                    self.launcher_var.set(True)
-                    self.launcher_toggle_btn.pack(pady=(8, 0), anchor="w")
-                    self.status_var.set("Simulate Y1 Scroll wheel Input is available for this app")
-                else:
-                    self.control_launcher = False
-                    self.launcher_var.set(False)
-                    self.launcher_toggle_btn.pack_forget()
-                if self._should_show_launcher_toggle(detected_package):
-                    self.hide_prepare_device_menu()
+        except Exception as e:
+            print(f"Error detecting current app: {e}")
+        self.after(0, lambda: self._apply_current_app(detected_package))
+    
+    def _apply_current_app(self, detected_package):
+        """Update current_app and launcher control logic (Tk thread)"""
+        if detected_package:
+            self.current_app = detected_package
+            if self._should_show_launcher_toggle(detected_package):
+                self.control_launcher = True
+                self.launcher_var.set(True)
+                self.launcher_toggle_btn.pack(pady=(8, 0), anchor="w")
+                self.status_var.set("Simulate Y1 Scroll wheel Input is available for this app")
             else:
-                self.current_app = "unknown"
                 self.control_launcher = False
                 self.launcher_var.set(False)
                 self.launcher_toggle_btn.pack_forget()
-                self.status_var.set("App detection failed - Y1 scroll simulation disabled")
-        except Exception as e:
-            print(f"Error detecting current app: {e}")
+            if self._should_show_launcher_toggle(detected_package):
+                self.hide_prepare_device_menu()
+        elif self.watchdog.recovering:
+            pass  # Keep current_app and launcher mode through a transport outage
+        else:
             self.current_app = "unknown"
             self.control_launcher = False
             self.launcher_var.set(False)
             self.launcher_toggle_btn.pack_forget()
+            self.status_var.set("App detection failed - Y1 scroll simulation disabled")
         # Schedule next check in 5 seconds if app is still running
         if hasattr(self, 'is_capturing') and self.is_capturing:
             self.after(5000, self.detect_current_app)
@@ -386,6 +4368,10 @@ class Y1HelperApp(tk.Tk):
     
     def check_device_prepared(self):
         """Check if device has stock launcher installed (installed only, not running)"""
+        facts = self.device_facts
+        if facts is not None:
+            self.device_prepared = facts["y1_launcher_installed"]
+            return self.device_prepared
         success, stdout, stderr = self.run_adb_command("shell pm list packages com.innioasis.y1")
         if not success:
             self.device_prepared = None  # Unknown, don't prompt
@@ -397,6 +4383,48 @@ class Y1HelperApp(tk.Tk):
             self.device_prepared = False
             return False
     
+    def load_device_facts(self):
+        """Collect device facts in one batched shell call and cache them (worker threads only)"""
+        with self.device_facts_lock:
+            if self.device_facts is not None:
+                return self.device_facts
+            success, stdout, stderr = self.run_adb_command(f"shell {DEVICE_FACTS_SCRIPT}")
+            if not success or not stdout.strip():
+                print(f"Failed to collect device facts: {stderr}")
+                return None
+            facts = parse_device_facts(stdout)
+            self.device_facts = facts
+        self._apply_device_geometry(facts)
+        return facts
+    
+    def refresh_device_facts(self, callback=None):
+        """Invalidate and re-collect device facts in the background, then call callback(facts) on the Tk thread"""
+        self.device_facts = None
+        def worker():
+            facts = self.load_device_facts()
+            if callback is not None:
+                self.after(0, lambda: callback(facts))
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _apply_device_geometry(self, facts):
+        """Use the fb0 geometry (or the physical screen size) for framebuffer decoding"""
+        size = facts.get("framebuffer_geometry") or facts.get("screen_size")
+        if size and all(size) and size != (self.device_width, self.device_height):
+            print(f"Device reports {size[0]}x{size[1]} framebuffer, updating framebuffer geometry")
+            self.device_width, self.device_height = size
+            self.framebuffer_size = self.device_width * self.device_height * 4
+            self.after(0, self.apply_zoom)
+    
+    def _effective_pixel_profile(self):
+        """Resolve the "Auto" pixel profile using the cached framebuffer depth where possible"""
+        profile = self.rgb_profile_var.get()
+        facts = self.device_facts
+        if profile == "Auto" and facts is not None:
+            bits_per_pixel = facts["framebuffer"].get("bits_per_pixel")
+            if bits_per_pixel == "16":
+                return "RGB565"
+        return profile
+    
     def show_unprepared_device_prompt(self):
         """Show prompt for unprepared device"""
         result = messagebox.askyesno("Unprepared Device Detected", 
@@ -416,6 +4444,7 @@ class Y1HelperApp(tk.Tk):
     
     def run_adb_command(self, command, timeout=10):
         """Run ADB command and return result"""
+        command_start = time.perf_counter()
         try:
             import os
             import platform
@@ -427,25 +4456,162 @@ class Y1HelperApp(tk.Tk):
                 adb_path = os.path.join("platform-tools", "adb")
             
             # Handle commands with quoted paths properly
+            # (run_process aborts the adb process if the calling executor task is cancelled)
             if '"' in command:
                 # For commands with quoted paths, use shell=True on Windows
                 if platform.system() == "Windows":
                     full_command = f'"{adb_path}" {command}'
-                    result = subprocess.run(full_command, shell=True, capture_output=True, text=True, timeout=timeout)
+                    result = run_process(full_command, timeout=timeout, shell=True)
                 else:
                     # On Unix systems, split carefully
                     import shlex
                     full_command = [adb_path] + shlex.split(command)
-                    result = subprocess.run(full_command, capture_output=True, text=True, timeout=timeout)
+                    result = run_process(full_command, timeout=timeout)
             else:
                 # Simple command splitting for non-path commands
                 full_command = [adb_path] + command.split()
-                result = subprocess.run(full_command, capture_output=True, text=True, timeout=timeout)
+                result = run_process(full_command, timeout=timeout)
             
+            self.perf.record(self._adb_stage_name(command), time.perf_counter() - command_start)
             return result.returncode == 0, result.stdout, result.stderr
+        except CommandCancelled:
+            return False, "", "Cancelled"
         except Exception as e:
             return False, "", str(e)
     
+    def _on_first_window(self):
+        """Record time-to-first-window once the Tk main loop is running"""
+        elapsed = time.perf_counter() - _PROCESS_START
+        self.perf.record("startup first window", elapsed)
+        print(f"Time to first window: {elapsed:.2f}s")
+    
+    def ensure_device_capabilities(self, temp_path=None):
+        """Apply this device's saved backends, measuring them first if it is new (capture thread)"""
+        self.capabilities_checked = True
+        facts = self.load_device_facts()
+        if facts is None:
+            return
+        record = self.capability_store.get(facts["serial"], facts["fingerprint"])
+        source = "saved"
+        if record is None:
+            self.status_var.set("Measuring capture and input backends for this device...")
+            record = self.measure_device_capabilities(facts, temp_path)
+            self.capability_store.put(facts["serial"], facts["fingerprint"], record)
+            source = "measured"
+        self.device_capabilities = record
+        choice = record["choice"]
+        self.capture_method = choice["capture_method"]
+        if choice["pixel_profile"]:
+            self.after(0, lambda: self.rgb_profile_var.set(choice["pixel_profile"]))
+        self.gesture_injector.use_monkey = choice["input_method"] == "monkey"
+        message = (f"Backends ({source}): {choice['capture_method']} capture, "
+                   f"{choice['pixel_profile'] or self.rgb_profile_var.get()}, {choice['input_method']} input")
+        print(message)
+        self.status_var.set(message)
+    
+    def measure_device_capabilities(self, facts, temp_path=None):
+        """Micro-benchmark every capture and input backend on the connected device (worker threads only)"""
+        capture = benchmark_capture_methods(self.adb_client, self.device_width, self.device_height, temp_path,
+                                            default_profile=self.rgb_profile_var.get())
+        # KEYCODE_UNKNOWN (0) exercises the injection path without doing anything on the device
+        inputs = {"monkey": None, "keyevent": None}
+        self.gesture_injector.use_monkey = True
+        self.gesture_injector.monkey_retry_at = 0.0
+        if self.gesture_injector.inject(["press 0"]):  # Starts monkey if it is not running
+            start = time.perf_counter()
+            if all(self.gesture_injector.inject(["press 0"]) for _ in range(3)):
+                inputs["monkey"] = (time.perf_counter() - start) / 3
+        start = time.perf_counter()
+        success, stdout, stderr = self.run_adb_command("shell input keyevent 0")
+        if success:
+            inputs["keyevent"] = time.perf_counter() - start
+        for method, result in capture.items():
+            state = f"{result['seconds'] * 1000:.0f} ms/frame" if result["ok"] else f"unavailable ({result['error']})"
+            print(f"Capture {method}: {state}")
+        return {
+            "serial": facts["serial"],
+            "fingerprint": facts["fingerprint"],
+            "model": facts["model"],
+            "android_version": facts["android_version"],
+            "measured_at": time.time(),
+            "capture": capture,
+            "input": inputs,
+            "choice": choose_backends(capture, inputs),
+        }
+    
+    def remeasure_device_backends(self):
+        """Forget the saved backends of the connected device so the capture loop measures them again"""
+        facts = self.device_facts
+        if facts is None or not self.device_connected:
+            messagebox.showerror("Error", "Device not connected!")
+            return
+        self.capability_store.forget(facts["serial"], facts["fingerprint"])
+        self.capabilities_checked = False
+    
+    def _restart_adb_server(self):
+        """Kill and restart the adb server (watchdog thread); hung adb clients fail and return"""
+        for command, timeout in (("kill-server", 5), ("start-server", 10)):
+            try:
+                run_process([get_adb_path(), command], timeout=timeout)
+            except Exception as e:
+                print(f"adb {command} failed: {e}")
+    
+    def _reset_device_connections(self):
+        """Drop persistent device connections so they are reopened on next use (watchdog thread)"""
+        self.gesture_injector.channel.close()
+    
+    def _on_transport_state(self, state, detail):
+        """Show watchdog state changes in the status bar (watchdog thread)"""
+        if state in (TransportWatchdog.STALLED, TransportWatchdog.RECOVERING):
+            text = f"Connection stalled - {detail}"
+        elif state == TransportWatchdog.HEALTHY and detail:
+            text = f"Connection restored ({detail})"
+        else:
+            return  # Plain disconnects are reported by the capture loop
+        self.after(0, lambda: self.status_var.set(text))
+    
+    def _on_transport_recovered(self, seconds):
+        self.perf.record("transport recovery", seconds)
+        print(f"Transport recovered in {seconds:.1f} s")
+    
+    def _retry_input_after_recovery(self, error):
+        """Replay a failed input batch if the transport was at fault and recovers soon (input queue thread)"""
+        if error == GestureInjector.DEFERRED:
+            return False  # A held key's press waits for its release; nothing to replay
+        if self.watchdog.report_failure() == TransportWatchdog.HEALTHY:
+            return False  # The transport works, so the command itself failed
+        self.watchdog.wait_healthy(INPUT_RECOVERY_WAIT)
+        return self.watchdog.state == TransportWatchdog.HEALTHY
+    
+    def _startup_probe(self):
+        """Pre-warm the adb server and heavy modules, then probe the device (worker thread)"""
+        try:
+            server = subprocess.Popen([get_adb_path(), "start-server"],
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except Exception as e:
+            print(f"adb start-server failed: {e}")
+            server = None
+        # Load numpy/PIL while the adb server starts so the first frame isn't delayed by imports
+        import numpy  # noqa: F401
+        from PIL import Image, ImageTk  # noqa: F401
+        if server is not None:
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+        self.perf.record("startup adb ready", time.perf_counter() - _PROCESS_START)
+        self.check_adb_connection()
+        self.after(0, self.detect_current_app)
+    
+    def _adb_stage_name(self, command):
+        """Group adb commands for latency stats, e.g. 'adb pull' or 'adb shell input'"""
+        words = command.split()
+        if not words:
+            return "adb"
+        if words[0] == "shell" and len(words) > 1:
+            return f"adb shell {words[1]}"
+        return f"adb {words[0]}"
+    
     def start_screen_capture(self):
         if not self.capture_thread or not self.capture_thread.is_alive():
             self.is_capturing = True
@@ -463,20 +4629,22 @@ class Y1HelperApp(tk.Tk):
         # Use platform-appropriate path separator
         fb_temp_path = os.path.join(temp_dir, "y1_fb0.tmp")
         placeholder_shown = False
-        last_connection_check = 0
+        last_connection_check = time.time()  # The startup probe performs the first check
         connection_check_interval = 5  # Check connection every 5 seconds
         
         while self.is_capturing:
             try:
                 current_time = time.time()
                 
-                # Periodically check device connection status
-                if current_time - last_connection_check > connection_check_interval:
+                # Periodically check device connection status (the watchdog owns it during a recovery)
+                if current_time - last_connection_check > connection_check_interval and not self.watchdog.recovering:
                     self.check_device_connection_status()
                     last_connection_check = current_time
                 
                 # Check if device is connected
                 if not self.device_connected:
+                    self.watchdog.idle()
+                    self.capabilities_checked = False
                     if not placeholder_shown:
                         self.show_disconnected_placeholder()
                         placeholder_shown = True
@@ -489,10 +4657,26 @@ class Y1HelperApp(tk.Tk):
                     placeholder_shown = False
                     self.status_var.set("Device connected")
                 
-                # Pull framebuffer from device to temp file
-                success, stdout, stderr = self.run_adb_command(f"pull /dev/graphics/fb0 \"{fb_temp_path}\"")
-                if success and os.path.exists(fb_temp_path):
-                    self.process_framebuffer(fb_temp_path)
+                if not self.capabilities_checked:
+                    self.ensure_device_capabilities(fb_temp_path)
+                
+                # Fetch framebuffer from device with the selected capture backend
+                pull_start = time.perf_counter()
+                try:
+                    data = read_framebuffer(self.capture_method, fb_temp_path, self.adb_client)
+                except Exception as e:
+                    print(f"Framebuffer {self.capture_method} failed: {e}")
+                    data = None
+                if data:
+                    pull_end = time.perf_counter()
+                    self.watchdog.frame_ok()
+                    self.perf.record("pull", pull_end - pull_start)
+                    self.process_framebuffer_data(data, pull_start, pull_end)
+                elif self.watchdog.report_failure() != TransportWatchdog.OFFLINE:
+                    # Transport stalled (the watchdog is recovering it) or a one-off failure:
+                    # keep the last frame and session state, and resume once it is healthy
+                    self.watchdog.wait_healthy(timeout=1.0)
+                    time.sleep(0.5)
                 else:
                     # If framebuffer pull fails, device might be disconnected
                     if not placeholder_shown:
@@ -512,109 +4696,38 @@ class Y1HelperApp(tk.Tk):
                 time.sleep(0.5)
     
     def process_framebuffer(self, fb_path):
+        """Process a pulled framebuffer file and display it on the canvas"""
+        if not os.path.exists(fb_path) or os.path.getsize(fb_path) < 100:
+            return
+        with open(fb_path, 'rb') as f:
+            self.process_framebuffer_data(f.read())
+    
+    def process_framebuffer_data(self, data, pull_start=None, pull_end=None):
         """Process framebuffer data and display on canvas (single-threaded, numpy for BGRA/BGR)"""
         try:
-            from PIL import Image
-            if not os.path.exists(fb_path):
-                return
-            file_size = os.path.getsize(fb_path)
-            if file_size < 100:
-                return
-            with open(fb_path, 'rb') as f:
-                data = f.read(file_size)
+            from PIL import Image, ImageTk
+            stage_start = time.perf_counter()
             if len(data) < 100:
                 return
-            img_rgb = None
-            expected_rgba = self.device_width * self.device_height * 4
-            expected_rgb = self.device_width * self.device_height * 3
-            expected_rgb565 = self.device_width * self.device_height * 2
-            selected_profile = self.rgb_profile_var.get()
-            formats_to_try = []
-            if selected_profile == "Auto":
-                if file_size >= expected_rgba:
-                    formats_to_try = [
-                        ("RGBA8888", "RGBA", expected_rgba, False),
-                        ("BGRA8888", "RGBA", expected_rgba, True)
-                    ]
-                elif file_size >= expected_rgb:
-                    formats_to_try = [
-                        ("RGB888", "RGB", expected_rgb, False),
-                        ("BGR888", "RGB", expected_rgb, True)
-                    ]
-                elif file_size >= expected_rgb565:
-                    formats_to_try = [("RGB565", "RGB565", expected_rgb565, False)]
-            else:
-                if selected_profile == "RGBA8888":
-                    formats_to_try = [("RGBA8888", "RGBA", expected_rgba, False)]
-                elif selected_profile == "BGRA8888":
-                    formats_to_try = [("BGRA8888", "RGBA", expected_rgba, True)]
-                elif selected_profile == "RGB888":
-                    formats_to_try = [("RGB888", "RGB", expected_rgb, False)]
-                elif selected_profile == "BGR888":
-                    formats_to_try = [("BGR888", "RGB", expected_rgb, True)]
-                elif selected_profile == "RGB565":
-                    formats_to_try = [("RGB565", "RGB565", expected_rgb565, False)]
-            for format_name, pil_format, expected_size, swap_rb in formats_to_try:
-                try:
-                    if pil_format == "RGB565":
-                        rgb_data = bytearray(expected_rgb)
-                        for i in range(0, expected_rgb565, 2):
-                            if i + 1 < len(data):
-                                pixel = (data[i + 1] << 8) | data[i]
-                                r = ((pixel >> 11) & 0x1F) << 3
-                                g = ((pixel >> 5) & 0x3F) << 2
-                                b = (pixel & 0x1F) << 3
-                                rgb_idx = (i // 2) * 3
-                                if rgb_idx + 2 < len(rgb_data):
-                                    rgb_data[rgb_idx] = r
-                                    rgb_data[rgb_idx + 1] = g
-                                    rgb_data[rgb_idx + 2] = b
-                        img = Image.frombytes('RGB', (self.device_width, self.device_height), bytes(rgb_data))
-                        img_rgb = img
-                    elif swap_rb:
-                        arr = np.frombuffer(data[:expected_size], dtype=np.uint8)
-                        arr = arr.reshape((self.device_height, self.device_width, int(expected_size // (self.device_width * self.device_height))))
-                        arr = arr[..., [2, 1, 0, 3]] if arr.shape[2] == 4 else arr[..., [2, 1, 0]]
-                        img = Image.fromarray(arr)
-                        img_rgb = img.convert('RGB')
-                    else:
-                        img = Image.frombytes(pil_format, (self.device_width, self.device_height), data[:expected_size])
-                        img_rgb = img.convert('RGB') if pil_format == 'RGBA' else img
-                    break
-                except Exception as e:
-                    print(f"Failed to decode with {format_name}: {e}")
-                    continue
+            img_rgb = decode_framebuffer(data, self.device_width, self.device_height,
+                                         self._effective_pixel_profile())
+            frame_token = None
+            frame_hash = None
             if img_rgb is None:
                 print(f"Failed to decode framebuffer with auto-detection")
                 img_rgb = Image.new('RGB', (self.device_width, self.device_height), (255, 0, 0))
-            crop_top = 0
-            if img_rgb is not None and img_rgb.height > 50:
-                def has_black_status_bar(img):
-                    import numpy as np
-                    arr = np.array(img)
-                    if arr.shape[0] < 50:
-                        return False
-                    top = arr[:25, :, :3]
-                    return (top.mean() < 16)
-                if has_black_status_bar(img_rgb):
-                    crop_top = 25
-                    img_rgb = img_rgb.crop((0, crop_top, img_rgb.width, img_rgb.height))
-            src_height = self.device_height - crop_top
-            display_height = int(src_height * self.display_scale)
-            resized_img = img_rgb.resize((self.display_width, display_height), Image.Resampling.LANCZOS)
-            # Always pad to full display height, centering the image vertically
-            from PIL import Image
-            padded = Image.new('RGB', (self.display_width, self.display_height), (0,0,0))
-            y_offset = (self.display_height - display_height) // 2
-            padded.paste(resized_img, (0, y_offset))
-            photo = ImageTk.PhotoImage(padded)
-            self.after_idle(lambda: self.update_screen_display(photo, self.display_height))
-            # Save the last screen image for input mapping
-            self.last_screen_image = img_rgb
+            else:
+                self._on_frame_decoded(img_rgb)
+                frame_hash = self.last_frame_hash
+                if pull_start is not None:
+                    frame_token = self.latency_tracer.frame(pull_start, pull_end, time.perf_counter(), frame_hash)
+            self._perf_stage("decode", stage_start)
+            self.render_preview(img_rgb, frame_hash, frame_token)
         except Exception as e:
             print(f"Framebuffer processing error: {e}")
             try:
-                from PIL import Image
+                from PIL import Image, ImageTk
+                self.displayed_frame_key = None
                 error_img = Image.new('RGB', (self.device_width, self.device_height), (255, 0, 0))
                 resized_error_img = error_img.resize((self.display_width, self.display_height), Image.Resampling.LANCZOS)
                 photo = ImageTk.PhotoImage(resized_error_img)
@@ -622,6 +4735,455 @@ class Y1HelperApp(tk.Tk):
             except:
                 pass
     
+    def render_preview(self, img_rgb, frame_hash=None, frame_token=None):
+        """Crop, scale and queue a decoded frame for the canvas, reusing cached renders of the same frame"""
+        from PIL import ImageTk
+        stage_start = time.perf_counter()
+        geometry = (self.display_width, self.display_height, self.display_scale)
+        frame_key = (frame_hash, geometry) if frame_hash is not None else None
+        if frame_key is not None and frame_key == self.displayed_frame_key:
+            # Already on the canvas: no new PhotoImage or canvas redraw for an unchanged screen
+            self.after_idle(lambda: self._frame_unchanged(frame_token))
+            return
+        cached = self.scale_cache.get(frame_hash, geometry) if frame_hash is not None else None
+        if cached is not None:
+            crop_top, padded = cached
+            stage_start = self._perf_stage("resize", stage_start)
+        else:
+            crop_top = detect_status_bar_crop(img_rgb)
+            if crop_top:
+                img_rgb = img_rgb.crop((0, crop_top, img_rgb.width, img_rgb.height))
+            stage_start = self._perf_stage("crop", stage_start)
+            # Always pad to full display height, centering the image vertically
+            padded = scale_for_display(img_rgb, *geometry)
+            stage_start = self._perf_stage("resize", stage_start)
+            if frame_hash is not None:
+                self.scale_cache.put(frame_hash, geometry, crop_top, padded)
+            # Save the last screen image for input mapping
+            self.last_screen_image = img_rgb
+        self.last_crop_top = crop_top
+        photo = ImageTk.PhotoImage(padded)
+        self._perf_stage("photo", stage_start)
+        self.displayed_frame_key = frame_key
+        self.after_idle(lambda: self.update_screen_display(photo, self.display_height, frame_token))
+    
+    def _frame_unchanged(self, frame_token):
+        """Account for a captured frame identical to the one already displayed"""
+        self.perf.frame_displayed()
+        if frame_token is not None:
+            self.latency_tracer.displayed(frame_token, time.perf_counter())
+    
+    def _on_preview_area_resized(self, event):
+        """Refit the preview after the window is resized (debounced while dragging)"""
+        if self.zoom_var.get() != "Fit":
+            return
+        if self.zoom_pending is not None:
+            self.after_cancel(self.zoom_pending)
+        self.zoom_pending = self.after(50, self.apply_zoom)
+    
+    def apply_zoom(self):
+        """Size the preview for the selected zoom level and redraw the last frame at the new size"""
+        self.zoom_pending = None
+        zoom = ZOOM_LEVELS.get(self.zoom_var.get())
+        area = self.preview_area
+        if zoom is None:
+            width, height = area.winfo_width(), area.winfo_height()
+            if width < 20 or height < 20:
+                return  # Not laid out yet
+            scale = min(width / self.device_width, height / self.device_height)
+        else:
+            scale = zoom
+        display_width, display_height = int(self.device_width * scale), int(self.device_height * scale)
+        if zoom is None:
+            # Keep the window the size the user made it; the preview only fills it
+            self.geometry(f"{self.winfo_width()}x{self.winfo_height()}")
+            area.configure(width=160, height=120)
+        else:
+            # Grow or shrink the window around the zoomed preview
+            area.configure(width=display_width, height=display_height)
+            self.geometry("")
+        if (display_width, display_height, scale) == (self.display_width, self.display_height, self.display_scale):
+            return
+        self.display_scale = scale
+        self.display_width, self.display_height = display_width, display_height
+        self.screen_canvas.config(width=display_width, height=display_height)
+        self.status_var.set(f"Zoom {self.zoom_var.get()} ({scale * 100:.0f}%)")
+        frame = self.last_frame
+        if frame is not None:
+            self.render_preview(frame, self.last_frame_hash)
+    
+    def _perf_stage(self, stage, stage_start):
+        """Record the time since stage_start for a pipeline stage and return the new start time"""
+        now = time.perf_counter()
+        self.perf.record(stage, now - stage_start)
+        return now
+    
+    def toggle_perf_hud(self, event=None):
+        """Toggle the performance HUD (F3 or Screen menu)"""
+        if event is not None:
+            self.hud_var.set(not self.hud_var.get())
+        if self.hud_timer is not None:
+            self.after_cancel(self.hud_timer)
+            self.hud_timer = None
+        self.draw_perf_hud()
+        if self.hud_var.get():
+            self.hud_timer = self.after(500, self._refresh_perf_hud)
+    
+    def _refresh_perf_hud(self):
+        """Keep the HUD fresh even when no new frames arrive"""
+        self.hud_timer = None
+        if self.hud_var.get():
+            self.draw_perf_hud()
+            self.hud_timer = self.after(500, self._refresh_perf_hud)
+    
+    def draw_perf_hud(self):
+        """Draw (or remove) the performance HUD overlay on the screen canvas"""
+        self.screen_canvas.delete("hud")
+        if not self.hud_var.get():
+            return
+        lines = [f"{self.perf.fps():5.1f} fps      p50     p99"]
+        for label, stage in self.hud_stages:
+            histogram = self.perf.stage(stage)
+            if histogram is not None:
+                lines.append(f"{label:<8} {histogram.percentile(50):7.1f} {histogram.percentile(99):7.1f} ms")
+        text = self.screen_canvas.create_text(6, 6, anchor=tk.NW, text="\n".join(lines), fill="#00ff66",
+                                              font=("Courier", 8), tags="hud")
+        x0, y0, x1, y1 = self.screen_canvas.bbox(text)
+        background = self.screen_canvas.create_rectangle(x0 - 3, y0 - 3, x1 + 3, y1 + 3, fill="black",
+                                                         stipple="gray50", outline="", tags="hud")
+        self.screen_canvas.tag_lower(background, text)
+    
+    def export_perf_data(self):
+        """Export the rolling performance histograms as JSON"""
+        out_path = filedialog.asksaveasfilename(
+            title="Export performance data",
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if not out_path:
+            return
+        try:
+            with open(out_path, "w") as f:
+                json.dump(self.perf.snapshot(), f, indent=2)
+            self.status_var.set(f"Performance data exported to {out_path}")
+        except Exception as e:
+            self.status_var.set(f"Performance export failed: {e}")
+    
+    def toggle_latency_tracing(self):
+        """Start or stop tracing input-to-photon latency (Tools menu)"""
+        self.latency_tracer.enabled = self.latency_trace_var.get()
+        if self.latency_tracer.enabled:
+            self.status_var.set("Tracing input latency - press keys or click the screen")
+            return
+        summary = self.latency_tracer.summary()
+        print("Input latency (ms)     p50      p99")
+        for stage, (p50, p99) in summary.items():
+            print(f"  {stage:<18} {p50:7.1f}  {p99:7.1f}")
+        self.status_var.set(f"Latency tracing stopped (p50 {summary['total'][0]:.0f} ms)")
+    
+    def _on_latency_traced(self, result):
+        """Report one traced input event on the console and status bar (any thread)"""
+        stages = ", ".join(f"{stage} {seconds * 1000:.0f}" for stage, seconds in result["stages"].items())
+        if result["changed"]:
+            self.perf.record("input to photon", result["total"])
+            message = f"Latency {result['label']}: {result['total'] * 1000:.0f} ms ({stages})"
+        else:
+            message = f"Latency {result['label']}: no visible change ({stages})"
+        print(message)
+        self.after(0, lambda: self.status_var.set(message))
+    
+    def export_latency_trace(self):
+        """Export traced input events with capture spans as a Chrome trace-event timeline"""
+        if not self.latency_tracer.results:
+            messagebox.showinfo("Latency Trace", "No input events traced yet.\n\n"
+                                "Enable Tools > Trace Input Latency, then press keys or click the screen.")
+            return
+        out_path = filedialog.asksaveasfilename(
+            title="Export latency trace",
+            defaultextension=".json",
+            filetypes=[("Chrome trace", "*.json"), ("All files", "*.*")]
+        )
+        if not out_path:
+            return
+        try:
+            with open(out_path, "w") as f:
+                json.dump(self.latency_tracer.chrome_trace(), f)
+            self.status_var.set(f"Latency trace exported to {out_path}")
+        except Exception as e:
+            self.status_var.set(f"Latency trace export failed: {e}")
+    
+    def _on_frame_decoded(self, img_rgb):
+        """Hand a freshly decoded full-size frame to any active consumers (capture thread)"""
+        timestamp = time.time()
+        raw = img_rgb.tobytes()
+        frame_hash = hashlib.blake2b(raw, digest_size=16).digest()
+        with self.frame_condition:
+            self.last_frame = img_rgb
+            self.last_frame_hash = frame_hash
+            self.frame_seq += 1
+            self.frame_condition.notify_all()
+        if self.replay_enabled_var.get():
+            self.replay_buffer.append(img_rgb, frame_hash, timestamp, raw)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.append(img_rgb, timestamp, raw)
+        frame_export = self.frame_export
+        if frame_export is not None:
+            frame_export.publish(raw, img_rgb.width, img_rgb.height, timestamp)
+        stream_server = self.stream_server
+        if stream_server is not None:
+            stream_server.publish(img_rgb)
+        if self.ui_inspect_var.get():
+            self._check_ui_index(img_rgb, frame_hash)
+    
+    def _check_ui_index(self, img_rgb, frame_hash):
+        """Mark the cached hierarchy stale after a large screen change and re-dump it, rate-limited (capture thread)"""
+        index = self.ui_index
+        if index is not None and not self.ui_index_stale and frame_hash != self.ui_checked_hash:
+            self.ui_checked_hash = frame_hash
+            if not self._ui_index_matches(index, img_rgb, frame_hash):
+                self.ui_index_stale = True
+        if ((index is None or self.ui_index_stale) and not self.ui_dump_pending
+                and time.monotonic() - self.ui_dump_started >= UI_DUMP_MIN_INTERVAL):
+            self.ui_dump_pending = True
+            self.ui_dump_started = time.monotonic()
+            self.after(0, self._refresh_ui_index)
+    
+    def toggle_recording(self):
+        """Start or stop recording the device screen to the ring file"""
+        if self.recorder is None:
+            try:
+                recorder = FrameRecorder(self.recording_path, self.recording_capacity)
+            except Exception as e:
+                messagebox.showerror("Screen Recording", f"Failed to create recording file:\n\n{e}")
+                return
+            recorder.start()
+            self.recorder = recorder
+            self.screen_menu.entryconfig(0, label="Stop Recording")
+            self.screen_menu.entryconfig(1, state="disabled")
+            self.status_var.set("Recording screen...")
+        else:
+            recorder, self.recorder = self.recorder, None
+            recorder.stop()
+            self.screen_menu.entryconfig(0, label="Start Recording")
+            self.screen_menu.entryconfig(1, state="normal")
+            dropped = f", {recorder.dropped_frames} dropped" if recorder.dropped_frames else ""
+            self.status_var.set(f"Recording stopped ({recorder.count} frames kept{dropped})")
+    
+    def toggle_replay_buffer(self):
+        """Enable or disable the always-on instant replay buffer"""
+        if self.replay_enabled_var.get():
+            self.status_var.set("Instant replay buffer enabled")
+        else:
+            self.replay_buffer.clear()
+            self.status_var.set("Instant replay buffer disabled")
+    
+    def update_replay_menu(self):
+        """Refresh the replay memory report shown in the Screen menu"""
+        frames, unique, used = self.replay_buffer.stats()
+        if frames:
+            label = (f"Replay buffer: {frames} frames ({unique} unique), "
+                     f"{used / (1024 * 1024):.1f} of {self.replay_buffer.max_bytes // (1024 * 1024)} MB")
+        else:
+            label = "Replay buffer: empty"
+        self.screen_menu.entryconfig(5, label=label)
+    
+    def save_instant_replay(self, event=None):
+        """Dump the instant replay buffer to disk as a frame sequence plus index"""
+        frames, unique, used = self.replay_buffer.stats()
+        if not frames:
+            self.status_var.set("Instant replay buffer is empty")
+            return
+        out_dir = os.path.join(os.path.expanduser("~"), "Y1 Helper", "Replays",
+                               time.strftime("replay_%Y%m%d_%H%M%S"))
+        self.status_var.set("Saving instant replay...")
+        def worker():
+            try:
+                count = self.replay_buffer.dump(out_dir)
+                message = f"Instant replay saved: {count} frames to {out_dir}"
+            except Exception as e:
+                print(f"Instant replay save error: {e}")
+                message = f"Instant replay save failed: {e}"
+            self.after(0, lambda: self.status_var.set(message))
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def export_recording(self):
+        """Export the last recording as an animated GIF/APNG or an image sequence"""
+        if not os.path.exists(self.recording_path):
+            messagebox.showinfo("Export Recording", "Nothing has been recorded yet.")
+            return
+        # No defaultextension: a name without an extension is how the image sequence folder is chosen
+        out_path = filedialog.asksaveasfilename(
+            title="Export recording (name without extension for an image sequence folder)",
+            filetypes=[("Animated GIF", "*.gif"), ("Animated PNG", "*.png"),
+                       ("Image sequence (folder)", "*")]
+        )
+        if not out_path:
+            return
+        if os.path.splitext(out_path)[1].lower() not in ("", ".gif", ".png", ".apng"):
+            messagebox.showerror("Export Recording", "Use a .gif or .png name, or no extension for an image sequence folder.")
+            return
+        self.status_var.set("Exporting recording...")
+        def progress(frames):
+            if frames % 25 == 0:
+                self.after(0, lambda: self.status_var.set(f"Exporting recording... {frames} frames"))
+        def worker():
+            try:
+                frames = FrameRecorder.export(self.recording_path, out_path, progress)
+                message = f"Exported {frames} frames to {out_path}"
+                if frames >= ANIMATION_MAX_FRAMES and os.path.splitext(out_path)[1]:
+                    message += f" (newest {ANIMATION_MAX_FRAMES}; export an image sequence for all)"
+                self.after(0, lambda: self.status_var.set(message))
+            except Exception as e:
+                print(f"Recording export error: {e}")
+                message = f"Recording export failed: {e}"
+                self.after(0, lambda: self.status_var.set(message))
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def wait_for_stable_frame(self, timeout=5.0, settle_frames=2):
+        """Block until the capture loop delivers settle_frames identical new frames (worker threads only)"""
+        deadline = time.time() + timeout
+        stable_hash = None
+        stable_count = 0
+        frame = None
+        with self.frame_condition:
+            seq = self.frame_seq
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return frame
+                self.frame_condition.wait(remaining)
+                if self.frame_seq == seq:
+                    continue
+                seq = self.frame_seq
+                frame = self.last_frame
+                if self.last_frame_hash == stable_hash:
+                    stable_count += 1
+                else:
+                    stable_hash = self.last_frame_hash
+                    stable_count = 1
+                if stable_count >= settle_frames:
+                    return frame
+    
+    def run_script_step(self, step):
+        """Execute one scripted device action (used by snapshot suites)"""
+        if "key" in step or "keyevent" in step:
+            key = step.get("key", step.get("keyevent"))
+            keycode = KEYCODES[key.upper()] if isinstance(key, str) else int(key)
+            for _ in range(int(step.get("repeat", 1))):
+                self.run_adb_command(f"shell input keyevent {keycode}")
+        elif "tap" in step:
+            target = step["tap"]
+            if isinstance(target, dict):
+                # {"id": ...} and/or {"text": ...}: resolved from the cached hierarchy
+                element = self.ui_index_for_current_frame().find(target.get("id"), target.get("text"))
+                if element is None:
+                    raise ValueError(f"No UI element matches {target}")
+                x, y = UiElementIndex.center(element)
+            else:
+                x, y = target
+            self.run_adb_command(f"shell input tap {int(x)} {int(y)}")
+        elif "text" in step:
+            self.run_adb_command(f"shell input text {step['text'].replace(' ', '%s')}")
+        elif "launch" in step:
+            self.run_adb_command(f"shell monkey -p {step['launch']} -c android.intent.category.LAUNCHER 1")
+        if "wait" in step:
+            time.sleep(float(step["wait"]))
+    
+    def run_snapshot_suite(self, update_golden=False):
+        """Run a JSON snapshot script against the device and compare with golden images"""
+        script_path = filedialog.askopenfilename(
+            title="Select snapshot script",
+            filetypes=[("Snapshot scripts", "*.json"), ("All files", "*.*")]
+        )
+        if not script_path:
+            return
+        try:
+            with open(script_path) as f:
+                script = json.load(f)
+        except Exception as e:
+            messagebox.showerror("Snapshot Suite", f"Failed to load snapshot script:\n\n{e}")
+            return
+        if not self.device_connected:
+            messagebox.showerror("Snapshot Suite", "Device not connected!")
+            return
+        threading.Thread(target=self._run_snapshot_script,
+                         args=(script, os.path.dirname(os.path.abspath(script_path)), update_golden),
+                         daemon=True).start()
+    
+    def _run_snapshot_script(self, script, script_dir, update_golden):
+        """Drive the device through a snapshot script, then compare all captures in parallel"""
+        from concurrent.futures import ThreadPoolExecutor
+        suite = script.get("name", "snapshots")
+        golden_dir = os.path.join(script_dir, script.get("golden_dir", "golden"))
+        out_dir = os.path.join(script_dir, "results", time.strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(golden_dir, exist_ok=True)
+        os.makedirs(out_dir, exist_ok=True)
+        def status(message):
+            self.after(0, lambda: self.status_var.set(message))
+        # Capture phase: steps run sequentially on the device
+        captures = []
+        try:
+            if script.get("app"):
+                self.run_script_step({"launch": script["app"], "wait": script.get("launch_wait", 2)})
+            for step in script.get("steps", []):
+                if "snapshot" not in step:
+                    self.run_script_step(step)
+                    continue
+                status(f"Snapshot suite: capturing {step['snapshot']}...")
+                frame = self.wait_for_stable_frame(timeout=step.get("timeout", 5.0))
+                if frame is None:
+                    raise RuntimeError(f"No frame captured for snapshot {step['snapshot']}")
+                captures.append((step, frame.copy()))
+        except Exception as e:
+            print(f"Snapshot capture error: {e}")
+            message = f"Snapshot suite aborted: {e}"
+            self.after(0, lambda: self.status_var.set(message))
+            return
+        status(f"Snapshot suite: comparing {len(captures)} snapshots...")
+        def compare(capture):
+            step, frame = capture
+            name = step["snapshot"]
+            golden_path = os.path.join(golden_dir, f"{name}.png")
+            actual_name = f"{name}.actual.png"
+            frame.save(os.path.join(out_dir, actual_name))
+            result = {"name": name, "actual": actual_name}
+            if update_golden or not os.path.exists(golden_path):
+                frame.save(golden_path)
+                result["status"] = "new"
+                return result
+            from PIL import Image
+            with Image.open(golden_path) as golden:
+                passed, details, diff_img = compare_snapshot(
+                    golden, frame,
+                    tolerance=step.get("tolerance", script.get("tolerance", 0)),
+                    max_diff_ratio=step.get("max_diff_ratio", script.get("max_diff_ratio", 0.0)),
+                    regions=step.get("regions", []))
+            result.update(details)
+            result["golden"] = os.path.relpath(golden_path, out_dir)
+            if diff_img is not None:
+                result["diff"] = f"{name}.diff.png"
+                diff_img.save(os.path.join(out_dir, result["diff"]))
+            result["status"] = "pass" if passed else "fail"
+            return result
+        # Comparison phase: numpy releases the GIL, so snapshots compare in parallel
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool:
+            snapshots = list(pool.map(compare, captures))
+        results = {
+            "suite": suite,
+            "snapshots": snapshots,
+            "passed": sum(1 for s in snapshots if s["status"] == "pass"),
+            "failed": sum(1 for s in snapshots if s["status"] == "fail"),
+            "new": sum(1 for s in snapshots if s["status"] == "new"),
+        }
+        write_snapshot_report(results, out_dir)
+        summary = (f"{results['passed']} passed, {results['failed']} failed, {results['new']} new golden images\n\n"
+                   f"Report: {os.path.join(out_dir, 'report.html')}")
+        def done():
+            self.status_var.set(f"Snapshot suite {suite}: {results['failed']} failed")
+            messagebox.showinfo("Snapshot Suite", summary)
+        self.after(0, done)
+    
     def force_framebuffer_refresh(self):
         """Force an immediate framebuffer refresh"""
         try:
@@ -634,14 +5196,16 @@ class Y1HelperApp(tk.Tk):
             fb_temp_path = os.path.join(temp_dir, "y1_fb0.tmp")
             
             # Pull framebuffer and process immediately
-            success, stdout, stderr = self.run_adb_command(f"pull /dev/graphics/fb0 \"{fb_temp_path}\"")
-            if success and os.path.exists(fb_temp_path):
-                self.process_framebuffer(fb_temp_path)
+            pull_start = time.perf_counter()
+            data = read_framebuffer(self.capture_method, fb_temp_path, self.adb_client)
+            if data:
+                self.process_framebuffer_data(data, pull_start, time.perf_counter())
         except Exception as e:
             print(f"Force refresh error: {e}")
     
-    def update_screen_display(self, photo, display_height=None):
+    def update_screen_display(self, photo, display_height=None, frame_token=None):
         """Update screen display on main thread, with dynamic canvas height if needed"""
+        stage_start = time.perf_counter()
         try:
             if hasattr(self, 'current_photo'):
                 del self.current_photo
@@ -679,115 +5243,165 @@ class Y1HelperApp(tk.Tk):
             self.current_photo = photo
             self.screen_canvas.delete("all")
             self.screen_canvas.create_image(0, 0, anchor=tk.NW, image=self.current_photo)
-        except Exception as e:
-            print(f"Display update error: {e}")
-    
-    def show_disconnected_placeholder(self):
-        """Show placeholder when device is not connected"""
-        try:
-            # Create a placeholder image similar to iPod recovery screen
-            img = Image.new('RGB', (self.display_width, self.display_height), (40, 40, 40))  # Dark gray background
-            
-            # Create a simple icon (USB cable symbol)
-            icon_size = int(60 * self.display_scale)  # Scale icon size
-            icon_x = (self.display_width - icon_size) // 2
-            icon_y = (self.display_height - icon_size) // 2 - int(30 * self.display_scale)
-            
-            # Draw a simple USB icon (white rectangle with lines)
-            from PIL import ImageDraw
-            draw = ImageDraw.Draw(img)
-            
-            # USB connector outline
-            draw.rectangle([icon_x, icon_y, icon_x + icon_size, icon_y + icon_size], 
-                         outline=(200, 200, 200), width=3)
-            
-            # USB pins (horizontal lines)
-            pin_y1 = icon_y + 15
-            pin_y2 = icon_y + 30
-            pin_y3 = icon_y + 45
-            draw.line([icon_x + 10, pin_y1, icon_x + icon_size - 10, pin_y1], 
-                     fill=(200, 200, 200), width=2)
-            draw.line([icon_x + 10, pin_y2, icon_x + icon_size - 10, pin_y2], 
-                     fill=(200, 200, 200), width=2)
-            draw.line([icon_x + 10, pin_y3, icon_x + icon_size - 10, pin_y3], 
-                     fill=(200, 200, 200), width=2)
-            
-            # Add text with proper font
-            try:
-                from PIL import ImageFont
-                # Try to use a system font
-                font_size = 16
-                try:
-                    font = ImageFont.truetype("arial.ttf", font_size)
-                except:
-                    try:
-                        font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", font_size)
-                    except:
-                        font = ImageFont.load_default()
-                
-                text = "Please Connect Your Y1"
-                # Get text size for centering
-                bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                text_x = (self.display_width - text_width) // 2
-                text_y = icon_y + icon_size + int(20 * self.display_scale)
-                
-                # Draw text
-                draw.text((text_x, text_y), text, fill=(200, 200, 200), font=font)
-            except Exception as e:
-                # Fallback to simple text rendering
-                text = "Please Connect Your Y1"
-                text_x = (self.display_width - len(text) * 8) // 2
-                text_y = icon_y + icon_size + int(20 * self.display_scale)
-                
-                # Draw text as simple rectangles
-                for i, char in enumerate(text):
-                    char_x = text_x + i * 8
-                    if char != ' ':
-                        draw.rectangle([char_x, text_y, char_x + 6, text_y + 10], 
-                                     fill=(200, 200, 200))
-            
-            # Convert to PhotoImage and display
-            photo = ImageTk.PhotoImage(img)
-            self.screen_canvas.delete("all")
-            self.screen_canvas.create_image(0, 0, anchor=tk.NW, image=photo)
-            
-            # Store reference
+            self._perf_stage("canvas", stage_start)
+            self.perf.frame_displayed()
+            if frame_token is not None:
+                self.latency_tracer.displayed(frame_token, time.perf_counter())
+            if not self.first_frame_shown:
+                self.first_frame_shown = True
+                elapsed = time.perf_counter() - _PROCESS_START
+                self.perf.record("startup first frame", elapsed)
+                print(f"Time to first frame: {elapsed:.2f}s")
+                self.status_var.set(f"First frame after {elapsed:.1f}s")
+            if self.hud_var.get():
+                self.draw_perf_hud()
+            if self.hover_element is not None:
+                self.draw_ui_highlight()
+        except Exception as e:
+            print(f"Display update error: {e}")
+    
+    def show_disconnected_placeholder(self):
+        """Show placeholder when device is not connected (plain canvas items, so PIL is not needed)"""
+        try:
+            canvas = self.screen_canvas
+            canvas.delete("all")
+            self.displayed_frame_key = None
             if hasattr(self, 'current_photo'):
                 del self.current_photo
-            self.current_photo = photo
-            
+            # Dark background similar to the iPod recovery screen
+            canvas.create_rectangle(0, 0, self.display_width, self.display_height, fill="#282828", outline="")
+            # Simple USB icon: connector outline with three pins
+            icon_size = int(60 * self.display_scale)
+            icon_x = (self.display_width - icon_size) // 2
+            icon_y = (self.display_height - icon_size) // 2 - int(30 * self.display_scale)
+            canvas.create_rectangle(icon_x, icon_y, icon_x + icon_size, icon_y + icon_size,
+                                    outline="#c8c8c8", width=3)
+            for pin_y in (icon_y + 15, icon_y + 30, icon_y + 45):
+                canvas.create_line(icon_x + 10, pin_y, icon_x + icon_size - 10, pin_y, fill="#c8c8c8", width=2)
+            canvas.create_text(self.display_width // 2, icon_y + icon_size + int(20 * self.display_scale),
+                               text="Please Connect Your Y1", fill="#c8c8c8", anchor=tk.N,
+                               font=("Arial", 12))
         except Exception as e:
             print(f"Placeholder display error: {e}")
     
+    def submit_command(self, label, fn, on_done=None, priority=PRIORITY_HOUSEKEEPING):
+        """Run fn on the command executor and deliver its result to on_done(result) on the Tk thread"""
+        future = self.executor.submit(fn, priority=priority, label=label)
+        self._update_cancel_button()
+        def done(f):
+            self._update_cancel_button()
+            if f.cancelled() or f.cancel_event.is_set():
+                self.status_var.set(f"{label} cancelled")
+                return
+            error = f.exception()
+            if error is not None:
+                print(f"{label} failed: {error}")
+                self.status_var.set(f"{label} failed: {error}")
+                return
+            if on_done is not None:
+                on_done(f.result())
+        future.add_done_callback(lambda f: self.after(0, lambda: done(f)))
+        return future
+    
+    def cancel_commands(self):
+        """Cancel all queued and running housekeeping commands (Cancel button)"""
+        pending = [f for f in self.executor.pending() if f.priority >= PRIORITY_HOUSEKEEPING]
+        self.executor.cancel_all(min_priority=PRIORITY_HOUSEKEEPING)
+        if pending:
+            self.status_var.set("Cancelling: " + ", ".join(sorted({f.label for f in pending})))
+    
+    def _update_cancel_button(self):
+        """Show the Cancel button while long-running commands are queued or running"""
+        if any(f.priority >= PRIORITY_HOUSEKEEPING for f in self.executor.pending()):
+            if not self.cancel_button.winfo_ismapped():
+                self.cancel_button.pack(side=tk.RIGHT, padx=(5, 0))
+        elif self.cancel_button.winfo_ismapped():
+            self.cancel_button.pack_forget()
+    
+    def send_input(self, command, success_message, failure_message, on_success=None, trace=None):
+        """Queue an adb input command on the ordered input queue and report the result"""
+        words = command.split()
+        if words[:3] == ["shell", "input", "keyevent"] and len(words) == 4 and words[3].isdigit():
+            if not self.input_queue.key(int(words[3]), success_message, failure_message, on_success, trace):
+                self.latency_tracer.injected(trace, 0.0, 0.0, success=False)  # Dropped auto-repeat
+        else:
+            self.input_queue.command(command, success_message, failure_message, on_success, trace)
+    
+    def _send_key_batch(self, keycodes):
+        """Inject a batch of key presses: pipelined over monkey, else one `input keyevent` with all keycodes"""
+        start = time.perf_counter()
+        if self.gesture_injector.inject([f"press {keycode}" for keycode in keycodes]):
+            self.perf.record("adb shell input", time.perf_counter() - start)
+            return True, ""
+        success, stdout, stderr = self.run_adb_command("shell input keyevent " + " ".join(map(str, keycodes)))
+        return success, stderr
+    
+    def _send_input_command(self, command):
+        success, stdout, stderr = self.run_adb_command(command)
+        return success, stderr
+    
+    def _on_input_batch(self, batch, success, error, started, finished):
+        """Report a sent input batch in the status bar (input queue thread)"""
+        for item in batch:
+            if item[5] is not None:
+                self.latency_tracer.injected(item[5], started, finished, success)
+        if success and len(batch) == 1 and batch[0][2] is None and batch[0][4] is None:
+            return  # Nothing to report (e.g. a touch move)
+        if error == GestureInjector.DEFERRED:
+            return  # Not a failure: the key is sent when it is released
+        def report():
+            if not success:
+                self.status_var.set(f"{batch[-1][3] or 'Input failed'}: {error}")
+                return
+            if len(batch) > 1:
+                self.status_var.set(f"Sent {describe_key_runs([item[1] for item in batch])}")
+            elif batch[0][2]:
+                self.status_var.set(batch[0][2])
+            if batch[-1][4] is not None:
+                batch[-1][4]()
+        self.after(0, report)
+    
+    def request_framebuffer_refresh(self):
+        """Queue a framebuffer refresh unless one is already waiting"""
+        if any(f.label == "Refresh screen" for f in self.executor.pending(PRIORITY_CAPTURE)):
+            return
+        self.submit_command("Refresh screen", self.force_framebuffer_refresh, priority=PRIORITY_CAPTURE)
+    
     def launch_settings(self):
         """Launch Android Settings app"""
-        success, stdout, stderr = self.run_adb_command(
-            "shell am start -n com.android.settings/.Settings")
-        if success:
-            self.status_var.set("Settings launched")
-            self.current_app = "com.android.settings"
-            self.control_launcher = False  # Disable launcher control
-            self.launcher_var.set(False)  # Update UI checkbox
-        else:
-            self.status_var.set(f"Failed to launch settings: {stderr}")
+        def on_done(result):
+            success, stdout, stderr = result
+            if success:
+                self.status_var.set("Settings launched")
+                self.current_app = "com.android.settings"
+                self.control_launcher = False  # Disable launcher control
+                self.launcher_var.set(False)  # Update UI checkbox
+            else:
+                self.status_var.set(f"Failed to launch settings: {stderr}")
+        self.status_var.set("Launching settings...")
+        self.submit_command("Launch settings",
+                            lambda: self.run_adb_command("shell am start -n com.android.settings/.Settings"),
+                            on_done)
     
     def go_home(self):
         """Restart the built-in home app (com.innioasis.y1)"""
         self.status_var.set("Restarting Home App...")
-        # Force-stop the home app
-        self.run_adb_command("shell am force-stop com.innioasis.y1")
-        # Launch the home app
-        success, stdout, stderr = self.run_adb_command("shell monkey -p com.innioasis.y1 -c android.intent.category.LAUNCHER 1")
-        if success:
-            self.status_var.set("Home app restarted (com.innioasis.y1)")
-            self.current_app = "com.innioasis.y1"
-            self.control_launcher = True  # Enable launcher control
-            self.launcher_var.set(True)  # Update UI checkbox
-        else:
-            self.status_var.set("Failed to restart home app: " + (stderr or stdout))
-            messagebox.showerror("Restart Home App", "Failed to restart the home app.\n\nPlease ensure:\n- Device is unlocked\n- Y1 launcher is installed\n- Device is responsive")
+        def work():
+            # Force-stop the home app
+            self.run_adb_command("shell am force-stop com.innioasis.y1")
+            # Launch the home app
+            return self.run_adb_command("shell monkey -p com.innioasis.y1 -c android.intent.category.LAUNCHER 1")
+        def on_done(result):
+            success, stdout, stderr = result
+            if success:
+                self.status_var.set("Home app restarted (com.innioasis.y1)")
+                self.current_app = "com.innioasis.y1"
+                self.control_launcher = True  # Enable launcher control
+                self.launcher_var.set(True)  # Update UI checkbox
+            else:
+                self.status_var.set("Failed to restart home app: " + (stderr or stdout))
+                messagebox.showerror("Restart Home App", "Failed to restart the home app.\n\nPlease ensure:\n- Device is unlocked\n- Y1 launcher is installed\n- Device is responsive")
+        self.submit_command("Restart home app", work, on_done)
     
     def install_apk(self):
         """Install APK file"""
@@ -799,39 +5413,39 @@ class Y1HelperApp(tk.Tk):
             self.status_var.set("Installing APK...")
             
             # Convert to absolute path using platform-appropriate methods
-            import os
-            import platform
             file_path = os.path.abspath(file_path)
             
-            # Use the full path in the ADB command
-            success, stdout, stderr = self.run_adb_command(f"install -r \"{file_path}\"")
-            
-            if success:
-                self.status_var.set("APK installed successfully")
-                self.refresh_apps()
-            else:
-                # Provide more detailed error information
-                error_msg = stderr.strip() if stderr else stdout.strip()
-                if "device not found" in error_msg.lower():
-                    self.status_var.set("APK installation failed: Device not connected")
-                elif "permission denied" in error_msg.lower():
-                    self.status_var.set("APK installation failed: Permission denied - check USB debugging")
-                elif "failed to install" in error_msg.lower():
-                    self.status_var.set("APK installation failed: Incompatible APK or insufficient storage")
+            def on_done(result):
+                success, stdout, stderr = result
+                if success:
+                    self.status_var.set("APK installed successfully")
+                    self.refresh_apps()
                 else:
-                    self.status_var.set(f"APK installation failed: {error_msg}")
-                
-                # Show detailed error in console for debugging
-                print(f"APK Installation Error:")
-                print(f"  File: {file_path}")
-                print(f"  Error: {error_msg}")
+                    # Provide more detailed error information
+                    error_msg = stderr.strip() if stderr else stdout.strip()
+                    if "device not found" in error_msg.lower():
+                        self.status_var.set("APK installation failed: Device not connected")
+                    elif "permission denied" in error_msg.lower():
+                        self.status_var.set("APK installation failed: Permission denied - check USB debugging")
+                    elif "failed to install" in error_msg.lower():
+                        self.status_var.set("APK installation failed: Incompatible APK or insufficient storage")
+                    else:
+                        self.status_var.set(f"APK installation failed: {error_msg}")
+                    
+                    # Show detailed error in console for debugging
+                    print(f"APK Installation Error:")
+                    print(f"  File: {file_path}")
+                    print(f"  Error: {error_msg}")
+            
+            # Use the full path in the ADB command
+            self.submit_command("Install APK",
+                                lambda: self.run_adb_command(f"install -r \"{file_path}\"", timeout=120),
+                                on_done)
         else:
             self.status_var.set("APK installation cancelled")
     
     def prepare_device(self):
         """Install stock Y1 launcher from 2.1.9 update for development, plus Nova Launcher and KeyCodeDisp if available"""
-        import os
-        from tkinter import messagebox
         # Show friendly preparation dialog
         prep_msg = (
             "Preparing your Y1 device for development!\n\n"
@@ -859,79 +5473,184 @@ class Y1HelperApp(tk.Tk):
             messagebox.showerror("Missing APK(s)", f"The following APK(s) are required for preparation but not found:\n\n{chr(10).join(missing)}\n\nPlease add them to the workspace directory.")
             return
         self.status_var.set("Preparing device - Installing stock launcher, Nova Launcher, and KeyCodeDisp...")
-        # Install stock launcher
-        abs_path = os.path.abspath(stock_launcher_path)
-        success, stdout, stderr = self.run_adb_command(f"install -r \"{abs_path}\"", timeout=60)
-        if not success:
-            self.status_var.set(f"Failed to install stock launcher: {stderr}")
-            messagebox.showerror("Install Error", f"Failed to install stock launcher:\n\n{stderr}")
+        def status(message):
+            self.after(0, lambda: self.status_var.set(message))
+        def work():
+            # Install stock launcher, Nova Launcher and KeyCodeDisp; stop at the first failure
+            for label, apk_path in (("stock launcher", stock_launcher_path),
+                                    ("Nova Launcher", nova_launcher_path),
+                                    ("KeyCodeDisp", keycodedisp_path)):
+                status(f"Preparing device - Installing {label}...")
+                success, stdout, stderr = self.run_adb_command(f"install -r \"{os.path.abspath(apk_path)}\"", timeout=60)
+                if not success:
+                    return "install_failed", label, stderr
+            status("All launchers and KeyCodeDisp installed. Launching stock launcher...")
+            self.refresh_device_facts()  # Launcher install state changed
+            # Disable factory test package if present
+            self.run_adb_command("shell pm disable-user --user 0 com.ayst.factorytest")
+            # Launch the stock launcher
+            launch_success, launch_stdout, launch_stderr = self.run_adb_command(
+                "shell monkey -p com.innioasis.y1 -c android.intent.category.LAUNCHER 1")
+            # Set Y1 launcher as default home app
+            self.run_adb_command("shell cmd package set-home-activity com.innioasis.y1/.ui.LauncherActivity")
+            return "done", launch_success, launch_stderr
+        def on_done(result):
+            if result[0] == "install_failed":
+                label, stderr = result[1], result[2]
+                self.status_var.set(f"Failed to install {label}: {stderr}")
+                messagebox.showerror("Install Error", f"Failed to install {label}:\n\n{stderr}")
+                return
+            launch_success, launch_stderr = result[1], result[2]
+            if not launch_success:
+                self.status_var.set("Launcher installed, but failed to launch.")
+                print(f"Warning: Failed to launch stock launcher: {launch_stderr}")
+            else:
+                self.status_var.set("Launcher launched - Opening language settings...")
+                self.after(2000, self.change_device_language)
+            messagebox.showinfo("Device Prepared", "✓ Stock Y1 launcher (2.1.9), Nova Launcher, and KeyCodeDisp installed\n✓ Stock launcher set as default home\n✓ Language settings opened\n\nDevice is ready for Y1 development!")
+        self.submit_command("Prepare device", work, on_done)
+    
+    def prepare_fleet(self):
+        """Run the Prepare Device sequence on every connected Y1 at once, with a per-device progress table"""
+        missing = [apk_path for _, apk_path in FLEET_APKS if not os.path.exists(apk_path)]
+        if missing:
+            self.status_var.set(f"Missing APK(s): {', '.join(missing)}")
+            messagebox.showerror("Missing APK(s)", f"The following APK(s) are required for preparation but not found:\n\n{chr(10).join(missing)}\n\nPlease add them to the workspace directory.")
             return
-        # Install Nova Launcher
-        abs_nova = os.path.abspath(nova_launcher_path)
-        success, stdout, stderr = self.run_adb_command(f"install -r \"{abs_nova}\"", timeout=60)
-        if not success:
-            self.status_var.set(f"Failed to install Nova Launcher: {stderr}")
-            messagebox.showerror("Install Error", f"Failed to install Nova Launcher:\n\n{stderr}")
+        try:
+            serials = [serial for serial, state in self.adb_client.devices() if state == "device"]
+        except (OSError, AdbError) as e:
+            messagebox.showerror("Error", f"Could not list devices: {e}")
             return
-        # Install KeyCodeDisp
-        abs_keycode = os.path.abspath(keycodedisp_path)
-        success, stdout, stderr = self.run_adb_command(f"install -r \"{abs_keycode}\"", timeout=60)
-        if not success:
-            self.status_var.set(f"Failed to install KeyCodeDisp: {stderr}")
-            messagebox.showerror("Install Error", f"Failed to install KeyCodeDisp:\n\n{stderr}")
-            return
-        self.status_var.set("All launchers and KeyCodeDisp installed. Launching stock launcher...")
-        # Disable factory test package if present
-        self.run_adb_command("shell pm disable-user --user 0 com.ayst.factorytest")
-        # Launch the stock launcher
-        launch_success, launch_stdout, launch_stderr = self.run_adb_command(
-            "shell monkey -p com.innioasis.y1 -c android.intent.category.LAUNCHER 1")
-        # Set Y1 launcher as default home app
-        self.run_adb_command("shell cmd package set-home-activity com.innioasis.y1/.ui.LauncherActivity")
-        if not launch_success:
-            self.status_var.set("Launcher installed, but failed to launch.")
-            print(f"Warning: Failed to launch stock launcher: {launch_stderr}")
-        else:
-            self.status_var.set("Launcher launched - Opening language settings...")
-            self.after(2000, self.change_device_language)
-        messagebox.showinfo("Device Prepared", "✓ Stock Y1 launcher (2.1.9), Nova Launcher, and KeyCodeDisp installed\n✓ Stock launcher set as default home\n✓ Language settings opened\n\nDevice is ready for Y1 development!")
+        if not serials:
+            messagebox.showerror("Error", "No devices connected!")
+            return
+        if not messagebox.askyesno("Prepare All Devices",
+                                   f"Prepare {len(serials)} connected device(s) at once?\n\n"
+                                   "Each device gets the stock Y1 launcher (2.1.9), Nova Launcher and KeyCodeDisp, "
+                                   "has the factory test package disabled and the Y1 launcher set as home.\n\n"
+                                   "Language settings are not changed."):
+            return
+        if self.fleet_window is not None and self.fleet_window.winfo_exists():
+            self.fleet_window.destroy()
+        window = tk.Toplevel(self)
+        window.title("Prepare All Devices")
+        window.geometry("620x320")
+        self.fleet_window = window
+        tree = ttk.Treeview(window, columns=("serial", "step", "status"), show="headings")
+        for column, title, width in (("serial", "Device", 160), ("step", "Step", 220), ("status", "Status", 200)):
+            tree.heading(column, text=title)
+            tree.column(column, width=width)
+        tree.tag_configure("failed", foreground="#c00000")
+        tree.tag_configure("done", foreground="#006000")
+        for serial in serials:
+            tree.insert("", tk.END, iid=serial, values=(serial, "waiting", ""))
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.fleet_tree = tree
+        buttons = ttk.Frame(window, padding=(5, 0, 5, 5))
+        buttons.pack(fill=tk.X)
+        save_button = ttk.Button(buttons, text="Save Report...", command=self.save_fleet_report, state=tk.DISABLED)
+        save_button.pack(side=tk.RIGHT)
+        self.fleet_status_var = tk.StringVar(value=f"Preparing {len(serials)} device(s)...")
+        ttk.Label(window, textvariable=self.fleet_status_var, relief=tk.SUNKEN,
+                  padding=(5, 2)).pack(fill=tk.X, side=tk.BOTTOM)
+        self.fleet_report = None
+        clients = [AdbClient(serial, self.adb_client.host, self.adb_client.port) for serial in serials]
+        def on_status(serial, step, state, detail):
+            self.after(0, lambda: self._fleet_update(serial, step, state, detail))
+        def on_done(report):
+            self.fleet_report = report
+            for serial, device in report["devices"].items():
+                if device["ok"]:
+                    self._fleet_update(serial, "finished", "done", f"{device['seconds']:.1f} s")
+            summary = (f"{report['succeeded']} of {len(serials)} device(s) prepared in {report['seconds']:.1f} s"
+                       + (f", {report['failed']} failed" if report['failed'] else ""))
+            self.status_var.set(summary)
+            if self.fleet_window is not None and self.fleet_window.winfo_exists():
+                self.fleet_status_var.set(summary)
+                save_button.configure(state=tk.NORMAL)
+            self.refresh_device_facts()  # The local device's launcher install state changed too
+        self.submit_command("Prepare all devices", lambda: provision_fleet(clients, on_status=on_status), on_done)
+    
+    def _fleet_update(self, serial, step, state, detail):
+        """Show a device's current provisioning step in the fleet table (Tk thread)"""
+        tree = self.fleet_tree
+        if tree is None or not tree.winfo_exists() or not tree.exists(serial):
+            return
+        if "failed" in tree.item(serial, "tags") and state != "failed":
+            return  # Keep the first failure visible
+        tree.item(serial, values=(serial, step, f"{state} {detail}".strip()),
+                  tags=(state,) if state in ("failed", "done") else ())
+    
+    def save_fleet_report(self):
+        """Save the last fleet provisioning report as JSON"""
+        if self.fleet_report is None:
+            return
+        out_path = filedialog.asksaveasfilename(
+            title="Save provisioning report",
+            defaultextension=".json",
+            initialfile=time.strftime("y1_fleet_report_%Y%m%d_%H%M%S.json"),
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if not out_path:
+            return
+        try:
+            with open(out_path, "w") as f:
+                json.dump(self.fleet_report, f, indent=2)
+            self.status_var.set(f"Provisioning report saved to {os.path.basename(out_path)}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not save report:\n{e}")
+    
+    def _launch_package(self, pkg, message):
+        """Launch a package's LAUNCHER activity in the background"""
+        def on_done(result):
+            self.status_var.set(message)
+        self.submit_command(f"Open {pkg}",
+                            lambda: self.run_adb_command(f"shell monkey -p {pkg} -c android.intent.category.LAUNCHER 1"),
+                            on_done)
     
     def open_nova_launcher(self):
-        self.run_adb_command("shell monkey -p com.teslacoilsw.launcher -c android.intent.category.LAUNCHER 1")
-        self.status_var.set("Nova Launcher opened")
+        self._launch_package("com.teslacoilsw.launcher", "Nova Launcher opened")
 
     def open_keycode_disp(self):
-        self.run_adb_command("shell monkey -p jp.ne.neko.freewing.KeyCodeDisp -c android.intent.category.LAUNCHER 1")
-        self.status_var.set("KeyCode Display app opened")
+        self._launch_package("jp.ne.neko.freewing.KeyCodeDisp", "KeyCode Display app opened")
 
     def open_launcher(self, pkg):
-        self.run_adb_command(f"shell monkey -p {pkg} -c android.intent.category.LAUNCHER 1")
-        self.status_var.set(f"Launcher {pkg} opened")
+        self._launch_package(pkg, f"Launcher {pkg} opened")
     
     def launch_app(self, package_name):
         """Launch specified app"""
-        success, stdout, stderr = self.run_adb_command(
-            f"shell monkey -p {package_name} -c android.intent.category.LAUNCHER 1")
-        if success:
-            self.status_var.set(f"Launched {package_name}")
-            self.current_app = package_name
-            self.control_launcher = False  # Disable launcher control
-            self.launcher_var.set(False)  # Update UI checkbox
-            self.refresh_apps()  # Ensure app list is up to date after launch
-        else:
-            self.status_var.set(f"Failed to launch {package_name}: {stderr}")
+        def on_done(result):
+            success, stdout, stderr = result
+            if success:
+                self.status_var.set(f"Launched {package_name}")
+                self.current_app = package_name
+                self.control_launcher = False  # Disable launcher control
+                self.launcher_var.set(False)  # Update UI checkbox
+                self.refresh_apps()  # Ensure app list is up to date after launch
+            else:
+                self.status_var.set(f"Failed to launch {package_name}: {stderr}")
+        self.status_var.set(f"Launching {package_name}...")
+        self.submit_command(f"Launch {package_name}",
+                            lambda: self.run_adb_command(
+                                f"shell monkey -p {package_name} -c android.intent.category.LAUNCHER 1"),
+                            on_done)
     
     def uninstall_app(self, package_name):
         confirm = messagebox.askyesno("Uninstall App", f"Are you sure you want to uninstall {package_name}?")
         if not confirm:
             return
         self.status_var.set(f"Uninstalling {package_name}...")
-        success, stdout, stderr = self.run_adb_command(f"uninstall {package_name}")
-        if success:
-            self.status_var.set(f"{package_name} uninstalled successfully")
-            self.refresh_apps()
-        else:
-            self.status_var.set(f"Failed to uninstall {package_name}: {stderr}")
+        def on_done(result):
+            success, stdout, stderr = result
+            if success:
+                self.status_var.set(f"{package_name} uninstalled successfully")
+                self.refresh_apps()
+            else:
+                self.status_var.set(f"Failed to uninstall {package_name}: {stderr}")
+        self.submit_command(f"Uninstall {package_name}",
+                            lambda: self.run_adb_command(f"uninstall {package_name}", timeout=60),
+                            on_done)
     
     def toggle_launcher_control(self, event=None):
         """Toggle launcher control mode"""
@@ -942,55 +5661,249 @@ class Y1HelperApp(tk.Tk):
     
     def on_screen_click(self, event):
         """Handle left click on screen (touch input or enter in launcher mode)"""
-        if not self._input_paced():
-            return
-        # Calculate vertical offset if image is centered
-        y_offset = 0
-        if hasattr(self, 'display_height') and hasattr(self, 'device_height'):
-            crop_top = 0
-            # Heuristic: if the top 25px are black, we cropped them
-            if hasattr(self, 'last_screen_image') and self.last_screen_image is not None:
-                import numpy as np
-                arr = np.array(self.last_screen_image)
-                if arr.shape[0] >= 50 and (arr[:25, :, :3].mean() < 16):
-                    crop_top = 25
-            src_height = self.device_height - crop_top
-            display_img_height = int(src_height * self.display_scale)
-            y_offset = (self.display_height - display_img_height) // 2
-        # Adjust for vertical offset
-        adj_y = event.y - y_offset
-        if adj_y < 0 or adj_y >= display_img_height:
+        point = self._canvas_to_device(event.x, event.y)
+        if point is None:
             return  # Click outside the image area
-        x = int(event.x / self.display_scale)
-        y = int(adj_y / self.display_scale) + (crop_top if 'crop_top' in locals() else 0)
-        if self.control_launcher:
-            success, stdout, stderr = self.run_adb_command("shell input keyevent 66")  # KEYCODE_ENTER
-            if success:
-                self.status_var.set("Enter key sent")
+        x, y = point
+        trace = self.latency_tracer.begin(f"click ({x}, {y})")
+        element = self._current_ui_index().clickable_at(x, y) if self._current_ui_index() else None
+        if element is not None:
+            name = describe_ui_element(element)
+            if self.control_launcher and (element["focused"] or element["selected"]):
+                self.send_input("shell input keyevent 66", f"Enter sent to {name}", "Enter key failed",  # KEYCODE_ENTER
+                                trace=trace)
             else:
-                self.status_var.set(f"Enter key failed: {stderr}")
+                # Tap the middle of the element the click landed on
+                x, y = UiElementIndex.center(element)
+                self.send_input(f"shell input tap {x} {y}", f"Tapped {name}", "Touch input failed", trace=trace)
+        elif self.control_launcher:
+            self.send_input("shell input keyevent 66", "Enter key sent", "Enter key failed",  # KEYCODE_ENTER
+                            trace=trace)
         else:
-            success, stdout, stderr = self.run_adb_command(
-                f"shell input tap {x} {y}")
-            if success:
-                self.status_var.set(f"Touch input sent to ({x}, {y})")
-            else:
-                self.status_var.set(f"Touch input failed: {stderr}")
+            self.send_input(f"shell input tap {x} {y}", f"Touch input sent to ({x}, {y})", "Touch input failed",
+                            trace=trace)
     
-    def on_screen_right_click(self, event):
-        """Handle right click on screen (back button)"""
-        if not self._input_paced():
+    def _canvas_to_device(self, canvas_x, canvas_y):
+        """Map a canvas position to device pixels, or None outside the displayed frame"""
+        crop_top = self.last_crop_top
+        display_img_height = int((self.device_height - crop_top) * self.display_scale)
+        y_offset = (self.display_height - display_img_height) // 2
+        adj_y = canvas_y - y_offset
+        if adj_y < 0 or adj_y >= display_img_height or not 0 <= canvas_x < self.display_width:
+            return None
+        return int(canvas_x / self.display_scale), int(adj_y / self.display_scale) + crop_top
+    
+    def _device_to_canvas(self, x, y):
+        """Map device pixels to a canvas position (inverse of _canvas_to_device)"""
+        crop_top = self.last_crop_top
+        display_img_height = int((self.device_height - crop_top) * self.display_scale)
+        y_offset = (self.display_height - display_img_height) // 2
+        return x * self.display_scale, (y - crop_top) * self.display_scale + y_offset
+    
+    def _current_ui_index(self):
+        """The cached UI hierarchy unless the screen has changed substantially since it was dumped"""
+        index = self.ui_index
+        if index is not None and not self.ui_index_stale:
+            return index
+        return None
+    
+    def dump_ui_hierarchy(self):
+        """Dump the view hierarchy with uiautomator and index it (worker threads only)"""
+        output = self.adb_client.shell(f"uiautomator dump {UI_DUMP_PATH}")
+        if "dumped to" not in output.lower():
+            raise AdbError(output.strip() or "uiautomator dump failed")
+        xml_text = self.adb_client.pull_bytes(UI_DUMP_PATH).decode("utf-8", errors="replace")
+        # Tag the index with the screen as it is now that the dump has finished
+        with self.frame_condition:
+            frame, frame_hash = self.last_frame, self.last_frame_hash
+        signature = frame_signature(frame) if frame is not None else None
+        return UiElementIndex(parse_ui_hierarchy(xml_text), frame_hash, signature)
+    
+    @staticmethod
+    def _ui_index_matches(index, img_rgb, frame_hash):
+        """Whether a hierarchy dump still describes a frame (small changes like a clock tick don't count)"""
+        if frame_hash == index.frame_hash:
+            return True
+        if index.signature is None or img_rgb is None:
+            return False
+        return signature_diff_ratio(frame_signature(img_rgb), index.signature) <= UI_STALE_DIFF_RATIO
+    
+    def _set_ui_index(self, index):
+        self.ui_index = index
+        self.ui_checked_hash = index.frame_hash
+        self.ui_index_stale = False
+    
+    def ui_index_for_current_frame(self):
+        """Cached UI hierarchy for the current screen, dumping only if it changed substantially (worker threads)"""
+        index = self._current_ui_index()
+        if index is not None and not self.ui_inspect_var.get():
+            # Nothing watches the frames while inspection is off, so check this one
+            with self.frame_condition:
+                frame, frame_hash = self.last_frame, self.last_frame_hash
+            if not self._ui_index_matches(index, frame, frame_hash):
+                index = None
+        if index is None:
+            index = self.dump_ui_hierarchy()
+            self._set_ui_index(index)
+        return index
+    
+    def _refresh_ui_index(self):
+        """Re-dump the hierarchy in the background after the screen changed (Tk thread)"""
+        def on_done(index):
+            self.ui_dump_pending = False
+            self._set_ui_index(index)
+            self.hover_element = None
+            self.screen_canvas.delete("uielement")
+        def work():
+            try:
+                return self.dump_ui_hierarchy()
+            except Exception:
+                self.ui_dump_pending = False
+                raise
+        self.submit_command("Dump UI hierarchy", work, on_done, priority=PRIORITY_CAPTURE)
+    
+    def toggle_frame_export(self):
+        """Start or stop publishing frames to the shared-memory region"""
+        if self.frame_export_var.get():
+            try:
+                self.frame_export = SharedFrameExport(SHARED_FRAMES_NAME, self.device_width, self.device_height)
+            except Exception as e:
+                self.frame_export_var.set(False)
+                messagebox.showerror("Shared Frames", f"Failed to create shared memory:\n\n{e}")
+                return
+            self.status_var.set(f"Publishing frames to shared memory '{SHARED_FRAMES_NAME}'")
+        else:
+            frame_export, self.frame_export = self.frame_export, None
+            if frame_export is not None:
+                frame_export.close()
+            self.status_var.set("Shared frames stopped")
+    
+    def toggle_stream_server(self):
+        """Start or stop serving the screen (and remote input) to browsers on the network"""
+        if not self.stream_server_var.get():
+            server, self.stream_server = self.stream_server, None
+            if server is not None:
+                server.stop()
+            self.status_var.set("Streaming server stopped")
             return
-            
-        success, stdout, stderr = self.run_adb_command("shell input keyevent 4")  # KEYCODE_BACK
-        if success:
-            self.status_var.set("Back button pressed")
+        try:
+            from y1_stream import StreamServer
+            server = StreamServer("0.0.0.0", self.stream_server_port,
+                                  on_input=lambda event: self.after(0, lambda: self._on_remote_input(event)),
+                                  launcher_mode=lambda: self.control_launcher).start()
+        except Exception as e:
+            self.stream_server_var.set(False)
+            messagebox.showerror("Streaming Server", f"Failed to start the streaming server:\n\n{e}")
+            return
+        self.stream_server = server
+        if self.last_frame is not None:
+            server.publish(self.last_frame)
+        import socket
+        try:
+            # Address of the interface that routes off this machine (no packets are sent)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                probe.connect(("192.0.2.1", 9))
+                address = probe.getsockname()[0]
+        except OSError:
+            address = "127.0.0.1"
+        url = f"http://{address}:{server.port}/?token={server.token}"
+        self.status_var.set(f"Streaming at {url}")
+        print(f"Streaming server: {url}")
+        messagebox.showinfo("Streaming Server",
+                            f"Open this address in a browser on your network:\n\n{url}\n\n"
+                            "Anyone with the link can see and control the device.")
+    
+    def _on_remote_input(self, event):
+        """Apply an input event from a streaming client (Tk thread)"""
+        if event["type"] == "key":
+            self.send_input(f"shell input keyevent {event['keycode']}", f"Remote key {event['label']}",
+                            "Remote key failed")
+        elif event["type"] == "tap":
+            x, y = event["x"], event["y"]
+            self.send_input(f"shell input tap {x} {y}", f"Remote tap at ({x}, {y})", "Remote tap failed")
+    
+    def toggle_ui_inspect(self):
+        """Turn element-aware hover and clicking on or off"""
+        if self.ui_inspect_var.get():
+            self.status_var.set("UI inspection on - hover the screen to see elements")
+            if not self.ui_dump_pending:
+                self.ui_dump_pending = True
+                self.ui_dump_started = time.monotonic()
+                self._refresh_ui_index()
         else:
-            self.status_var.set(f"Back button failed: {stderr}")
+            self.ui_index = None
+            self.hover_element = None
+            self.screen_canvas.delete("uielement")
+            self.status_var.set("UI inspection off")
     
-    def on_mouse_wheel(self, event):
-        if not self._input_paced():
+    def on_screen_motion(self, event):
+        """Highlight and name the UI element under the mouse when inspection is on"""
+        if not self.ui_inspect_var.get():
+            return
+        index = self._current_ui_index()
+        point = self._canvas_to_device(event.x, event.y)
+        element = index.element_at(*point) if index is not None and point is not None else None
+        if element is self.hover_element:
+            return
+        self.hover_element = element
+        self.draw_ui_highlight()
+        if element is not None:
+            self.status_var.set(describe_ui_element(element))
+    
+    def draw_ui_highlight(self):
+        """Outline the hovered UI element on the canvas"""
+        self.screen_canvas.delete("uielement")
+        if self.hover_element is None:
+            return
+        x0, y0, x1, y1 = self.hover_element["bounds"]
+        cx0, cy0 = self._device_to_canvas(x0, y0)
+        cx1, cy1 = self._device_to_canvas(x1, y1)
+        self.screen_canvas.create_rectangle(cx0, cy0, cx1 - 1, cy1 - 1, outline="#00c0ff", tags="uielement")
+    
+    def on_screen_press(self, event):
+        """Remember where a left-button press started; it becomes a click or a drag"""
+        self.drag_start = (event.x, event.y)
+        self.dragging = False
+    
+    def on_screen_drag(self, event):
+        """Stream a left-button drag to the device as a touch gesture"""
+        if self.drag_start is None:
             return
+        if not self.dragging:
+            sx, sy = self.drag_start
+            if abs(event.x - sx) + abs(event.y - sy) < self.drag_threshold:
+                return
+            start = self._canvas_to_device(sx, sy)
+            if start is None:
+                self.drag_start = None
+                return
+            self.dragging = True
+            trace = self.latency_tracer.begin(f"swipe ({start[0]}, {start[1]})")
+            self.gesture_injector.touch("down", *start, trace=trace)
+            self.status_var.set("Swiping...")
+        point = self._canvas_to_device(event.x, event.y)
+        if point is not None:
+            self.drag_last = point
+            self.gesture_injector.touch("move", *point)
+    
+    def on_screen_release(self, event):
+        """Finish a drag gesture, or treat the press as a click"""
+        if self.dragging:
+            point = self._canvas_to_device(event.x, event.y) or self.drag_last
+            self.gesture_injector.touch("up", *point, trace=self.latency_tracer.begin("swipe release"))
+            self.status_var.set("Swipe sent")
+            self.after(150, self.request_framebuffer_refresh)
+        elif self.drag_start is not None:
+            self.on_screen_click(event)
+            self.on_nav_bar_click(event)
+        self.drag_start = None
+        self.dragging = False
+    
+    def on_screen_right_click(self, event):
+        """Handle right click on screen (back button)"""
+        self.send_input("shell input keyevent 4", "Back button pressed", "Back button failed")  # KEYCODE_BACK
+    
+    def on_mouse_wheel(self, event):
         direction = 0
         if hasattr(event, 'delta') and event.delta != 0:
             if event.delta > 0:
@@ -1021,15 +5934,22 @@ class Y1HelperApp(tk.Tk):
             else:
                 keycode = 20  # KEYCODE_DPAD_DOWN
                 dir_str = "down"
-        success, stdout, stderr = self.run_adb_command(f"shell input keyevent {keycode}")
-        if success:
-            self.status_var.set(f"D-pad {dir_str} pressed")
+        # Windows reports several notches in one event; fast spinning is accelerated
+        notches = max(1, abs(getattr(event, 'delta', 0)) // 120)
+        now = time.perf_counter()
+        if now - self.wheel_last_time < 0.08 and direction == self.wheel_last_direction:
+            self.wheel_streak += notches
         else:
-            self.status_var.set(f"D-pad {dir_str} failed: {stderr}")
+            self.wheel_streak = 0
+        self.wheel_last_time = now
+        self.wheel_last_direction = direction
+        repeats = notches
+        if self.wheel_accel_var.get():
+            repeats *= 1 + min(self.wheel_streak // 4, 3)
+        for _ in range(repeats):
+            self.send_input(f"shell input keyevent {keycode}", f"D-pad {dir_str} pressed", f"D-pad {dir_str} failed")
     
     def on_mouse_wheel_click(self, event):
-        if not self._input_paced():
-            return
         # Y1 scroll wheel center = ENTER, back/menu = BACK
         if self.control_launcher:
             keycode = 66  # KEYCODE_ENTER
@@ -1037,84 +5957,72 @@ class Y1HelperApp(tk.Tk):
         else:
             keycode = 23  # KEYCODE_DPAD_CENTER
             action = "d-pad center"
-        success, stdout, stderr = self.run_adb_command(f"shell input keyevent {keycode}")
-        if success:
-            self.status_var.set(f"Mouse wheel click: {action} pressed")
-        else:
-            self.status_var.set(f"Mouse wheel click failed: {stderr}")
+        self.send_input(f"shell input keyevent {keycode}", f"Mouse wheel click: {action} pressed",
+                        "Mouse wheel click failed")
     
     def on_key_press(self, event):
-        if not self._input_paced():
-            return
-        key = event.keysym.lower()
-        dpad_map = {
-            'w': 19, 'up': 19,
-            's': 20, 'down': 20,
-            'a': 21, 'left': 21,
-            'd': 22, 'right': 22
-        }
-        direction_map = {
-            19: 'up', 20: 'down', 21: 'left', 22: 'right'
-        }
-        if key in dpad_map:
-            keycode = dpad_map[key]
-            direction = direction_map[keycode]
-            if self.control_launcher:
-                if keycode == 19:
-                    keycode = 21
-                    direction = 'left'
-                elif keycode == 20:
-                    keycode = 22
-                    direction = 'right'
-        elif key in ['return', 'e', 'shift_r']:
-            if self.control_launcher:
-                keycode = 66
-                direction = "enter"
-            else:
-                keycode = 23
-                direction = "center"
-        elif key in ['q', 'slash', 'Escape']:
-            keycode = 4
-            direction = "back"
-        elif key == 'space':
-            keycode = 85
-            direction = "play/pause"
-        elif key == 'prior':
-            keycode = 87
-            direction = "next"
-        elif key == 'next':
-            keycode = 88
-            direction = "previous"
-        else:
+        # Typing in tool windows (e.g. the logcat filters) must not drive the device
+        widget = event.widget
+        if hasattr(widget, 'winfo_toplevel') and widget.winfo_toplevel() is not self:
             return
-        self.force_framebuffer_refresh()
-        success, stdout, stderr = self.run_adb_command(f"shell input keyevent {keycode}")
-        if success:
-            self.status_var.set(f"Key {direction} pressed")
-            self.after(100, self.force_framebuffer_refresh)
+        held = self.held_keys.get(event.keysym)
+        if held is not None:
+            # Auto-repeat of a key held down on the device (X11 also sends a release first)
+            if held[1] is not None:
+                self.after_cancel(held[1])
+                self.held_keys[event.keysym] = (held[0], None)
+            return
+        mapped = map_key(event.keysym, self.control_launcher)
+        if mapped is None:
+            return
+        keycode, direction = mapped
+        if keycode in LONG_PRESS_KEYCODES:
+            # Held on the device until the key is released, so long-press menus work
+            self.held_keys[event.keysym] = (keycode, None)
+            self.gesture_injector.key("down", keycode, trace=self.latency_tracer.begin(f"key {direction} hold"))
+            self.status_var.set(f"Key {direction} down")
+            return
+        def on_success():
+            self.after(100, self.request_framebuffer_refresh)
             self.after(1500, lambda: self.status_var.set("Ready"))
-        else:
-            self.status_var.set(f"Key {direction} failed: {stderr}")
+        trace = self.latency_tracer.begin(f"key {direction}")
+        self.request_framebuffer_refresh()
+        self.send_input(f"shell input keyevent {keycode}", f"Key {direction} pressed", f"Key {direction} failed",
+                        on_success, trace)
+    
+    def on_key_release(self, event):
+        """Release a held key; deferred briefly so X11 auto-repeat pairs can cancel it"""
+        held = self.held_keys.get(event.keysym)
+        if held is None or held[1] is not None:
+            return
+        self.held_keys[event.keysym] = (held[0], self.after(40, lambda: self._release_held_key(event.keysym)))
+    
+    def _release_held_key(self, keysym):
+        keycode, _ = self.held_keys.pop(keysym, (None, None))
+        if keycode is not None:
+            self.gesture_injector.key("up", keycode, trace=self.latency_tracer.begin("key release"))
+            self.status_var.set("Key released")
+            self.after(100, self.request_framebuffer_refresh)
     
     def toggle_play_pause(self):
         """Toggle play/pause on device"""
-        self.force_framebuffer_refresh()
-        self.run_adb_command("shell input keyevent 85")  # KEYCODE_MEDIA_PLAY_PAUSE
-        self.after(100, self.force_framebuffer_refresh)
+        self.request_framebuffer_refresh()
+        self.send_input("shell input keyevent 85", "Ready", "Key failed")  # KEYCODE_MEDIA_PLAY_PAUSE
+        self.after(100, self.request_framebuffer_refresh)
         self.after(1500, lambda: self.status_var.set("Ready"))
 
     def previous_track(self):
         """Send previous track key event"""
-        self.force_framebuffer_refresh()
-        self.run_adb_command("shell input keyevent 88")  # KEYCODE_MEDIA_PREVIOUS
-        self.after(100, self.force_framebuffer_refresh)
+        self.request_framebuffer_refresh()
+        self.send_input("shell input keyevent 88", "Ready", "Key failed")  # KEYCODE_MEDIA_PREVIOUS
+        self.after(100, self.request_framebuffer_refresh)
         self.after(1500, lambda: self.status_var.set("Ready"))
 
     def next_track(self):
         """Send next track key event"""
-        self.force_framebuffer_refresh()
-        self.run_adb_command("shell input keyevent 87")  # KEYCODE_MEDIA_NEXT
-        self.after(100, self.force_framebuffer_refresh)
+        self.request_framebuffer_refresh()
+        self.send_input("shell input keyevent 87", "Ready", "Key failed")  # KEYCODE_MEDIA_NEXT
+        self.after(100, self.request_framebuffer_refresh)
         self.after(1500, lambda: self.status_var.set("Ready"))
 
     def nav_up(self):
@@ -1182,34 +6090,612 @@ class Y1HelperApp(tk.Tk):
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open ADB shell: {e}")
     
+    def open_logcat_viewer(self):
+        """Open the logcat pane, fed by one streaming logcat connection"""
+        if self.logcat_window is not None and self.logcat_window.winfo_exists():
+            self.logcat_window.lift()
+            return
+        window = tk.Toplevel(self)
+        window.title("Logcat")
+        window.geometry("900x500")
+        self.logcat_window = window
+        filters = ttk.Frame(window, padding=(5, 5))
+        filters.pack(fill=tk.X)
+        ttk.Label(filters, text="Level:").pack(side=tk.LEFT)
+        self.logcat_level_var = tk.StringVar(value="V")
+        level_box = ttk.Combobox(filters, textvariable=self.logcat_level_var, values=list(LOGCAT_LEVELS),
+                                 width=3, state="readonly")
+        level_box.pack(side=tk.LEFT, padx=(2, 10))
+        ttk.Label(filters, text="Tags:").pack(side=tk.LEFT)
+        self.logcat_tags_var = tk.StringVar()
+        ttk.Entry(filters, textvariable=self.logcat_tags_var, width=20).pack(side=tk.LEFT, padx=(2, 10))
+        ttk.Label(filters, text="Search:").pack(side=tk.LEFT)
+        self.logcat_search_var = tk.StringVar()
+        ttk.Entry(filters, textvariable=self.logcat_search_var, width=20).pack(side=tk.LEFT, padx=(2, 10))
+        self.logcat_app_only_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filters, text="Current app only", variable=self.logcat_app_only_var,
+                        command=self._logcat_filter_changed).pack(side=tk.LEFT)
+        ttk.Button(filters, text="Clear", command=self._logcat_clear).pack(side=tk.RIGHT)
+        self.logcat_pause_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filters, text="Pause", variable=self.logcat_pause_var).pack(side=tk.RIGHT, padx=5)
+        body = ttk.Frame(window)
+        body.pack(fill=tk.BOTH, expand=True)
+        text = tk.Text(body, wrap=tk.NONE, font=("Consolas", 9), state=tk.DISABLED)
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=text.yview)
+        text.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        for level, color in (("V", "#808080"), ("D", "#000080"), ("I", "#006000"),
+                             ("W", "#a06000"), ("E", "#c00000"), ("F", "#800080")):
+            text.tag_configure(level, foreground=color)
+        self.logcat_text = text
+        self.logcat_status_var = tk.StringVar(value="Connecting...")
+        ttk.Label(window, textvariable=self.logcat_status_var, relief=tk.SUNKEN,
+                  padding=(5, 2)).pack(fill=tk.X, side=tk.BOTTOM)
+        for var in (self.logcat_level_var, self.logcat_tags_var, self.logcat_search_var):
+            var.trace_add("write", lambda *args: self._logcat_filter_changed())
+        self.logcat_buffer.clear()
+        self.logcat_stream = LogcatStream(self.adb_client, self.logcat_buffer)
+        self.logcat_stream.start()
+        self.logcat_shown_seq = 0
+        self.logcat_view_lines = 0
+        self.logcat_pids = None
+        self.logcat_pids_package = None
+        window.protocol("WM_DELETE_WINDOW", self._close_logcat_viewer)
+        self._logcat_drain()
+    
+    def _close_logcat_viewer(self):
+        if self.logcat_stream is not None:
+            self.logcat_stream.stop()
+            self.logcat_stream = None
+        if self.logcat_window is not None:
+            self.logcat_window.destroy()
+            self.logcat_window = None
+    
+    def _logcat_clear(self):
+        self.logcat_buffer.clear()
+        self._logcat_filter_changed()
+    
+    def _logcat_filters(self):
+        """Current (min_level, tags, pids, text) filter values from the pane"""
+        tags = {t.strip() for t in self.logcat_tags_var.get().split(",") if t.strip()} or None
+        pids = None
+        if self.logcat_app_only_var.get():
+            pids = self.logcat_pids or {-1}  # No match until the app's pids are known
+        return self.logcat_level_var.get() or "V", tags, pids, self.logcat_search_var.get().strip() or None
+    
+    def _logcat_filter_changed(self):
+        """Re-render the visible lines from the ring index after a filter change"""
+        if self.logcat_text is None:
+            return
+        self.logcat_text.configure(state=tk.NORMAL)
+        self.logcat_text.delete("1.0", tk.END)
+        self.logcat_text.configure(state=tk.DISABLED)
+        self.logcat_shown_seq = 0
+        self.logcat_view_lines = 0
+        self._logcat_append(limit=self.logcat_view_limit)
+    
+    def _logcat_refresh_pids(self):
+        """Look up the pids of the current app in the background (for the app-only filter)"""
+        package = self.current_app
+        if not package or package == "unknown" or self.logcat_pids_package == package:
+            return
+        self.logcat_pids_package = package
+        def on_done(output):
+            self.logcat_pids = parse_ps_pids(output, package)
+            self._logcat_filter_changed()
+        self.submit_command("Find app processes", lambda: self.adb_client.shell("ps"), on_done)
+    
+    def _logcat_append(self, limit=None):
+        min_level, tags, pids, search = self._logcat_filters()
+        rows = self.logcat_buffer.query(min_level, tags, pids, search, since_seq=self.logcat_shown_seq, limit=limit)
+        self.logcat_shown_seq = self.logcat_buffer.next_seq
+        if not rows:
+            return
+        text = self.logcat_text
+        at_bottom = text.yview()[1] >= 0.999
+        text.configure(state=tk.NORMAL)
+        # One insert per level run instead of one per line
+        run_level, run_lines = None, []
+        for seq, timestamp, pid, tid, level, tag, message in rows:
+            if level != run_level and run_lines:
+                text.insert(tk.END, "".join(run_lines), run_level)
+                run_lines = []
+            run_level = level
+            run_lines.append(f"{timestamp} {pid:5d} {tid:5d} {level} {tag}: {message}\n")
+        text.insert(tk.END, "".join(run_lines), run_level)
+        self.logcat_view_lines += len(rows)
+        overflow = self.logcat_view_lines - self.logcat_view_limit
+        if overflow > 0:
+            text.delete("1.0", f"{overflow + 1}.0")
+            self.logcat_view_lines -= overflow
+        text.configure(state=tk.DISABLED)
+        if at_bottom:
+            text.see(tk.END)
+    
+    def _logcat_drain(self):
+        """Move new records from the ring into the text view in one batch (Tk thread)"""
+        if self.logcat_window is None or not self.logcat_window.winfo_exists():
+            return
+        if self.logcat_app_only_var.get():
+            self._logcat_refresh_pids()
+        if not self.logcat_pause_var.get():
+            # The view only ever shows the newest lines, so bursts cost at most one screenful
+            self._logcat_append(limit=self.logcat_view_limit)
+        stream = self.logcat_stream
+        if stream is not None and stream.error:
+            state = f"Disconnected: {stream.error}"
+        else:
+            state = "Paused" if self.logcat_pause_var.get() else "Streaming"
+        self.logcat_status_var.set(f"{state} - {len(self.logcat_buffer)} records in buffer "
+                                   f"({self.logcat_buffer.next_seq} received)")
+        self.after(200, self._logcat_drain)
+    
+    def open_file_browser(self):
+        """Open the device file browser; directories are listed lazily, a page at a time"""
+        if not self.device_connected:
+            messagebox.showerror("Error", "Device not connected!")
+            return
+        if self.browser_window is not None and self.browser_window.winfo_exists():
+            self.browser_window.lift()
+            return
+        window = tk.Toplevel(self)
+        window.title("Device Files")
+        window.geometry("700x500")
+        self.browser_window = window
+        bar = ttk.Frame(window, padding=(5, 5))
+        bar.pack(fill=tk.X)
+        ttk.Button(bar, text="Up", width=4, command=self._browser_up).pack(side=tk.LEFT)
+        self.browser_path_var = tk.StringVar(value=self.browser_path)
+        path_entry = ttk.Entry(bar, textvariable=self.browser_path_var)
+        path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        path_entry.bind("<Return>", lambda e: self._browser_open(self.browser_path_var.get().strip() or "/"))
+        ttk.Button(bar, text="Refresh", command=lambda: self._browser_open(self.browser_path, force=True)).pack(side=tk.LEFT)
+        ttk.Button(bar, text="Pull...", command=self._browser_pull).pack(side=tk.RIGHT)
+        ttk.Button(bar, text="Push...", command=self._browser_push).pack(side=tk.RIGHT, padx=5)
+        body = ttk.Frame(window)
+        body.pack(fill=tk.BOTH, expand=True)
+        tree = ttk.Treeview(body, columns=("size", "modified"), show="tree headings", selectmode="extended")
+        tree.heading("#0", text="Name")
+        tree.heading("size", text="Size")
+        tree.heading("modified", text="Modified")
+        tree.column("#0", width=380)
+        tree.column("size", width=90, anchor=tk.E)
+        tree.column("modified", width=130)
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        tree.bind("<Double-1>", lambda e: self._browser_activate())
+        tree.bind("<Return>", lambda e: self._browser_activate())
+        tree.bind("<BackSpace>", lambda e: self._browser_up())
+        window.bind("<F5>", lambda e: self._browser_open(self.browser_path, force=True))
+        self.browser_tree = tree
+        self.browser_status_var = tk.StringVar()
+        ttk.Label(window, textvariable=self.browser_status_var, relief=tk.SUNKEN,
+                  padding=(5, 2)).pack(fill=tk.X, side=tk.BOTTOM)
+        self.browser_lister = DeviceDirectoryLister(
+            self.adb_client, self.browser_cache,
+            on_page=lambda *args: self.after(0, lambda: self._browser_page(*args)),
+            on_error=lambda *args: self.after(0, lambda: self._browser_error(*args)))
+        self.browser_lister.start()
+        window.protocol("WM_DELETE_WINDOW", self._close_file_browser)
+        self._browser_open(self.browser_path)
+    
+    def _close_file_browser(self):
+        if self.browser_lister is not None:
+            self.browser_lister.stop()
+            self.browser_lister = None
+        if self.browser_window is not None:
+            self.browser_window.destroy()
+            self.browser_window = None
+        self.browser_tree = None
+    
+    def _browser_open(self, path, force=False):
+        """Show a device directory, from the listing cache unless force"""
+        path = path.rstrip("/") or "/"
+        self.browser_path = path
+        self.browser_path_var.set(path)
+        self.browser_tree.delete(*self.browser_tree.get_children())
+        self.browser_streamed = 0
+        self.browser_rows = {}  # name -> tree item of the listing being shown
+        self.browser_status_var.set(f"Listing {path}...")
+        self.browser_token = self.browser_lister.request(path, force)
+    
+    def _browser_up(self):
+        parent = self.browser_path.rsplit("/", 1)[0] or "/"
+        if parent != self.browser_path:
+            self._browser_open(parent)
+    
+    def _browser_child(self, name):
+        return f"{self.browser_path.rstrip('/')}/{name}"
+    
+    def _browser_insert(self, entries, start=None):
+        """Add rows for entries, appended or (with start) placed from that index on"""
+        import stat
+        tree = self.browser_tree
+        for offset, (name, mode, size, mtime) in enumerate(entries):
+            if stat.S_ISDIR(mode):
+                kind, size_text = "dir", "<DIR>"
+            elif stat.S_ISLNK(mode):
+                kind, size_text = "link", "<LINK>"
+            else:
+                kind = "file"
+                size_text = f"{size / 1e6:.1f} MB" if size >= 1e6 else f"{(size + 999) // 1000} KB"
+            index = tk.END if start is None else start + offset
+            self.browser_rows[name] = tree.insert("", index, text=name, tags=(kind,),
+                                                  values=(size_text, time.strftime("%Y-%m-%d %H:%M",
+                                                                                   time.localtime(mtime))))
+    
+    def _browser_page(self, token, path, page, complete):
+        """Show a page of a listing as it arrives, then put the rows in sorted order in place (Tk thread)"""
+        if self.browser_tree is None or token != self.browser_token:
+            return
+        if complete is None:
+            self._browser_insert(page)
+            self.browser_streamed += len(page)
+            self.browser_status_var.set(f"Listing {path}... {self.browser_streamed} entries so far")
+            return
+        self._browser_fill(token, path, complete, 0)
+    
+    def _browser_fill(self, token, path, entries, start):
+        """Sort a listing into the tree one page per Tk tick so big folders never freeze the window.
+
+        Rows already streamed are moved rather than recreated, so the scroll
+        position and selection survive the switch to sorted order.
+        """
+        if self.browser_tree is None or token != self.browser_token:
+            return
+        tree = self.browser_tree
+        end = start + BROWSER_PAGE_SIZE
+        for index, entry in enumerate(entries[start:end], start):
+            row = self.browser_rows.get(entry[0])
+            if row is None:
+                self._browser_insert([entry], index)
+            else:
+                tree.move(row, "", index)
+        if end < len(entries):
+            self.browser_status_var.set(f"{path}: showing {end} of {len(entries)} entries...")
+            self.after(1, lambda: self._browser_fill(token, path, entries, end))
+            return
+        names = {entry[0] for entry in entries}
+        stale = [name for name in self.browser_rows if name not in names]
+        if stale:
+            tree.delete(*(self.browser_rows.pop(name) for name in stale))
+        if tree.focus():
+            tree.see(tree.focus())
+        import stat
+        files = sum(1 for entry in entries if stat.S_ISREG(entry[1]))
+        self.browser_status_var.set(f"{path}: {len(entries) - files} folder(s), {files} file(s)")
+    
+    def _browser_error(self, token, path, message):
+        if self.browser_tree is not None and token == self.browser_token:
+            self.browser_status_var.set(f"Cannot list {path}: {message}")
+    
+    def _browser_activate(self):
+        item = self.browser_tree.focus()
+        if item and not self.browser_tree.tag_has("file", item):
+            self._browser_open(self._browser_child(self.browser_tree.item(item, "text")))
+    
+    def _browser_pull(self):
+        """Stream the selected files and folders to a host folder in the background"""
+        paths = [self._browser_child(self.browser_tree.item(item, "text")) for item in self.browser_tree.selection()]
+        if not paths:
+            messagebox.showinfo("Pull", "Select the files or folders to pull first.", parent=self.browser_window)
+            return
+        local_dir = filedialog.askdirectory(title="Pull to folder", parent=self.browser_window)
+        if not local_dir:
+            return
+        def on_done(stats):
+            self.status_var.set(f"Pulled {stats['files']} file(s), {stats['bytes'] / 1e6:.1f} MB "
+                                f"at {stats['mb_per_s']:.1f} MB/s")
+        self.submit_command("Pull files",
+                            lambda: pull_device_paths(paths, local_dir, self.adb_client,
+                                                      progress=self._transfer_progress("Pull")),
+                            on_done)
+    
+    def _browser_push(self):
+        """Stream host files into the directory being shown, then refresh its listing"""
+        target = self.browser_path
+        local_paths = filedialog.askopenfilenames(title=f"Push files to {target}", parent=self.browser_window)
+        if not local_paths:
+            return
+        def on_done(stats):
+            self.status_var.set(f"Pushed {stats['files']} file(s), {stats['bytes'] / 1e6:.1f} MB "
+                                f"at {stats['mb_per_s']:.1f} MB/s")
+            self.browser_cache.invalidate(target)
+            if self.browser_tree is not None and self.browser_path == target:
+                self._browser_open(target, force=True)
+        self.submit_command("Push files",
+                            lambda: push_host_files(list(local_paths), target, self.adb_client,
+                                                    progress=self._transfer_progress("Push")),
+                            on_done)
+    
+    def open_profiler(self):
+        """Open the profiler panel for the foreground app (CPU, memory, frame times)"""
+        if self.profiler_window is not None and self.profiler_window.winfo_exists():
+            self.profiler_window.lift()
+            return
+        window = tk.Toplevel(self)
+        window.title("Performance Profiler")
+        window.geometry("640x420")
+        self.profiler_window = window
+        controls = ttk.Frame(window, padding=(5, 5))
+        controls.pack(fill=tk.X)
+        self.profiler_app_var = tk.StringVar(value="Waiting for foreground app...")
+        ttk.Label(controls, textvariable=self.profiler_app_var).pack(side=tk.LEFT)
+        ttk.Button(controls, text="Export CSV...", command=self.export_profiler_csv).pack(side=tk.RIGHT)
+        self.profiler_frames_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(controls, text="Frame stats", variable=self.profiler_frames_var,
+                        command=self._restart_profiler).pack(side=tk.RIGHT, padx=5)
+        canvas = tk.Canvas(window, bg="black", highlightthickness=0)
+        canvas.pack(fill=tk.BOTH, expand=True)
+        self.profiler_canvas = canvas
+        # One strip per metric; lines are created once and only their coordinates change
+        self.profiler_plots = [
+            ("CPU %", (("cpu_total", "#4080ff", 1.0), ("cpu_app", "#00ff66", 1.0)), 100.0),
+            ("RSS MB", (("rss_kb", "#ffcc00", 1 / 1024.0),), None),
+            ("Frame ms", (("frame_ms", "#ff6060", 1.0), ("frame_ms_max", "#804040", 1.0)), None),
+        ]
+        self.profiler_lines = {}
+        self.profiler_labels = []
+        for title, series, _ in self.profiler_plots:
+            self.profiler_labels.append(canvas.create_text(4, 0, anchor=tk.NW, text=title, fill="#c0c0c0",
+                                                           font=("Courier", 8)))
+            for field, color, _ in series:
+                self.profiler_lines[field] = canvas.create_line(0, 0, 0, 0, fill=color)
+        self.profiler_budget_line = canvas.create_line(0, 0, 0, 0, fill="#606060", dash=(2, 2))
+        self.profiler_status_var = tk.StringVar(value="")
+        ttk.Label(window, textvariable=self.profiler_status_var, relief=tk.SUNKEN,
+                  padding=(5, 2)).pack(fill=tk.X, side=tk.BOTTOM)
+        self.profiler_package = None
+        window.protocol("WM_DELETE_WINDOW", self._close_profiler)
+        self._profiler_refresh()
+    
+    def _close_profiler(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+        if self.profiler_window is not None:
+            self.profiler_window.destroy()
+            self.profiler_window = None
+    
+    def _restart_profiler(self):
+        """Restart sampling (after the foreground app or the frame stats option changed)"""
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+        self.profiler_package = None
+    
+    def _start_profiler(self, package):
+        """Find the app's main process and start streaming samples for it"""
+        self.profiler_package = package
+        self.profiler_app_var.set(f"{package} (finding process...)")
+        def on_done(output):
+            if self.profiler_window is None or self.profiler_package != package:
+                return
+            pids = parse_ps_pids(output, package)
+            if not pids:
+                self.profiler_app_var.set(f"{package} (not running)")
+                self.profiler_package = None
+                return
+            pid = min(pids)  # The main process starts first; services get later pids
+            self.profiler = DeviceProfiler(self.adb_client, package, pid, frames=self.profiler_frames_var.get())
+            self.profiler.start()
+            self.profiler_app_var.set(f"{package} (pid {pid})")
+        self.submit_command("Find app processes", lambda: self.adb_client.shell("ps"), on_done)
+    
+    def _profiler_refresh(self):
+        """Follow the foreground app and redraw the plots once per sample (Tk thread)"""
+        if self.profiler_window is None or not self.profiler_window.winfo_exists():
+            return
+        package = self.current_app if self.current_app and self.current_app != "unknown" else None
+        profiler = self.profiler
+        if package != self.profiler_package or (profiler is not None and not profiler.running):
+            if profiler is not None and not profiler.running and profiler.error:
+                self.profiler_status_var.set(profiler.error)
+            self._restart_profiler()
+            if package:
+                self._start_profiler(package)
+        elif profiler is not None and profiler.samples:
+            self._draw_profiler(list(profiler.samples))
+        self.after(1000, self._profiler_refresh)
+    
+    def _draw_profiler(self, samples):
+        canvas = self.profiler_canvas
+        width = max(canvas.winfo_width(), 100)
+        strip = max(canvas.winfo_height(), 90) / len(self.profiler_plots)
+        count = min(len(samples), width // 2)  # Two pixels per sample
+        samples = samples[-count:]
+        for index, (title, series, fixed_max) in enumerate(self.profiler_plots):
+            top = index * strip
+            values = {field: [s[field] * scale if s[field] is not None else 0.0 for s in samples]
+                      for field, _, scale in series}
+            peak = fixed_max or max(max(max(v) for v in values.values()) * 1.2, 1.0)
+            if title == "Frame ms":
+                peak = max(peak, 20.0)
+                budget_y = top + strip - 16.7 / peak * (strip - 14)
+                canvas.coords(self.profiler_budget_line, 0, budget_y, width, budget_y)
+            for field, _, _ in series:
+                points = []
+                for i, value in enumerate(values[field]):
+                    points.extend((width - (count - i) * 2, top + strip - value / peak * (strip - 14)))
+                if len(points) < 4:
+                    points = [0, 0, 0, 0]
+                canvas.coords(self.profiler_lines[field], *points)
+            latest = ", ".join(f"{values[field][-1]:.1f}" for field, _, _ in series)
+            canvas.coords(self.profiler_labels[index], 4, top + 1)
+            canvas.itemconfigure(self.profiler_labels[index], text=f"{title}: {latest} (max {peak:.0f})")
+        last = samples[-1]
+        frames = f", {last['frames']} frames" if last["frames"] is not None else ""
+        self.profiler_status_var.set(f"{len(self.profiler.samples)} samples - {last['threads']} threads, "
+                                     f"VmSize {(last['vmsize_kb'] or 0) // 1024} MB{frames}")
+    
+    def export_profiler_csv(self):
+        """Export the profiler samples as CSV"""
+        profiler = self.profiler
+        if profiler is None or not profiler.samples:
+            messagebox.showinfo("Performance Profiler", "No samples collected yet.")
+            return
+        out_path = filedialog.asksaveasfilename(
+            title="Export profiler samples",
+            defaultextension=".csv",
+            initialfile=f"{profiler.package}_profile.csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not out_path:
+            return
+        try:
+            profiler.write_csv(out_path)
+            self.profiler_status_var.set(f"Exported {len(profiler.samples)} samples to {out_path}")
+        except Exception as e:
+            messagebox.showerror("Performance Profiler", f"Export failed:\n\n{e}")
+    
+    def open_jank_analyzer(self):
+        """Open the jank analysis window: scripted scroll runs measured with dumpsys gfxinfo"""
+        if self.jank_window is not None and self.jank_window.winfo_exists():
+            self.jank_window.lift()
+            return
+        window = tk.Toplevel(self)
+        window.title("Jank Analysis")
+        window.geometry("820x300")
+        self.jank_window = window
+        controls = ttk.Frame(window, padding=(5, 5))
+        controls.pack(fill=tk.X)
+        ttk.Label(controls, text="Presses each way:").pack(side=tk.LEFT)
+        self.jank_presses_var = tk.IntVar(value=30)
+        ttk.Spinbox(controls, from_=1, to=500, textvariable=self.jank_presses_var, width=5).pack(side=tk.LEFT,
+                                                                                                 padx=(2, 10))
+        ttk.Label(controls, text="Pace (ms):").pack(side=tk.LEFT)
+        self.jank_pace_var = tk.IntVar(value=120)
+        ttk.Spinbox(controls, from_=20, to=2000, increment=10, textvariable=self.jank_pace_var,
+                    width=5).pack(side=tk.LEFT, padx=(2, 10))
+        ttk.Label(controls, text="Label:").pack(side=tk.LEFT)
+        self.jank_label_var = tk.StringVar()
+        ttk.Entry(controls, textvariable=self.jank_label_var, width=16).pack(side=tk.LEFT, padx=(2, 10))
+        self.jank_run_button = ttk.Button(controls, text="Run Scroll Test", command=self.run_jank_test)
+        self.jank_run_button.pack(side=tk.LEFT)
+        ttk.Button(controls, text="Clear", command=self._jank_clear).pack(side=tk.RIGHT)
+        columns = ("run", "app", "frames", "p50", "p90", "p99", "max", "over", "jank", "vs_first")
+        headings = ("Run", "App", "Frames", "p50 ms", "p90 ms", "p99 ms", "Max ms", ">16.7 ms", "Jank %",
+                    "p90 vs first")
+        tree = ttk.Treeview(window, columns=columns, show="headings", height=8)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=150 if column == "app" else 70, anchor=tk.W if column in ("run", "app")
+                        else tk.E)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5)
+        self.jank_tree = tree
+        self.jank_status_var = tk.StringVar(value="Scrolls the foreground app down and back up with the "
+                                                  "current D-pad mapping")
+        ttk.Label(window, textvariable=self.jank_status_var, relief=tk.SUNKEN,
+                  padding=(5, 2)).pack(fill=tk.X, side=tk.BOTTOM)
+        window.protocol("WM_DELETE_WINDOW", self._close_jank_analyzer)
+        self._jank_show_runs()
+    
+    def _close_jank_analyzer(self):
+        if self.jank_window is not None:
+            self.jank_window.destroy()
+            self.jank_window = None
+    
+    def _jank_clear(self):
+        self.jank_runs = []
+        self._jank_show_runs()
+    
+    def _jank_show_runs(self):
+        """Fill the comparison table; the first run is the baseline"""
+        tree = self.jank_tree
+        tree.delete(*tree.get_children())
+        baseline = self.jank_runs[0]["stats"]["p90_ms"] if self.jank_runs else 0.0
+        for run in self.jank_runs:
+            stats = run["stats"]
+            delta = stats["p90_ms"] - baseline
+            tree.insert("", tk.END, values=(
+                run["label"], run["package"], stats["frames"], f"{stats['p50_ms']:.1f}",
+                f"{stats['p90_ms']:.1f}", f"{stats['p99_ms']:.1f}", f"{stats['max_ms']:.1f}",
+                stats["over_budget"], f"{stats['jank_percent']:.1f}",
+                f"{delta:+.1f}" if run is not self.jank_runs[0] else "-"))
+    
+    def run_jank_test(self):
+        """Scroll the foreground app with D-pad presses and record the frame times of the run"""
+        package = self.current_app
+        if not package or package == "unknown":
+            messagebox.showinfo("Jank Analysis", "Open the app to measure first, then run the test.")
+            return
+        try:
+            presses = max(1, self.jank_presses_var.get())
+            pace = max(20, self.jank_pace_var.get()) / 1000.0
+        except tk.TclError:
+            messagebox.showerror("Jank Analysis", "Presses and pace must be whole numbers.")
+            return
+        # The same keycodes the scroll wheel and arrow keys send in the current control mode
+        down = map_key("down", self.control_launcher)[0]
+        up = map_key("up", self.control_launcher)[0]
+        keycodes = [down] * presses + [up] * presses
+        label = self.jank_label_var.get().strip() or f"Run {len(self.jank_runs) + 1}"
+        self.jank_run_button.configure(state=tk.DISABLED)
+        self.jank_status_var.set(f"Scrolling {package} ({len(keycodes)} presses)...")
+        def work():
+            return run_jank_scroll(self.adb_client, package, self._send_key_batch, keycodes, interval=pace)
+        def on_done(log):
+            self.jank_runs.append({"label": label, "package": package, "stats": log.stats()})
+            if self.jank_window is None:
+                return
+            self._jank_show_runs()
+            stats = self.jank_runs[-1]["stats"]
+            if stats["frames"]:
+                self.jank_status_var.set(f"{label}: {stats['frames']} frames, {stats['over_budget']} over budget, "
+                                         f"{stats['over_2x_budget']} over two frames")
+            else:
+                self.jank_status_var.set("No frame data - run 'adb shell setprop debug.hwui.profile true' "
+                                         "and restart the app")
+        future = self.submit_command(f"Jank test {label}", work, on_done)
+        future.add_done_callback(lambda f: self.after(0, self._jank_run_finished))
+    
+    def _jank_run_finished(self):
+        if self.jank_window is not None:
+            self.jank_run_button.configure(state=tk.NORMAL)
+    
     def show_device_info(self):
-        """Show device information"""
+        """Show device information from the cached device facts"""
+        facts = self.device_facts
+        if facts is None:
+            if not self.device_connected:
+                messagebox.showinfo("Device Information", "Unable to get device info")
+                return
+            self.status_var.set("Collecting device info...")
+            self.refresh_device_facts(callback=self._show_device_info_dialog)
+            return
+        self._show_device_info_dialog(facts)
+    
+    def _show_device_info_dialog(self, facts):
         info = []
-        
-        # Get device model
-        success, stdout, stderr = self.run_adb_command("shell getprop ro.product.model")
-        if success:
-            info.append(f"Model: {stdout.strip()}")
-        
-        # Get Android version
-        success, stdout, stderr = self.run_adb_command("shell getprop ro.build.version.release")
-        if success:
-            info.append(f"Android: {stdout.strip()}")
-        
-        # Get screen resolution
-        success, stdout, stderr = self.run_adb_command("shell wm size")
-        if success:
-            info.append(f"Screen: {stdout.strip()}")
-        
-        # Get framebuffer info
-        success, stdout, stderr = self.run_adb_command("shell cat /sys/class/graphics/fb0/bits_per_pixel")
-        if success:
-            info.append(f"Framebuffer bits per pixel: {stdout.strip()}")
-        
-        success, stdout, stderr = self.run_adb_command("shell cat /sys/class/graphics/fb0/stride")
-        if success:
-            info.append(f"Framebuffer stride: {stdout.strip()}")
-        
+        if facts is not None:
+            fb = facts["framebuffer"]
+            if facts["model"]:
+                info.append(f"Model: {facts['model']}")
+            if facts["android_version"]:
+                info.append(f"Android: {facts['android_version']}")
+            if facts["screen_size"]:
+                info.append(f"Screen: {facts['screen_size'][0]}x{facts['screen_size'][1]}")
+            if fb.get("bits_per_pixel"):
+                info.append(f"Framebuffer bits per pixel: {fb['bits_per_pixel']}")
+            if fb.get("stride"):
+                info.append(f"Framebuffer stride: {fb['stride']}")
+            if fb.get("virtual_size"):
+                info.append(f"Framebuffer virtual size: {fb['virtual_size']}")
+            if facts["serial"]:
+                info.append(f"Serial: {facts['serial']}")
+            if facts["fingerprint"]:
+                info.append(f"Build: {facts['fingerprint']}")
+        record = self.device_capabilities
+        if record is not None:
+            capture = record["capture"][record["choice"]["capture_method"]]
+            if capture["ok"]:
+                info.append(f"Capture: {record['choice']['capture_method']} "
+                            f"({capture['seconds'] * 1000:.0f} ms per frame, {capture['profile']})")
+            info.append(f"Input: {record['choice']['input_method']}")
+        self.status_var.set("Ready")
         info_text = "\n".join(info) if info else "Unable to get device info"
         messagebox.showinfo("Device Information", info_text)
     
@@ -1220,31 +6706,163 @@ class Y1HelperApp(tk.Tk):
             return
         
         self.status_var.set("Opening language settings...")
-        success, stdout, stderr = self.run_adb_command("shell am start -a android.settings.LOCALE_SETTINGS")
-        
-        if success:
-            self.status_var.set("Language settings opened")
-            messagebox.showinfo("Language Settings", 
-                              "Language settings have been opened on your device.\n\n"
-                              "You can now:\n"
-                              "• Select your preferred language\n"
-                              "• Choose regional settings\n"
-                              "• Configure input methods")
-        else:
-            error_msg = stderr.strip() if stderr else stdout.strip()
-            self.status_var.set(f"Failed to open language settings: {error_msg}")
-            messagebox.showerror("Error", 
-                               f"Failed to open language settings:\n\n{error_msg}\n\n"
-                               "Please ensure:\n"
-                               "- Device is unlocked\n"
-                               "- Settings app is available\n"
-                               "- Device is responsive")
+        def on_done(result):
+            success, stdout, stderr = result
+            if success:
+                self.status_var.set("Language settings opened")
+                messagebox.showinfo("Language Settings", 
+                                  "Language settings have been opened on your device.\n\n"
+                                  "You can now:\n"
+                                  "• Select your preferred language\n"
+                                  "• Choose regional settings\n"
+                                  "• Configure input methods")
+            else:
+                error_msg = stderr.strip() if stderr else stdout.strip()
+                self.status_var.set(f"Failed to open language settings: {error_msg}")
+                messagebox.showerror("Error", 
+                                   f"Failed to open language settings:\n\n{error_msg}\n\n"
+                                   "Please ensure:\n"
+                                   "- Device is unlocked\n"
+                                   "- Settings app is available\n"
+                                   "- Device is responsive")
+        self.submit_command("Open language settings",
+                            lambda: self.run_adb_command("shell am start -a android.settings.LOCALE_SETTINGS"),
+                            on_done)
+    
+    def sync_music(self):
+        """Push new and changed files from a host music folder to /sdcard/Music"""
+        if not self.device_connected:
+            messagebox.showerror("Error", "Device not connected!")
+            return
+        folder = filedialog.askdirectory(title="Select music library folder",
+                                         initialdir=self.music_library_path or os.path.expanduser("~"))
+        if not folder:
+            return
+        self.music_library_path = folder
+        self.status_var.set("Music sync: comparing library with device...")
+        def progress(done_bytes, total_bytes, rel):
+            percent = 100 * done_bytes // total_bytes if total_bytes else 100
+            self.after(0, lambda: self.status_var.set(f"Music sync: {percent}% - {rel}"))
+        def on_done(stats):
+            summary = (f"Pushed {stats['pushed']} file(s), {stats['bytes'] / 1e6:.1f} MB "
+                       f"at {stats['mb_per_s']:.1f} MB/s\n"
+                       f"{stats['unchanged']} file(s) already up to date\n"
+                       f"Total time: {stats['seconds']:.1f} s")
+            self.status_var.set(f"Music sync done: {stats['pushed']} pushed, {stats['mb_per_s']:.1f} MB/s")
+            messagebox.showinfo("Music Sync", summary)
+        self.submit_command("Music sync",
+                            lambda: sync_music_library(folder, self.adb_client, progress=progress),
+                            on_done)
+    
+    def _transfer_progress(self, label):
+        """Return a progress(done_bytes, total_bytes, path) callback that shows MB/s and ETA in the status bar"""
+        started = time.perf_counter()
+        def progress(done_bytes, total_bytes, path):
+            elapsed = time.perf_counter() - started
+            rate = done_bytes / elapsed if elapsed > 0 else 0
+            eta = (total_bytes - done_bytes) / rate if rate else 0
+            percent = 100 * done_bytes // total_bytes if total_bytes else 100
+            text = (f"{label}: {percent}% of {total_bytes / 1e6:.1f} MB, {rate / 1e6:.1f} MB/s, "
+                    f"ETA {int(eta) // 60}:{int(eta) % 60:02d}")
+            self.after(0, lambda: self.status_var.set(f"{text} - {path}" if path else text))
+        return progress
+    
+    def back_up_storage(self):
+        """Stream chosen device folders into a compressed backup archive on the host"""
+        from tkinter import simpledialog
+        if not self.device_connected:
+            messagebox.showerror("Error", "Device not connected!")
+            return
+        roots = simpledialog.askstring("Back Up Device Storage",
+                                       "Device folders to back up (comma separated):",
+                                       initialvalue=", ".join(BACKUP_ROOTS), parent=self)
+        if not roots:
+            return
+        roots = [root.strip() for root in roots.split(",") if root.strip()]
+        out_path = filedialog.asksaveasfilename(
+            title="Save backup as",
+            defaultextension=".tar.gz",
+            initialfile=time.strftime("y1_backup_%Y%m%d_%H%M%S.tar.gz"),
+            filetypes=[("Backup archives", "*.tar.gz"), ("All files", "*.*")]
+        )
+        if not out_path:
+            return
+        self.status_var.set("Backup: listing device files...")
+        def on_done(stats):
+            summary = (f"Backed up {stats['files']} file(s), {stats['bytes'] / 1e6:.1f} MB "
+                       f"at {stats['mb_per_s']:.1f} MB/s\n"
+                       f"Archive size: {stats['archive_bytes'] / 1e6:.1f} MB\n"
+                       f"Total time: {stats['seconds']:.1f} s")
+            if stats['skipped']:
+                summary += (f"\n\n{len(stats['skipped'])} file(s) unreadable or changed while reading, "
+                            f"not restorable, e.g. {stats['skipped'][0]}")
+            self.status_var.set(f"Backup done: {stats['files']} files, {stats['mb_per_s']:.1f} MB/s")
+            messagebox.showinfo("Backup", summary)
+        self.submit_command("Backup",
+                            lambda: backup_device_storage(out_path, roots, self.adb_client,
+                                                          progress=self._transfer_progress("Backup")),
+                            on_done)
+    
+    def restore_backup(self):
+        """Push the files of a backup archive that differ from the device"""
+        if not self.device_connected:
+            messagebox.showerror("Error", "Device not connected!")
+            return
+        archive_path = filedialog.askopenfilename(
+            title="Select backup archive",
+            filetypes=[("Backup archives", "*.tar.gz"), ("All files", "*.*")]
+        )
+        if not archive_path:
+            return
+        try:
+            manifest = read_backup_manifest(archive_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not read backup:\n{e}")
+            return
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(manifest["created"]))
+        if not messagebox.askyesno("Restore Backup",
+                                   f"Restore {len(manifest['files'])} file(s) "
+                                   f"({manifest['total_bytes'] / 1e6:.1f} MB) from {created} "
+                                   f"to {', '.join(manifest['roots'])}?\n\n"
+                                   "Files that differ on the device will be overwritten."):
+            return
+        self.status_var.set("Restore: comparing backup with device...")
+        def on_done(stats):
+            summary = (f"Restored {stats['pushed']} file(s), {stats['bytes'] / 1e6:.1f} MB "
+                       f"at {stats['mb_per_s']:.1f} MB/s\n"
+                       f"{stats['unchanged']} file(s) already up to date\n"
+                       f"Total time: {stats['seconds']:.1f} s")
+            if stats['incomplete']:
+                summary += (f"\n\n{len(stats['incomplete'])} file(s) left alone because the backup "
+                            f"could not read them in full, e.g. {stats['incomplete'][0]}")
+            self.status_var.set(f"Restore done: {stats['pushed']} pushed, {stats['mb_per_s']:.1f} MB/s")
+            messagebox.showinfo("Restore", summary)
+        self.submit_command("Restore",
+                            lambda: restore_device_backup(archive_path, self.adb_client,
+                                                          progress=self._transfer_progress("Restore")),
+                            on_done)
     
     def cleanup(self):
         """Clean up resources before closing"""
         try:
             # Stop capture
             self.is_capturing = False
+            if self.recorder is not None:
+                self.recorder.stop()
+                self.recorder = None
+            if self.logcat_stream is not None:
+                self.logcat_stream.stop()
+            if self.profiler is not None:
+                self.profiler.stop()
+            if self.browser_lister is not None:
+                self.browser_lister.stop()
+            self.watchdog.stop()
+            self.gesture_injector.channel.close()
+            if self.frame_export is not None:
+                self.frame_export.close()
+                self.frame_export = None
+            if self.stream_server is not None:
+                self.stream_server.stop()
         except Exception as e:
             print(f"Cleanup error: {e}")
     
@@ -1253,14 +6871,6 @@ class Y1HelperApp(tk.Tk):
         self.cleanup()
         self.quit()
 
-    def _input_paced(self):
-        import time
-        now = time.time()
-        if now - self.last_input_time < self.input_pacing_interval:
-            return False
-        self.last_input_time = now
-        return True
-
     def _add_tooltip(self, widget, text):
         # Simple tooltip for Tkinter widgets
         tooltip = tk.Toplevel(widget)
@@ -1289,26 +6899,28 @@ class Y1HelperApp(tk.Tk):
         if event.y >= nav_y:
             if event.x < self.display_width // 2:
                 # Left half: Back (circle)
-                self.run_adb_command('shell input keyevent 4')  # KEYCODE_BACK
-                self.status_var.set('Back button (virtual nav bar) pressed')
+                self.send_input('shell input keyevent 4', 'Back button (virtual nav bar) pressed',
+                                'Back button failed')  # KEYCODE_BACK
             else:
                 # Right half: Home (triangle)
-                self.run_adb_command('shell input keyevent 3')  # KEYCODE_HOME
-                self.status_var.set('Home button (virtual nav bar) pressed')
+                self.send_input('shell input keyevent 3', 'Home button (virtual nav bar) pressed',
+                                'Home button failed')  # KEYCODE_HOME
 
     def show_context_menu(self, x, y):
         self.context_menu.tk_popup(x, y)
 
     def show_recent_apps(self):
-        self.run_adb_command("shell input keyevent 187")  # KEYCODE_APP_SWITCH
-        self.status_var.set("Recent Apps opened")
+        self.send_input("shell input keyevent 187", "Recent Apps opened", "Recent Apps failed")  # KEYCODE_APP_SWITCH
 
     def setup_bindings(self):
         # Global key bindings
         self.bind("<Alt_L>", self.toggle_launcher_control)
         self.bind("<Alt_R>", self.toggle_launcher_control)
+        self.bind("<F8>", self.save_instant_replay)
+        self.bind("<F3>", self.toggle_perf_hud)
         # Global key handling for all key presses
         self.bind_all("<Key>", self.on_key_press)
+        self.bind_all("<KeyRelease>", self.on_key_release)
 
 if __name__ == "__main__":
     app = Y1HelperApp()
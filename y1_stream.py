@@ -0,0 +1,376 @@
+"""Network streaming of the Y1 screen (and remote input) for Y1 Helper.
+
+An asyncio HTTP + WebSocket server that any browser can open. Frames from the
+helper's capture loop are split into 32x32 tiles; only tiles that changed
+since the previous frame are PNG-encoded and sent, so bandwidth follows how
+much of the screen moves. Each frame is encoded once and the same message is
+written to every client. Clients that fall behind skip ahead to a keyframe
+assembled from the cached tile encodings. Key and tap messages from clients
+are mapped to Android keycodes with y1_helper.map_key, the same table the
+desktop window uses.
+
+Standalone demo against a synthetic screen (no device needed):
+    python y1_stream.py [--scene scroll] [--port 8765]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import secrets
+import struct
+import threading
+import time
+
+import y1_helper
+
+TILE = 32
+MSG_FRAME = 1
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+MAX_CLIENT_BACKLOG = 512 * 1024  # Bytes queued to a client before it is moved to keyframes
+
+
+class TileEncoder:
+    """Turns full frames into delta messages of changed PNG tiles.
+
+    The PNG bytes of every tile's current content are cached, so a keyframe
+    for a new or lagging client is just a concatenation of cached tiles.
+    Message layout (little-endian): u8 type, u32 seq, u16 width, u16 height,
+    u16 tile count, then per tile u16 x, u16 y, u16 w, u16 h, u32 length, PNG.
+    """
+
+    def __init__(self, tile=TILE):
+        self.tile = tile
+        self.previous = None
+        self.tiles = {}  # (x, y) -> (w, h, png bytes)
+        self.size = None
+        self.seq = 0
+        self._keyframe = None
+
+    def _encode_tile(self, frame, x, y, w, h):
+        from PIL import Image
+        out = io.BytesIO()
+        Image.fromarray(frame[y:y + h, x:x + w]).save(out, format="PNG", compress_level=1)
+        return out.getvalue()
+
+    def _pack(self, seq, width, height, tiles):
+        parts = [struct.pack("<BIHHH", MSG_FRAME, seq, width, height, len(tiles))]
+        for (x, y), (w, h, png) in tiles:
+            parts.append(struct.pack("<HHHHI", x, y, w, h, len(png)))
+            parts.append(png)
+        return b"".join(parts)
+
+    def encode(self, img_rgb):
+        """Encode a PIL RGB frame against the previous one; returns an update for ``apply``, or None.
+
+        Only ``previous`` is touched here, so this can run on a worker thread
+        while ``keyframe`` serves the current tiles; ``apply`` swaps the new
+        tiles in on the thread that calls ``keyframe``.
+        """
+        import numpy as np
+        frame = np.asarray(img_rgb)
+        height, width = frame.shape[:2]
+        tile = self.tile
+        rows, cols = -(-height // tile), -(-width // tile)
+        if self.previous is None or self.previous.shape != frame.shape:
+            tiles = {}
+            changed = np.ones((rows, cols), dtype=bool)
+        else:
+            diff = (frame != self.previous).any(axis=2)
+            padded = np.zeros((rows * tile, cols * tile), dtype=bool)
+            padded[:height, :width] = diff
+            changed = padded.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+            tiles = dict(self.tiles)
+        self.previous = frame
+        if not changed.any():
+            return None
+        delta = []
+        for row, col in zip(*np.nonzero(changed)):
+            x, y = int(col) * tile, int(row) * tile
+            w, h = min(tile, width - x), min(tile, height - y)
+            entry = (w, h, self._encode_tile(frame, x, y, w, h))
+            tiles[(x, y)] = entry
+            delta.append(((x, y), entry))
+        seq = self.seq + 1
+        return seq, tiles, (width, height), self._pack(seq, width, height, delta)
+
+    def apply(self, update):
+        """Make an encoded frame current; returns its delta message"""
+        self.seq, self.tiles, self.size, delta = update
+        self._keyframe = None
+        return delta
+
+    def keyframe(self):
+        """Message with every tile of the current frame (cached per frame)"""
+        if self._keyframe is None and self.tiles and self.size is not None:
+            self._keyframe = self._pack(self.seq, self.size[0], self.size[1], sorted(self.tiles.items()))
+        return self._keyframe
+
+
+class StreamClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.needs_keyframe = True
+
+
+class StreamServer:
+    """Serves the viewer page and the WebSocket stream on one port, in its own thread.
+
+    publish(img_rgb) may be called from any thread; only the newest frame is
+    encoded if encoding falls behind. on_input(message) receives decoded
+    client input dicts ({"type": "key", "keycode": 20, "label": "down"} or
+    {"type": "tap", "x": .., "y": ..}) on the server thread.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, token=None, on_input=None, launcher_mode=lambda: False):
+        self.host = host
+        self.port = port
+        self.token = token if token is not None else secrets.token_urlsafe(8)
+        self.on_input = on_input
+        self.launcher_mode = launcher_mode
+        self.encoder = TileEncoder()
+        self.clients = set()
+        self.bytes_sent = 0
+        self.loop = None
+        self._server = None
+        self._latest = None
+        self._frame_ready = None
+        self._started = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/?token={self.token}"
+
+    def start(self):
+        threading.Thread(target=self._thread, daemon=True).start()
+        self._started.wait(5)
+        if self._server is None:
+            raise OSError(f"Could not start stream server on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._shutdown)
+
+    def publish(self, img_rgb):
+        self._latest = img_rgb
+        if self.loop is not None and self.clients:
+            self.loop.call_soon_threadsafe(self._frame_ready.set)
+
+    def _thread(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._frame_ready = asyncio.Event()
+        try:
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+        except OSError as e:
+            print(f"Stream server error: {e}")
+            self._started.set()
+            return
+        self._started.set()
+        self.loop.create_task(self._broadcast())
+        self.loop.run_forever()
+
+    def _shutdown(self):
+        self._server.close()
+        for client in list(self.clients):
+            client.writer.close()
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+        # Let the cancelled tasks unwind before the loop stops
+        self.loop.call_soon(self.loop.stop)
+
+    async def _broadcast(self):
+        while True:
+            await self._frame_ready.wait()
+            self._frame_ready.clear()
+            frame, self._latest = self._latest, None
+            if frame is None or not self.clients:
+                continue
+            # Encode once (off the event loop); every client gets the same bytes
+            update = await self.loop.run_in_executor(None, self.encoder.encode, frame)
+            delta = self.encoder.apply(update) if update is not None else None
+            for client in list(self.clients):
+                if client.writer.transport.get_write_buffer_size() > MAX_CLIENT_BACKLOG:
+                    client.needs_keyframe = True  # Too far behind: skip deltas, resync later
+                    continue
+                if client.needs_keyframe:
+                    message = self.encoder.keyframe()
+                    client.needs_keyframe = message is None
+                else:
+                    message = delta
+                if message:
+                    self._send_frame(client, 2, message)
+
+    def _send_frame(self, client, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        client.writer.write(header + payload)
+        self.bytes_sent += len(header) + length
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode(errors="replace").split("\r\n")
+        method, target = (lines[0].split(" ") + ["", ""])[:2]
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        path, _, query = target.partition("?")
+        params = dict(part.partition("=")[::2] for part in query.split("&") if part)
+        if params.get("token") != self.token:
+            self._respond(writer, "403 Forbidden", "text/plain", b"Missing or wrong token")
+        elif path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+            await self._websocket(reader, writer, headers)
+            return
+        elif path == "/" and method == "GET":
+            self._respond(writer, "200 OK", "text/html; charset=utf-8", VIEWER_HTML.encode())
+        else:
+            self._respond(writer, "404 Not Found", "text/plain", b"Not found")
+        await writer.drain()
+        writer.close()
+
+    def _respond(self, writer, status, content_type, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nCache-Control: no-store\r\nConnection: close\r\n\r\n".encode()
+                     + body)
+
+    async def _websocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1((headers.get("sec-websocket-key", "") + WS_GUID).encode()).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        client = StreamClient(reader, writer)
+        self.clients.add(client)
+        if self._latest is not None:
+            self._frame_ready.set()
+        else:
+            keyframe = self.encoder.keyframe()
+            if keyframe:
+                self._send_frame(client, 2, keyframe)
+                client.needs_keyframe = False
+        try:
+            while True:
+                opcode, payload = await self._read_message(reader)
+                if opcode == 8:  # Close
+                    break
+                if opcode == 9:  # Ping
+                    self._send_frame(client, 10, payload)
+                elif opcode == 1:
+                    self._handle_input(payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    async def _read_message(self, reader):
+        first, second = await reader.readexactly(2)
+        opcode, length = first & 0x0F, second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+    def _handle_input(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("type") == "key":
+            mapped = y1_helper.map_key(str(message.get("key", "")), self.launcher_mode())
+            if mapped is None:
+                return
+            event = {"type": "key", "keycode": mapped[0], "label": mapped[1]}
+        elif message.get("type") == "tap":
+            event = {"type": "tap", "x": int(message.get("x", 0)), "y": int(message.get("y", 0))}
+        else:
+            return
+        if self.on_input is not None:
+            self.on_input(event)
+
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><title>Y1 Screen</title>
+<style>body{background:#222;color:#ccc;font:13px sans-serif;text-align:center}
+canvas{background:#000;margin-top:12px;image-rendering:pixelated;cursor:crosshair}</style></head>
+<body><canvas id="screen" width="480" height="360" tabindex="0"></canvas>
+<div id="status">Connecting...</div>
+<script>
+const canvas = document.getElementById("screen"), ctx = canvas.getContext("2d");
+const status = document.getElementById("status");
+const ws = new WebSocket((location.protocol === "https:" ? "wss://" : "ws://") + location.host + "/ws" + location.search);
+ws.binaryType = "arraybuffer";
+let frames = 0, bytes = 0;
+ws.onopen = () => { status.textContent = "Connected - click the screen, then use W/A/S/D, Enter, Q, Space"; canvas.focus(); };
+ws.onclose = () => { status.textContent = "Disconnected"; };
+ws.onmessage = async (msg) => {
+  const view = new DataView(msg.data);
+  if (view.getUint8(0) !== 1) return;
+  const width = view.getUint16(5, true), height = view.getUint16(7, true), count = view.getUint16(9, true);
+  if (canvas.width !== width || canvas.height !== height) { canvas.width = width; canvas.height = height; }
+  let offset = 11;
+  const pending = [];
+  for (let i = 0; i < count; i++) {
+    const x = view.getUint16(offset, true), y = view.getUint16(offset + 2, true);
+    const length = view.getUint32(offset + 8, true);
+    const blob = new Blob([new Uint8Array(msg.data, offset + 12, length)], {type: "image/png"});
+    pending.push(createImageBitmap(blob).then((bitmap) => [x, y, bitmap]));
+    offset += 12 + length;
+  }
+  for (const [x, y, bitmap] of await Promise.all(pending)) ctx.drawImage(bitmap, x, y);
+  frames++; bytes += msg.data.byteLength;
+};
+setInterval(() => { if (ws.readyState === 1) status.textContent = `${frames} fps, ${(bytes / 1024).toFixed(0)} KB/s`; frames = 0; bytes = 0; }, 1000);
+const keyNames = {ArrowUp: "Up", ArrowDown: "Down", ArrowLeft: "Left", ArrowRight: "Right", Enter: "Return",
+                  " ": "space", PageUp: "Prior", PageDown: "Next", "/": "slash"};
+canvas.addEventListener("keydown", (e) => {
+  ws.send(JSON.stringify({type: "key", key: keyNames[e.key] || e.key}));
+  e.preventDefault();
+});
+canvas.addEventListener("click", (e) => {
+  const r = canvas.getBoundingClientRect();
+  ws.send(JSON.stringify({type: "tap", x: Math.round((e.clientX - r.left) * canvas.width / r.width),
+                          y: Math.round((e.clientY - r.top) * canvas.height / r.height)}));
+});
+</script></body></html>
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic Y1 screen to browsers (stream server demo)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scene", default="scroll", help="synthetic scene: static, scroll or animation")
+    args = parser.parse_args(argv)
+    import y1_bench
+    from PIL import Image
+    server = StreamServer(args.host, args.port, on_input=lambda event: print("input:", event)).start()
+    print(f"Open {server.url}")
+    index = 0
+    while True:
+        server.publish(Image.fromarray(y1_bench.render_scene(args.scene, index)))
+        index += 1
+        time.sleep(1 / 15)
+
+
+if __name__ == "__main__":
+    main()